@@ -1,150 +1,105 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session, make_response
+import time
+
+# Measure worker cold start from the first import
+_import_started = time.perf_counter()
+
+from flask import (Flask, Response, render_template, request, redirect, url_for, jsonify, flash, session,
+                   make_response, stream_with_context)
 import sqlite3
 import os
+import io
+import logging
+import csv
 import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+
+import archive
+import change_versions
+import forecast
+from conditional import FragmentCache, add_validators, cacheable, is_fresh, make_etag
+from db import DATABASE_PATH, get_db, get_pool, init_app
+from export import EXPORT_DATASETS, EXPORT_FORMATS, MIMETYPES, generate_export, page_end_cursor
+from inventory import (DEFAULT_PRODUCTION_QUANTITY, begin_immediate, bulk_upsert, parse_inventory_csv,
+                       parse_inventory_ndjson, reserve_stock, stock_status)
+from inventory_cache import InventoryCache
+import jobs
+import live
+import notifications
+import production_runs
+from metrics import DEFAULT_SLOW_QUERY_MS, Metrics
+from migrations import is_current, migrate, migration_lock
+from pagination import PaginationError, decode_cursor, parse_limit, parse_time
+from product_matcher import ProductMatcher
+from queues import (MY_REQUEST_STATUS_FILTERS, PAGE_SIZE, PAGE_SIZE_MAX, QUEUE_ROLES, WAREHOUSE_QUEUE_TAGS,
+                    fetch_my_requests, fetch_pending_requests)
+import report_store
+from report_timeseries import REPORT_DAYS, REPORT_DAYS_MAX, DailyFulfillment
+import request_batch
+import search
+from tagging import TagEngine
+import vendor_batch
 
 app = Flask(__name__)
 app.secret_key = 'smart_supply_support_system'
 
-# Database setup
-DATABASE_PATH = 'database/4s_database.db'
+# Request / SQL timings for /metrics; set FOURS_METRICS=0 to turn them off
+app.config['METRICS'] = os.environ.get('FOURS_METRICS', '1') != '0'
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('FOURS_SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS))
+metrics = Metrics(app.config['SLOW_QUERY_MS'])
+if app.config['METRICS']:
+    metrics.init_app(app)
+
+# Database setup (pooled, WAL-mode connections scoped to the app context)
+init_app(app, factory=metrics.connection_factory() if app.config['METRICS'] else None)
+
+# Page size limits for /export_data?limit=
+EXPORT_PAGE_SIZE = 1000
+EXPORT_PAGE_SIZE_MAX = 50000
+
+# Product names for resolving free-text requests without per-word LIKE scans
+product_matcher = ProductMatcher()
+
+# Inventory rows per worker, reloaded only after some worker changed them
+inventory_cache = InventoryCache()
+
+# Rendered dashboard / report sections per change version
+fragment_cache = FragmentCache()
+
+# Today's fulfillment-time histograms per worker, on top of the stored days
+daily_fulfillment = DailyFulfillment()
+
+# Side effects (restocking, notifications) run on a background thread per worker;
+# set FOURS_JOB_WORKER=0 to leave them to `python jobs.py` instead
+app.config['JOB_WORKER'] = os.environ.get('FOURS_JOB_WORKER', '1') != '0'
+job_worker = jobs.JobWorker(get_pool(app))
+
+# Open live queue streams in this worker
+live_slots = live.StreamSlots()
+
+# Auto-tagging rules from the tag_rules table, compiled once per change
+tag_engine = TagEngine()
 
 def init_db():
-    """Initialize the database with required tables"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    # Create Users table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        role TEXT NOT NULL
-    )
-    ''')
-    
-    # Create Requests table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS requests (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        role TEXT NOT NULL,
-        message TEXT NOT NULL,
-        auto_tag TEXT NOT NULL,
-        status TEXT NOT NULL,
-        submitted_time TIMESTAMP NOT NULL,
-        fulfilled_time TIMESTAMP,
-        vendor_name TEXT,
-        solution TEXT,
-        estimated_delivery TEXT,
-        forwarded_to_production INTEGER DEFAULT 0,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
-    ''')
-    
-    # Create Status_Logs table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS status_logs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        request_id INTEGER NOT NULL,
-        status TEXT NOT NULL,
-        timestamp TIMESTAMP NOT NULL,
-        FOREIGN KEY (request_id) REFERENCES requests (id)
-    )
-    ''')
-    
-    # Create Inventory table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS inventory (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        item_name TEXT UNIQUE NOT NULL,
-        quantity INTEGER NOT NULL,
-        status TEXT NOT NULL
-    )
-    ''')
-    
-    # Insert sample inventory items if they don't exist
-    sample_inventory = [
-        ('Product A', 50, 'In Stock'),
-        ('Product B', 25, 'In Stock'),
-        ('Product C', 0, 'Out of Stock'),
-        ('Product D', 10, 'Low Stock')
-    ]
-    
-    for item in sample_inventory:
-        try:
-            cursor.execute('INSERT INTO inventory (item_name, quantity, status) VALUES (?, ?, ?)', item)
-        except sqlite3.IntegrityError:
-            # Item already exists
-            pass
-    
-    # Insert default users if they don't exist
-    default_users = [
-        ('sales', generate_password_hash('sales123', method='pbkdf2:sha256'), 'Sales Executive'),
-        ('warehouse', generate_password_hash('warehouse123', method='pbkdf2:sha256'), 'Warehouse Officer'),
-        ('production', generate_password_hash('production123', method='pbkdf2:sha256'), 'Production Planner'),
-        ('support', generate_password_hash('support123', method='pbkdf2:sha256'), 'Support Agent')
-    ]
-    
-    for user in default_users:
-        try:
-            cursor.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)', user)
-        except sqlite3.IntegrityError:
-            # User already exists
-            pass
-    
-    conn.commit()
-    conn.close()
-
-def get_db_connection():
-    """Get a database connection"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def auto_tag_request(message, role):
-    """Auto-tag a request based on message content and user role"""
-    message = message.lower()
-    
-    # Sales Executive tags
-    if role == 'Sales Executive':
-        if 'urgent' in message or 'immediate' in message:
-            return 'Urgent Delivery'
-        elif 'stock' in message or 'inventory' in message or 'available' in message:
-            return 'Stock Check'
-        else:
-            return 'Sales Request'
-    
-    # Warehouse Officer tags
-    elif role == 'Warehouse Officer':
-        if 'confirm' in message or 'availability' in message:
-            return 'Stock Confirmation'
-        elif 'ship' in message or 'deliver' in message:
-            return 'Shipment'
-        else:
-            return 'Warehouse Request'
-    
-    # Production Planner tags
-    elif role == 'Production Planner':
-        if 'delay' in message:
-            return 'Delay Report'
-        elif 'schedule' in message:
-            return 'Production Schedule'
-        else:
-            return 'Production Request'
-    
-    # Support Agent tags
-    elif role == 'Support Agent':
-        if 'complaint' in message:
-            return 'Customer Complaint'
-        elif 'service' in message:
-            return 'Service Request'
-        else:
-            return 'Support Request'
+    """Initialize the database schema and default data, returning a startup summary"""
+    started = time.perf_counter()
+    conn = get_pool(app).connect()
+    try:
+        # Fast path: nothing to do once every migration (including seeding) is applied
+        applied = []
+        if not is_current(conn):
+            # Only one worker at a time creates, migrates and seeds the database
+            with migration_lock(DATABASE_PATH):
+                applied = migrate(conn)
+    finally:
+        conn.close()
     
-    return 'General Request'
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return {'applied_migrations': applied, 'init_db_ms': round(elapsed_ms, 2)}
+
+@app.before_request
+def start_job_worker():
+    if app.config['JOB_WORKER']:
+        job_worker.ensure_running()
 
 @app.route('/')
 def index():
@@ -165,9 +120,8 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        conn = get_db_connection()
+        conn = get_db()
         user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        conn.close()
         
         if user and check_password_hash(user['password'], password):
             # Store user info in session
@@ -202,56 +156,320 @@ def dashboard(role, user_id):
         flash('Unauthorized access')
         return redirect(url_for('login'))
         
-    conn = get_db_connection()
-    
-    # Get requests relevant to the user's role
-    if role in ['Sales Executive', 'Warehouse Officer', 'Production Planner', 'Support Agent']:
-        # For regular users, show their own requests
-        my_requests = conn.execute(
-            'SELECT * FROM requests WHERE user_id = ? ORDER BY submitted_time DESC', 
-            (user_id,)
-        ).fetchall()
+    if role not in ['Sales Executive', 'Warehouse Officer', 'Production Planner', 'Support Agent']:
+        # Invalid role
+        return redirect(url_for('login'))
+    
+    conn = get_db()
+    
+    # Tab filters, page size and keyset cursors from the query string
+    status_filter = request.args.get('status', 'all')
+    if status_filter not in MY_REQUEST_STATUS_FILTERS:
+        status_filter = 'all'
+    tag_filter = request.args.get('tag') or None
+    queue_tag = request.args.get('queue_tag') or None
+    limit = parse_limit(request.args.get('limit'), PAGE_SIZE, PAGE_SIZE_MAX)
+    fragment = request.args.get('fragment')
+    cursor = request.args.get('cursor')
+    queue_cursor = request.args.get('queue_cursor')
+    
+    # Where the live queue feed picks up; read first so no change can fall in between
+    live_cursor = live.latest_cursor(conn) if role in QUEUE_ROLES else None
+    
+    # Production Planners see the reorder list, kept fresh by the job worker
+    counters = []
+    if role == 'Production Planner':
+        counters.append(change_versions.FORECAST)
+    elif role == 'Warehouse Officer':
+        counters.append(change_versions.notifications_counter(user_id))
+    
+    # Answer revalidations from the change counters before running any query
+    my_counter = change_versions.user_requests_counter(user_id)
+    queue_counter = change_versions.queue_counter(role)
+    versions = change_versions.get_versions(conn, [my_counter, queue_counter, change_versions.INVENTORY] + counters)
+    etag = make_etag('dashboard', role, user_id, sorted(request.args.items(multi=True)),
+                     sorted((name, version) for name, (version, _) in versions.items()))
+    use_etag = cacheable()
+    if use_etag and is_fresh(etag):
+        return add_validators(Response(status=304), etag, change_versions.last_changed(versions))
+    
+    try:
+        # For regular users, show a page of their own requests
+        my_section = None
+        if fragment in (None, 'my_requests'):
+            my_section = _my_requests_section(conn, role, user_id, versions[my_counter][0],
+                                              status_filter, tag_filter, cursor, limit)
         
-        # For Warehouse Officer, also show stock check requests, in-transit items, and stock updates
-        if role == 'Warehouse Officer':
-            pending_requests = conn.execute(
-                'SELECT r.*, u.username FROM requests r JOIN users u ON r.user_id = u.id '
-                'WHERE (r.auto_tag IN ("Stock Check", "Urgent Delivery", "Stock Update") '
-                'AND r.status IN ("Submitted", "In Transit", "Notification")) '
-                'ORDER BY r.submitted_time ASC'
-            ).fetchall()
-        # For Production Planner, show requests forwarded from sales/warehouse
-        elif role == 'Production Planner':
-            pending_requests = conn.execute(
-                'SELECT r.*, u.username FROM requests r JOIN users u ON r.user_id = u.id '
-                'WHERE r.forwarded_to_production = 1 AND r.status = "Forwarded to Production" '
-                'ORDER BY r.submitted_time ASC'
-            ).fetchall()
-        else:
-            pending_requests = []
-            
+        # Warehouse Officers also see stock checks, in-transit items and stock updates;
+        # Production Planners see requests forwarded from sales/warehouse
+        pending_section = None
+        if fragment in (None, 'pending_requests'):
+            pending_section = _pending_requests_section(conn, role, user_id, versions[queue_counter][0],
+                                                        queue_tag, queue_cursor, limit)
+    except PaginationError:
+        flash('Invalid page cursor')
+        return redirect(url_for('dashboard', role=role, user_id=user_id))
+    
+    # Next-page requests from the dashboard script only need the table rows
+    if fragment in ('my_requests', 'pending_requests'):
+        section = my_section if fragment == 'my_requests' else pending_section
+        response = make_response(section['html'])
+        response.headers['X-Next-Page'] = section['next_url'] or ''
+    else:
         # Get inventory status for display
-        inventory = conn.execute('SELECT * FROM inventory ORDER BY item_name').fetchall()
+        inventory_section = _inventory_section(conn, versions[change_versions.INVENTORY][0])
+        reorder_section = None
+        runs_section = None
+        if role == 'Production Planner':
+            reorder_section = _reorder_section(conn, versions[change_versions.FORECAST][0])
+            runs_section = _production_runs_section(conn, versions[queue_counter][0],
+                                                    versions[change_versions.INVENTORY][0])
         
-        # Get notifications count for the navbar
-        notifications_count = 0
+        # Warehouse Officers see their unread stock updates above the queue
+        unread_notifications, notifications_count = [], 0
         if role == 'Warehouse Officer':
-            notifications = conn.execute(
-                'SELECT COUNT(*) as count FROM requests '
-                'WHERE user_id = ? AND auto_tag = "Stock Update" AND status = "Notification"',
-                (user_id,)
-            ).fetchone()
-            if notifications:
-                notifications_count = notifications['count']
+            unread_notifications, notifications_count = notifications.unread(conn, user_id)
+        
+        response = make_response(render_template(
+            'dashboard.html', role=role, user_id=user_id,
+            my_section=my_section, pending_section=pending_section,
+            inventory_section=inventory_section, reorder_section=reorder_section,
+            runs_section=runs_section,
+            notifications=unread_notifications, notifications_count=notifications_count,
+            live_cursor=live_cursor,
+            # Single-threaded workers refuse streams, so their pages go straight to polling
+            live_streams=bool(request.environ.get('wsgi.multithread')),
+            status_filter=status_filter, tag_filter=tag_filter, queue_tag=queue_tag,
+            queue_tags=WAREHOUSE_QUEUE_TAGS
+        ))
+    
+    if use_etag:
+        add_validators(response, etag, change_versions.last_changed(versions))
+    return response
+
+def _my_requests_section(conn, role, user_id, version, status_filter, tag_filter, cursor, limit):
+    """Rendered page of a user's own requests, cached per version of their requests"""
+    key = ('my_requests', version, role, user_id, status_filter, tag_filter, cursor, limit)
+    section = fragment_cache.get(key)
+    if section is None:
+        my_requests, next_cursor = fetch_my_requests(
+            conn, user_id, MY_REQUEST_STATUS_FILTERS.get(status_filter), tag_filter, cursor, limit
+        )
+        # "Load more" links carry the current filters along with the next cursor
+        # (url_for drops parameters that are None)
+        next_url = None
+        if next_cursor:
+            next_url = url_for('dashboard', role=role, user_id=user_id, cursor=next_cursor,
+                               status=status_filter if status_filter != 'all' else None,
+                               tag=tag_filter, limit=limit)
+        section = {
+            'html': render_template('_my_request_rows.html', role=role, user_id=user_id,
+                                    my_requests=my_requests),
+            'count': len(my_requests),
+            'next_url': next_url,
+        }
+        fragment_cache.set(key, section)
+    return section
+
+def _pending_requests_section(conn, role, user_id, version, queue_tag, queue_cursor, limit):
+    """Rendered page of a role's pending queue, cached per version of the queue"""
+    key = ('pending_requests', version, role, user_id, queue_tag, queue_cursor, limit)
+    section = fragment_cache.get(key)
+    if section is None:
+        pending_requests, next_cursor = fetch_pending_requests(
+            conn, role, queue_tag, None, queue_cursor, limit
+        )
+        next_url = None
+        if next_cursor:
+            next_url = url_for('dashboard', role=role, user_id=user_id,
+                               queue_cursor=next_cursor, queue_tag=queue_tag, limit=limit)
+        section = {
+            'html': render_template('_pending_request_rows.html', role=role, user_id=user_id,
+                                    pending_requests=pending_requests),
+            'count': len(pending_requests),
+            'next_url': next_url,
+        }
+        fragment_cache.set(key, section)
+    return section
+
+def _inventory_section(conn, version):
+    """Rendered inventory table rows, cached per inventory version"""
+    key = ('inventory', version)
+    section = fragment_cache.get(key)
+    if section is None:
+        inventory = inventory_cache.by_name(conn)
+        section = {
+            'html': render_template('_inventory_rows.html', inventory=inventory),
+            'count': len(inventory),
+        }
+        fragment_cache.set(key, section)
+    return section
+
+def _reorder_section(conn, version):
+    """The stored reorder list and when it was computed, cached per forecast refresh"""
+    key = ('reorder', version)
+    section = fragment_cache.get(key)
+    if section is None:
+        section = {
+            'rows': forecast.get_reorder_list(conn),
+            'refreshed_at': forecast.refreshed_at(conn),
+            'forecast_days': forecast.FORECAST_DAYS,
+            'lead_time_days': forecast.LEAD_TIME_DAYS,
+        }
+        fragment_cache.set(key, section)
+    return section
+
+def _production_runs_section(conn, queue_version, inventory_version):
+    """The highest-priority production runs, cached per version of the queue and inventory"""
+    key = ('production_runs', queue_version, inventory_version)
+    section = fragment_cache.get(key)
+    if section is None:
+        runs, count = production_runs.pending_runs(conn)
+        section = {'runs': runs, 'count': count}
+        fragment_cache.set(key, section)
+    return section
+
+@app.route('/complete_production_run/<role>/<int:user_id>', methods=['POST'])
+def complete_production_run(role, user_id):
+    """Complete every queued request for a product in one run"""
+    if not session.get('logged_in') or session.get('user_id') != user_id or session.get('role') != role:
+        flash('Unauthorized access')
+        return redirect(url_for('login'))
+    if role != 'Production Planner':
+        flash('Only Production Planners can complete production runs')
+        return redirect(url_for('dashboard', role=role, user_id=user_id))
+    
+    try:
+        product_id = int(request.form['product_id'])
+        through_id = int(request.form['through_id'])
+    except (KeyError, ValueError):
+        flash('Invalid production run.')
+        return redirect(url_for('dashboard', role=role, user_id=user_id))
+    
+    conn = get_db()
+    begin_immediate(conn)
+    try:
+        run = production_runs.complete_run(conn, product_id, through_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    job_worker.notify()
+    
+    if run:
+        flash(f"Production run complete: {run['quantity']} x {run['item_name']} "
+              f"for {len(run['request_ids'])} requests.")
     else:
-        # Invalid role
-        conn.close()
+        flash('That production run has no queued requests left.')
+    return redirect(url_for('dashboard', role=role, user_id=user_id))
+
+@app.route('/refresh_forecast/<role>/<int:user_id>', methods=['POST'])
+def refresh_forecast(role, user_id):
+    """Queue a forecast refresh now instead of waiting for the stored one to go stale"""
+    if not session.get('logged_in') or session.get('user_id') != user_id or session.get('role') != role:
+        flash('Unauthorized access')
+        return redirect(url_for('login'))
+    if role != 'Production Planner':
+        flash('Only Production Planners can refresh the forecast')
+        return redirect(url_for('dashboard', role=role, user_id=user_id))
+    
+    if jobs.schedule_forecast_refresh(get_db(), force=True):
+        job_worker.notify()
+        flash('Forecast refresh queued; the reorder list updates in a moment.')
+    else:
+        flash('A forecast refresh is already queued.')
+    return redirect(url_for('dashboard', role=role, user_id=user_id))
+
+@app.route('/acknowledge_notification/<int:notification_id>/<role>/<int:user_id>', methods=['POST'])
+def acknowledge_notification(notification_id, role, user_id):
+    """Mark one of the user's notifications read"""
+    if not session.get('logged_in') or session.get('user_id') != user_id or session.get('role') != role:
+        flash('Unauthorized access')
         return redirect(url_for('login'))
     
-    conn.close()
-    return render_template('dashboard.html', role=role, user_id=user_id, 
-                          my_requests=my_requests, pending_requests=pending_requests,
-                          inventory=inventory, notifications_count=notifications_count)
+    conn = get_db()
+    if notifications.acknowledge(conn, notification_id, user_id):
+        conn.commit()
+    else:
+        conn.rollback()
+        flash('Notification not found.')
+    return redirect(url_for('dashboard', role=role, user_id=user_id))
+
+@app.route('/live/<role>/<int:user_id>')
+def live_queue(role, user_id):
+    """Changes to a role's pending queue, as an event stream or one JSON poll"""
+    if not session.get('logged_in') or session.get('user_id') != user_id or session.get('role') != role:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if role not in QUEUE_ROLES:
+        return jsonify({'error': 'Only Warehouse Officers and Production Planners have a queue'}), 404
+    
+    queue_tag = request.args.get('queue_tag') or None
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.args['after'])
+    except (KeyError, ValueError):
+        # Not get_db(): a stream keeps the request context, and g.db with it, until it ends
+        after = live.pooled_latest_cursor(get_pool())
+    
+    def render_row(row):
+        return render_template('_pending_request_rows.html', role=role, user_id=user_id,
+                               pending_requests=[row])
+    
+    if 'text/event-stream' not in request.headers.get('Accept', ''):
+        return jsonify(live.poll(get_pool(), role, after, queue_tag, render_row))
+    
+    # A stream ties up a thread, so single-threaded workers and full workers send clients to polling
+    if not request.environ.get('wsgi.multithread') or not live_slots.acquire():
+        return Response(status=503, headers={'Retry-After': str(live.STREAM_SECONDS)})
+    
+    response = Response(stream_with_context(live.stream(get_pool(), role, after, queue_tag, render_row)),
+                        mimetype='text/event-stream')
+    response.call_on_close(live_slots.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/search/<role>/<int:user_id>')
+def search_requests(role, user_id):
+    """Ranked full-text search over the requests a user can see, as JSON or table rows"""
+    if not session.get('logged_in') or session.get('user_id') != user_id or session.get('role') != role:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    query = request.args.get('q', '')
+    limit = parse_limit(request.args.get('limit'), PAGE_SIZE, PAGE_SIZE_MAX)
+    try:
+        results, next_cursor = search.search(get_db(), role, user_id, query,
+                                             request.args.get('cursor'), limit)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    next_url = None
+    if next_cursor:
+        next_url = url_for('search_requests', role=role, user_id=user_id, q=query,
+                           cursor=next_cursor, limit=limit)
+    
+    # The dashboard's search box renders results with the My Requests row template
+    if request.args.get('fragment'):
+        response = make_response(render_template('_my_request_rows.html', role=role, user_id=user_id,
+                                                 my_requests=results))
+        response.headers['X-Next-Page'] = next_url or ''
+        return response
+    
+    return jsonify({
+        'results': [{
+            'id': row['id'],
+            'username': row['username'],
+            'role': row['role'],
+            'auto_tag': row['auto_tag'],
+            'status': row['status'],
+            'message': row['message'],
+            'solution': row['solution'],
+            'vendor_name': row['vendor_name'],
+            'submitted_time': row['submitted_time'],
+            'fulfilled_time': row['fulfilled_time'],
+            'score': row['score'],
+        } for row in results],
+        'next_cursor': next_cursor,
+    })
 
 @app.route('/submit_request/<role>/<int:user_id>', methods=['GET', 'POST'])
 def submit_request(role, user_id):
@@ -267,11 +485,17 @@ def submit_request(role, user_id):
         status = 'Submitted'
         submitted_time = datetime.datetime.now()
         
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
         
+        # Take the write lock up front so stock checks and updates cannot interleave
+        begin_immediate(conn)
+        
         estimated_delivery = None
         forwarded_to_production = 0
+        new_item_id = None
+        product_id = None
+        quantity = None
         
         # For Sales Executive requests, check inventory automatically
         if role == 'Sales Executive':
@@ -295,7 +519,7 @@ def submit_request(role, user_id):
                             'INSERT INTO inventory (item_name, quantity, status) VALUES (?, ?, ?)',
                             (new_product_name, 0, 'Out of Stock')
                         )
-                        conn.commit()
+                        new_item_id = cursor.lastrowid
                         # Forward to production automatically
                         status = 'Forwarded to Production'
                         forwarded_to_production = 1
@@ -307,50 +531,29 @@ def submit_request(role, user_id):
             
             # If no product selected or found, try to extract from message
             if not product_name or product_name == '':
-                for word in message.split():
-                    # Check if this word matches any product in inventory
-                    product = conn.execute('SELECT * FROM inventory WHERE item_name LIKE ?', 
-                                          ('%' + word + '%',)).fetchone()
-                    if product:
-                        product_name = product['item_name']
-                        break
+                # Match the first word that appears in any product name
+                product_matcher.refresh(conn)
+                product = product_matcher.match(message)
+                if product:
+                    product_name = product[1]
             
             # Add product name and quantity to message if it was selected from dropdown
             if product_name and product_name not in message and product_name != 'new_product':
                 message += f"\n\nRequested product: {product_name}, Quantity: {quantity}"
             
             if product_name and product_name != 'new_product' and product_name != '':
-                # Check if product is in stock with sufficient quantity
-                inventory_item = conn.execute('SELECT * FROM inventory WHERE item_name = ?', 
-                                            (product_name,)).fetchone()
+                # Reserve the stock if the product is in stock with sufficient quantity
+                reservation = reserve_stock(conn, product_name, quantity)
+                product_id = reservation.item_id
                 
-                if inventory_item and inventory_item['status'] == 'In Stock' and inventory_item['quantity'] >= quantity:
+                if reservation.reserved:
                     # Product is available in sufficient quantity
                     status = 'In Transit'
                     # Set estimated delivery to 4 days from now
                     delivery_date = datetime.datetime.now() + datetime.timedelta(days=4)
                     estimated_delivery = f"Will arrive by {delivery_date.strftime('%Y-%m-%d')}"
-                    
-                    # Update inventory quantity
-                    cursor.execute(
-                        'UPDATE inventory SET quantity = quantity - ? WHERE item_name = ?',
-                        (quantity, product_name)
-                    )
-                    
-                    # Check if stock is now low
-                    remaining = inventory_item['quantity'] - quantity
-                    if remaining <= 10 and remaining > 0:
-                        cursor.execute(
-                            'UPDATE inventory SET status = ? WHERE item_name = ?',
-                            ('Low Stock', product_name)
-                        )
-                    elif remaining <= 0:
-                        cursor.execute(
-                            'UPDATE inventory SET status = ?, quantity = 0 WHERE item_name = ?',
-                            ('Out of Stock', product_name)
-                        )
                         
-                elif inventory_item:
+                elif reservation.item_id is not None:
                     # Product exists but not enough in stock, forward to production
                     status = 'Forwarded to Production'
                     forwarded_to_production = 1
@@ -359,10 +562,10 @@ def submit_request(role, user_id):
         # Insert the request with the selected tag and inventory status
         cursor.execute('''
             INSERT INTO requests (user_id, role, message, auto_tag, status, submitted_time, 
-                                estimated_delivery, forwarded_to_production)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                                estimated_delivery, forwarded_to_production, product_id, quantity)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (user_id, role, message, selected_tag, status, submitted_time, 
-             estimated_delivery, forwarded_to_production))
+             estimated_delivery, forwarded_to_production, product_id, quantity))
         
         request_id = cursor.lastrowid
         
@@ -372,19 +575,72 @@ def submit_request(role, user_id):
             VALUES (?, ?, ?)
         ''', (request_id, status, submitted_time))
         
+        # Keep the report aggregates in step with the new request
+        report_store.record_submission(conn, selected_tag)
+        
         conn.commit()
-        conn.close()
+        
+        if new_item_id:
+            product_matcher.add(new_item_id, product_name)
         
         flash('Request submitted successfully!')
         return redirect(url_for('dashboard', role=role, user_id=user_id))
     
     # For GET requests, fetch inventory items to display in the form
-    conn = get_db_connection()
-    inventory_items = conn.execute('SELECT * FROM inventory').fetchall()
-    conn.close()
+    conn = get_db()
+    inventory_items = inventory_cache.by_id(conn)
     
     return render_template('submit_request.html', role=role, user_id=user_id, inventory_items=inventory_items)
 
+@app.route('/submit_request_batch/<role>/<int:user_id>', methods=['POST'])
+def submit_request_batch(role, user_id):
+    """Submit many requests in one transaction (JSON API for integrations)"""
+    if not session.get('logged_in') or session.get('user_id') != user_id or session.get('role') != role:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True)
+    items = data.get('requests') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Expected a JSON array of requests or {"requests": [...]}'}), 400
+    if len(items) > request_batch.MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {request_batch.MAX_BATCH_SIZE} requests per batch'}), 400
+    
+    # Retried batches carrying the same key get the original response back
+    key = request.headers.get('Idempotency-Key')
+    if not key and isinstance(data, dict):
+        key = data.get('idempotency_key')
+    request_hash = request_batch.batch_hash(items)
+    
+    conn = get_db()
+    begin_immediate(conn)
+    if key:
+        try:
+            replay = request_batch.find_replay(conn, user_id, key, request_hash)
+        except request_batch.IdempotencyConflict as e:
+            conn.rollback()
+            return jsonify({'error': str(e)}), 422
+        if replay is not None:
+            conn.rollback()
+            response = jsonify(replay)
+            response.headers['Idempotent-Replay'] = 'true'
+            return response
+    
+    results, created_items = request_batch.submit_batch(conn, user_id, role, items,
+                                                       product_matcher, tag_engine)
+    body = {
+        'created': sum(1 for r in results if r['result'] == 'created'),
+        'errors': sum(1 for r in results if r['result'] == 'error'),
+        'results': results,
+    }
+    if key:
+        request_batch.save_response(conn, user_id, key, request_hash, body)
+    conn.commit()
+    
+    for item_id, item_name in created_items:
+        product_matcher.add(item_id, item_name)
+    
+    return jsonify(body)
+
 @app.route('/update_request/<int:request_id>', methods=['POST'])
 def update_request(request_id):
     new_status = request.form['status']
@@ -394,15 +650,17 @@ def update_request(request_id):
     current_user_role = request.args.get('role')
     current_user_id = request.args.get('user_id')
     
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor()
     
+    # Take the write lock before reading so the transition is based on current data
+    begin_immediate(conn)
+    
     # Get current request details
     request_details = conn.execute('SELECT * FROM requests WHERE id = ?', (request_id,)).fetchone()
     
     if not request_details:
         flash('Request not found.')
-        conn.close()
         return redirect(url_for('dashboard', role=current_user_role, user_id=current_user_id))
     
     estimated_delivery = request_details['estimated_delivery']
@@ -410,6 +668,7 @@ def update_request(request_id):
     
     # Handle status updates with specific logic
     if new_status == 'Fulfilled':
+        report_store.record_fulfillment(conn, request_id, timestamp)
         cursor.execute('''
             UPDATE requests SET status = ?, fulfilled_time = ?
             WHERE id = ?
@@ -437,44 +696,15 @@ def update_request(request_id):
             WHERE id = ?
         ''', (f"Ready for shipment on {(datetime.datetime.now() + datetime.timedelta(days=1)).strftime('%Y-%m-%d')}", request_id))
         
-        # Extract product name and quantity from message
-        product_name = None
-        quantity = 10  # Default production quantity
-        
-        # First try to find "Requested product:" in the message
-        message_lines = request_details['message'].split('\n')
-        for line in message_lines:
-            if "Requested product:" in line:
-                parts = line.split(',')
-                if len(parts) > 0:
-                    product_part = parts[0].strip()
-                    product_name = product_part.replace("Requested product:", "").strip()
-                
-                # Try to extract quantity
-                if len(parts) > 1 and "Quantity:" in parts[1]:
-                    try:
-                        qty_str = parts[1].replace("Quantity:", "").strip()
-                        quantity = int(qty_str)
-                    except ValueError:
-                        quantity = 10
-                break
-        
-        # If not found in formatted message, try word matching
-        if not product_name:
-            for word in request_details['message'].split():
-                # Check if this word matches any product in inventory
-                product = conn.execute('SELECT * FROM inventory WHERE item_name LIKE ?', 
-                                      ('%' + word + '%',)).fetchone()
-                if product:
-                    product_name = product['item_name']
-                    break
-                
-        if product_name:
-            # Update inventory to show item is now in stock with produced quantity
-            cursor.execute('''
-                UPDATE inventory SET quantity = quantity + ?, status = 'In Stock'
-                WHERE item_name = ?
-            ''', (quantity, product_name))
+        if request_details['product_id'] is not None:
+            # Restock the produced quantity and notify the warehouse in the background
+            payload = {
+                'request_id': request_id,
+                'product_id': request_details['product_id'],
+                'quantity': request_details['quantity'] or DEFAULT_PRODUCTION_QUANTITY,
+            }
+            jobs.enqueue(conn, 'restock', payload)
+            jobs.enqueue(conn, 'notify_stock_update', payload)
     else:
         cursor.execute('''
             UPDATE requests SET status = ?
@@ -488,6 +718,7 @@ def update_request(request_id):
     ''', (request_id, new_status, timestamp))
     
     conn.commit()
+    job_worker.notify()
     
     # Get the role of the user who is updating the request
     current_user_role = request.args.get('role')
@@ -503,8 +734,6 @@ def update_request(request_id):
             current_user_role = current_user_role or 'Warehouse Officer'
             current_user_id = current_user_id or '1'
     
-    conn.close()
-    
     flash('Request updated successfully!')
     return redirect(url_for('dashboard', role=current_user_role, user_id=current_user_id))
 
@@ -513,12 +742,11 @@ def vendor_login():
     if request.method == 'POST':
         request_id = request.form['request_id']
         
-        conn = get_db_connection()
+        conn = get_db()
         request_details = conn.execute(
-            'SELECT * FROM requests WHERE id = ? AND auto_tag IN ("Customer Complaint", "Service Request", "Support Request")',
+            "SELECT * FROM requests WHERE id = ? AND auto_tag IN ('Customer Complaint', 'Service Request', 'Support Request')",
             (request_id,)
         ).fetchone()
-        conn.close()
         
         if request_details:
             return redirect(url_for('vendor_update', request_id=request_id))
@@ -529,9 +757,8 @@ def vendor_login():
 
 @app.route('/vendor_update/<int:request_id>', methods=['GET'])
 def vendor_update(request_id):
-    conn = get_db_connection()
+    conn = get_db()
     request_details = conn.execute('SELECT * FROM requests WHERE id = ?', (request_id,)).fetchone()
-    conn.close()
     
     if not request_details:
         flash('Request not found.')
@@ -545,9 +772,12 @@ def vendor_update_submit(request_id):
     solution = request.form['solution']
     timestamp = datetime.datetime.now()
     
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor()
     
+    begin_immediate(conn)
+    report_store.record_fulfillment(conn, request_id, timestamp)
+    
     # Update the request with vendor information and mark as fulfilled
     cursor.execute('''
         UPDATE requests 
@@ -565,11 +795,66 @@ def vendor_update_submit(request_id):
     ''', (request_id, 'Fulfilled by Vendor: ' + vendor_name, timestamp))
     
     conn.commit()
-    conn.close()
     
     flash('Support request updated successfully!')
     return redirect(url_for('vendor_login'))
 
+@app.route('/vendor_batch', methods=['GET', 'POST'])
+def vendor_batch_update():
+    """Open support requests a page at a time, resolved many per submission"""
+    results = None
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            vendor_name = data.get('vendor_name')
+            resolutions = data.get('resolutions')
+        else:
+            # The portal form sends one solution field per listed ticket; blank ones are skipped
+            vendor_name = request.form.get('vendor_name')
+            resolutions = [{'id': request_id, 'solution': request.form.get(f'solution_{request_id}')}
+                           for request_id in request.form.getlist('request_id')
+                           if (request.form.get(f'solution_{request_id}') or '').strip()]
+
+        if not isinstance(vendor_name, str) or not vendor_name.strip():
+            error = 'vendor_name is required'
+        elif not isinstance(resolutions, list) or not resolutions:
+            error = 'Expected at least one resolution'
+        elif len(resolutions) > vendor_batch.MAX_BATCH_SIZE:
+            error = f'At most {vendor_batch.MAX_BATCH_SIZE} resolutions per batch'
+        else:
+            error = None
+        if error:
+            if data is not None:
+                return jsonify({'error': error}), 400
+            flash(error)
+            return redirect(url_for('vendor_batch_update'))
+
+        conn = get_db()
+        begin_immediate(conn)
+        try:
+            results, _ = vendor_batch.resolve_batch(conn, vendor_name.strip(), resolutions)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        resolved = sum(1 for r in results if r['result'] == 'resolved')
+        if data is not None:
+            return jsonify({'resolved': resolved, 'errors': len(results) - resolved, 'results': results})
+        flash(f'{resolved} of {len(results)} support requests resolved.')
+
+    limit = parse_limit(request.args.get('limit'), PAGE_SIZE, PAGE_SIZE_MAX)
+    cursor = request.args.get('cursor') or None
+    try:
+        tickets, next_cursor = vendor_batch.fetch_open_support_requests(get_db(), cursor, limit)
+    except PaginationError:
+        flash('Invalid page cursor')
+        return redirect(url_for('vendor_batch_update'))
+
+    next_url = url_for('vendor_batch_update', cursor=next_cursor, limit=limit) if next_cursor else None
+    return render_template('vendor_batch.html', tickets=tickets, next_url=next_url,
+                           results=results, vendor_name=request.form.get('vendor_name', ''))
+
 @app.route('/add_inventory/<role>/<int:user_id>', methods=['GET', 'POST'])
 def add_inventory(role, user_id):
     if role not in ['Warehouse Officer', 'Production Planner']:
@@ -581,7 +866,7 @@ def add_inventory(role, user_id):
         quantity = int(request.form['quantity'])
         status = request.form['status']
         
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
         
         try:
@@ -590,18 +875,16 @@ def add_inventory(role, user_id):
                 (item_name, quantity, status)
             )
             conn.commit()
+            product_matcher.add(cursor.lastrowid, item_name)
             flash(f'Inventory item "{item_name}" added successfully!')
         except sqlite3.IntegrityError:
             flash(f'Error: Product "{item_name}" already exists in inventory.')
-        finally:
-            conn.close()
         
         return redirect(url_for('add_inventory', role=role, user_id=user_id))
     
     # GET request - show inventory form and current inventory
-    conn = get_db_connection()
-    inventory = conn.execute('SELECT * FROM inventory ORDER BY item_name').fetchall()
-    conn.close()
+    conn = get_db()
+    inventory = inventory_cache.by_name(conn)
     
     return render_template('add_inventory.html', role=role, user_id=user_id, inventory=inventory)
 
@@ -616,7 +899,7 @@ def update_inventory(item_id):
     
     quantity = int(request.form['quantity'])
     
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor()
     
     # Get current item details
@@ -624,13 +907,7 @@ def update_inventory(item_id):
     
     if item:
         # Update quantity and determine status
-        status = item['status']
-        if quantity > 10:
-            status = 'In Stock'
-        elif quantity > 0:
-            status = 'Low Stock'
-        else:
-            status = 'Out of Stock'
+        status = stock_status(quantity)
         
         cursor.execute(
             'UPDATE inventory SET quantity = ?, status = ? WHERE id = ?',
@@ -641,111 +918,185 @@ def update_inventory(item_id):
     else:
         flash('Error: Inventory item not found.')
     
-    conn.close()
     return redirect(url_for('add_inventory', role=role, user_id=user_id))
 
+@app.route('/bulk_inventory/<role>/<int:user_id>', methods=['POST'])
+def bulk_inventory(role, user_id):
+    """Set quantities for many inventory items (and add new ones) in one transaction"""
+    # CSV files uploaded from the Manage Inventory page get a flash message instead of JSON
+    upload = request.files.get('file')
+    
+    if not session.get('logged_in') or session.get('user_id') != user_id or session.get('role') != role:
+        if upload:
+            flash('Please log in to access this page')
+            return redirect(url_for('login'))
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if role not in ['Warehouse Officer', 'Production Planner']:
+        if upload:
+            flash('Access denied. Only Warehouse Officers and Production Planners can manage inventory.')
+            return redirect(url_for('dashboard', role=role, user_id=user_id))
+        return jsonify({'error': 'Only Warehouse Officers and Production Planners can manage inventory'}), 403
+    
+    # Pick a parser; CSV and NDJSON bodies are read as a stream, row by row
+    if upload:
+        rows = parse_inventory_csv(io.TextIOWrapper(upload.stream, encoding='utf-8', newline=''))
+    elif request.mimetype == 'text/csv':
+        rows = parse_inventory_csv(io.TextIOWrapper(request.stream, encoding='utf-8', newline=''))
+    elif request.mimetype == 'application/x-ndjson':
+        rows = parse_inventory_ndjson(io.TextIOWrapper(request.stream, encoding='utf-8'))
+    elif request.mimetype == 'application/json':
+        data = request.get_json(silent=True)
+        rows = data.get('items') if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            return jsonify({'error': 'Expected a JSON array of items or {"items": [...]}'}), 400
+    else:
+        return jsonify({'error': 'Send JSON, NDJSON or CSV (item_name, quantity)'}), 415
+    
+    conn = get_db()
+    begin_immediate(conn)
+    try:
+        results = bulk_upsert(conn, rows)
+    except (UnicodeDecodeError, csv.Error) as e:
+        conn.rollback()
+        if upload:
+            flash(f'Error reading inventory file: {e}')
+            return redirect(url_for('add_inventory', role=role, user_id=user_id))
+        return jsonify({'error': f'Could not parse request body: {e}'}), 400
+    conn.commit()
+    
+    # Make newly created items matchable in request messages
+    product_matcher.refresh(conn)
+    
+    summary = {result: sum(1 for r in results if r['result'] == result)
+               for result in ('created', 'updated', 'error')}
+    if upload:
+        flash(f"Inventory updated: {summary['created']} added, {summary['updated']} updated, "
+              f"{summary['error']} errors.")
+        return redirect(url_for('add_inventory', role=role, user_id=user_id))
+    
+    return jsonify({'created': summary['created'], 'updated': summary['updated'],
+                    'errors': summary['error'], 'results': results})
+
 @app.route('/reports')
 def reports():
-    conn = get_db_connection()
-    
-    # Get request counts by type
-    request_types = conn.execute('''
-        SELECT auto_tag, COUNT(*) as count
-        FROM requests
-        GROUP BY auto_tag
-        ORDER BY count DESC
-    ''').fetchall()
-    
-    # Get average fulfillment time
-    avg_fulfillment = conn.execute('''
-        SELECT auto_tag, 
-               AVG(JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time)) * 24 as avg_hours
-        FROM requests
-        WHERE fulfilled_time IS NOT NULL
-        GROUP BY auto_tag
-    ''').fetchall()
-    
-    # Get SLA breaches (requests taking more than 2 days)
-    sla_breaches = conn.execute('''
-        SELECT id, role, auto_tag, message, 
-               JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time) as days
-        FROM requests
-        WHERE fulfilled_time IS NOT NULL
-          AND (JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time)) > 2
-        ORDER BY days DESC
-    ''').fetchall()
-    
-    conn.close()
-    
-    return render_template('reports.html', 
-                          request_types=request_types,
-                          avg_fulfillment=avg_fulfillment,
-                          sla_breaches=sla_breaches)
+    conn = get_db()
+    # ?archive=1 adds archived requests to the figures, ?days= sets the time-series window
+    include_archive = request.args.get('archive') == '1'
+    days = parse_limit(request.args.get('days'), REPORT_DAYS, REPORT_DAYS_MAX)
+    # The daily buckets also move at midnight
+    today = datetime.date.today()
+    
+    # Answer revalidations from the report store's and the forecasts' change counters
+    versions = change_versions.get_versions(conn, [change_versions.REPORTS, change_versions.FORECAST])
+    version = (versions[change_versions.REPORTS][0], versions[change_versions.FORECAST][0])
+    etag = make_etag('reports', version, include_archive, days, today)
+    use_etag = cacheable()
+    if use_etag and is_fresh(etag):
+        return add_validators(Response(status=304), etag, change_versions.last_changed(versions))
+    
+    # Pages rendered with flash messages are one-offs, everything else is reused per version
+    html = fragment_cache.get(('reports', version, include_archive, days, today)) if use_etag else None
+    if html is None:
+        # Read the incrementally maintained aggregates instead of scanning requests
+        with archive.attached(conn, include_archive) as archived:
+            source = archive if archived else report_store
+            request_types = source.get_request_types(conn)
+            avg_fulfillment = source.get_avg_fulfillment(conn)
+            sla_breaches = source.get_sla_breaches(conn)
+        # Stored finished days plus this worker's running histograms for today
+        timeseries = daily_fulfillment.report(conn, days)
+        reorder = _reorder_section(conn, versions[change_versions.FORECAST][0])
+        
+        html = render_template('reports.html', 
+                               request_types=request_types,
+                               avg_fulfillment=avg_fulfillment,
+                               sla_breaches=sla_breaches,
+                               timeseries=timeseries,
+                               reorder=reorder,
+                               days=days,
+                               include_archive=include_archive)
+        if use_etag:
+            fragment_cache.set(('reports', version, include_archive, days, today), html)
+    
+    response = make_response(html)
+    if use_etag:
+        add_validators(response, etag, change_versions.last_changed(versions))
+    return response
 
 @app.route('/export_data')
 def export_data():
-    conn = get_db_connection()
-    
-    # Get all requests with user information
-    all_requests = conn.execute('''
-        SELECT r.id, u.username, r.role, r.message, r.auto_tag, r.status,
-               r.submitted_time, r.fulfilled_time, r.estimated_delivery,
-               r.vendor_name, r.solution, r.forwarded_to_production,
-               CASE 
-                   WHEN r.fulfilled_time IS NOT NULL THEN 
-                       ROUND((JULIANDAY(r.fulfilled_time) - JULIANDAY(r.submitted_time)) * 24, 2)
-                   ELSE NULL
-               END as hours_to_fulfill
-        FROM requests r
-        JOIN users u ON r.user_id = u.id
-        ORDER BY r.submitted_time DESC
-    ''').fetchall()
-    
-    # Get inventory data
-    inventory = conn.execute('SELECT * FROM inventory ORDER BY item_name').fetchall()
-    
-    conn.close()
-    
-    # Convert requests to list of dicts for JSON export
-    requests_list = []
-    for r in all_requests:
-        requests_list.append({
-            'id': r['id'],
-            'username': r['username'],
-            'role': r['role'],
-            'message': r['message'],
-            'auto_tag': r['auto_tag'],
-            'status': r['status'],
-            'submitted_time': r['submitted_time'],
-            'fulfilled_time': r['fulfilled_time'],
-            'estimated_delivery': r['estimated_delivery'],
-            'vendor_name': r['vendor_name'],
-            'solution': r['solution'],
-            'forwarded_to_production': r['forwarded_to_production'],
-            'hours_to_fulfill': r['hours_to_fulfill']
-        })
-    
-    # Convert inventory to list of dicts
-    inventory_list = []
-    for item in inventory:
-        inventory_list.append({
-            'id': item['id'],
-            'item_name': item['item_name'],
-            'quantity': item['quantity'],
-            'status': item['status']
-        })
-    
-    # Return combined data
-    return jsonify({
-        'requests': requests_list,
-        'inventory': inventory_list
-    })
+    # Export format and dataset (JSON always contains both requests and inventory)
+    export_format = request.args.get('format', 'json')
+    dataset = request.args.get('dataset', 'requests')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown format: {export_format}'}), 400
+    if dataset not in EXPORT_DATASETS:
+        return jsonify({'error': f'Unknown dataset: {dataset}'}), 400
+    
+    # Optional time window, keyset cursor and page size for incremental pulls
+    try:
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+        cursor = request.args.get('cursor')
+        if cursor:
+            decode_cursor(cursor)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    limit = None
+    if request.args.get('limit'):
+        limit = parse_limit(request.args.get('limit'), EXPORT_PAGE_SIZE, EXPORT_PAGE_SIZE_MAX)
+    descending = request.args.get('order', 'desc') != 'asc'
+    
+    # Exports only change when requests or inventory do
+    versions = change_versions.get_versions(get_db(), [change_versions.REQUESTS, change_versions.INVENTORY])
+    etag = make_etag('export', sorted(request.args.items(multi=True)),
+                     sorted((name, version) for name, (version, _) in versions.items()))
+    if is_fresh(etag):
+        return add_validators(Response(status=304), etag, change_versions.last_changed(versions))
+    
+    # A CSV page cannot end with its next_cursor, so it goes in a header
+    include_archive = request.args.get('archive') == '1'
+    next_cursor = None
+    paged_csv = export_format == 'csv' and dataset == 'requests' and limit
+    if paged_csv:
+        next_cursor = page_end_cursor(get_db(), since, until, cursor, descending, limit, include_archive)
+    
+    body = generate_export(get_pool(), export_format, dataset, since, until,
+                           cursor, descending, limit, inventory_cache,
+                           include_archive=include_archive, through=next_cursor)
+    response = Response(body, mimetype=MIMETYPES[export_format])
+    if export_format == 'csv':
+        response.headers['Content-Disposition'] = f'attachment; filename={dataset}.csv'
+    if paged_csv:
+        response.headers['X-Next-Cursor'] = next_cursor or ''
+    return add_validators(response, etag, change_versions.last_changed(versions))
+
+@app.route('/cache_stats')
+def cache_stats():
+    """Hit/miss counts of this worker's caches and its open live streams"""
+    return jsonify({'pid': os.getpid(), 'inventory': inventory_cache.stats(),
+                    'fragments': fragment_cache.stats(), 'live_streams': live_slots.stats()})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Request and SQL statistics of this worker in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # Ensure database directory exists
 os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
 
-# Initialize the database
-init_db()
+# Initialize the database and report how long this worker took to start
+startup = init_db()
+startup['cold_start_ms'] = round((time.perf_counter() - _import_started) * 1000, 2)
+app.config['STARTUP_TIMINGS'] = startup
+# Flask only sets a level in debug mode; without one the startup line would be dropped
+if not app.logger.level:
+    app.logger.setLevel(logging.INFO)
+app.logger.info('[4S pid %d] started in %s ms (init_db %s ms, migrations applied: %s)',
+                os.getpid(), startup['cold_start_ms'], startup['init_db_ms'],
+                startup['applied_migrations'] or 'none')
 
 if __name__ == '__main__':
     # Use port 5001 instead of default 5000 to avoid conflict with AirPlay
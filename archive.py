@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Archival of old fulfilled requests.
+
+Requests fulfilled longer ago than the retention period are moved, with
+their status_logs, to a separate archive database that is ATTACHed as
+`archive`. Everything the app queries by default (dashboards, queues,
+reports, exports) then only covers live data; /reports and /export_data
+can opt into live + archive with ?archive=1, and the archive file is a
+plain SQLite database that can be queried directly.
+
+SQLite in WAL mode commits attached databases one file at a time, so a
+batch is never moved in one transaction. Instead each batch of at most
+ARCHIVE_BATCH_SIZE requests goes through three short transactions:
+
+1. copy: the rows are copied into the archive and the batch is recorded;
+   the live database is only read;
+2. purge: the live rows are deleted (and taken out of the report store),
+   but only those still identical to their archived copy;
+3. settle: archived copies of rows that were kept are dropped, the
+   batch's report figures are added to the archive's aggregates and the
+   batch is marked settled.
+
+A crash at any point leaves an unsettled batch whose rows are in the live
+database, the archive, or both - never neither. The next run purges and
+settles unsettled batches before starting new ones, and readers of the
+union count an unsettled batch's archived rows only once the live copy is
+gone.
+
+    python archive.py                        # archive with the default retention
+    python archive.py --older-than-days 90   # keep 90 days of fulfilled requests live
+    python archive.py --status               # archive contents and unsettled batches
+"""
+
+import argparse
+import contextlib
+import datetime
+import os
+import sys
+import time
+
+import report_store
+from db import DATABASE_PATH, create_pool
+from inventory import begin_immediate
+from migrations import migrate
+
+ARCHIVE_PATH = os.environ.get('FOURS_ARCHIVE_PATH',
+                              os.path.splitext(DATABASE_PATH)[0] + '_archive.db')
+
+# Fulfilled requests older than this (by fulfilled_time) are archived
+DEFAULT_RETENTION_DAYS = 180
+
+# Requests moved per batch, and the pause between batches that lets other writers in
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_BATCH_PAUSE = 0.05      # seconds
+
+_UNSETTLED = 'SELECT id FROM archive.archive_batches WHERE settled_at IS NULL'
+
+
+def _live_copy_gone(alias):
+    return f'NOT EXISTS (SELECT 1 FROM main.requests m WHERE m.id = {alias}.id)'
+
+
+def archived_rows(alias='a'):
+    """SQL condition on archive.requests rows that belong to the live + archive union
+
+    Rows of settled batches always do; rows of an unsettled batch only once
+    their live copy has been deleted.
+    """
+    return f'({alias}.batch_id NOT IN ({_UNSETTLED}) OR {_live_copy_gone(alias)})'
+
+
+def pending_rows(alias='a'):
+    """SQL condition on archive.requests rows in the union but not yet in the archive's aggregates"""
+    return f'({alias}.batch_id IN ({_UNSETTLED}) AND {_live_copy_gone(alias)})'
+
+
+def is_attached(conn):
+    return any(row[1] == 'archive' for row in conn.execute('PRAGMA database_list'))
+
+
+def attach(conn, path=None, create=False):
+    """ATTACH the archive database (outside any transaction), returning whether it is available
+
+    Without create, a missing archive file means there is nothing archived yet.
+    """
+    if is_attached(conn):
+        return True
+    path = path or ARCHIVE_PATH
+    if not create and not os.path.exists(path):
+        return False
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    conn.execute('PRAGMA archive.journal_mode = WAL')
+    conn.execute('PRAGMA archive.synchronous = NORMAL')
+    return True
+
+
+@contextlib.contextmanager
+def attached(conn, wanted=True):
+    """Attach the archive for a block of union queries, yielding whether it is available
+
+    The archive is detached again afterwards: while attached, every BEGIN
+    IMMEDIATE on the connection would take the archive's write lock too.
+    """
+    if not wanted or is_attached(conn):
+        yield wanted
+        return
+    available = attach(conn)
+    try:
+        yield available
+    finally:
+        if available:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute('DETACH DATABASE archive')
+
+
+def _columns(conn, table, schema='main'):
+    return [(row[1], row[2]) for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def create_tables(conn):
+    """Create the archive tables, adding any columns the live tables gained since"""
+    for table in ('requests', 'status_logs'):
+        live = _columns(conn, table)
+        definitions = ', '.join(f'{name} {kind}' + (' PRIMARY KEY' if name == 'id' else '')
+                                for name, kind in live)
+        conn.execute(f'CREATE TABLE IF NOT EXISTS archive.{table} '
+                     f'({definitions}, batch_id INTEGER NOT NULL)')
+        archived = {name for name, _ in _columns(conn, table, 'archive')}
+        for name, kind in live:
+            if name not in archived:
+                conn.execute(f'ALTER TABLE archive.{table} ADD COLUMN {name} {kind}')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_requests_submitted ON requests (submitted_time, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_requests_batch ON requests (batch_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_requests_user_submitted '
+                 'ON requests (user_id, submitted_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_status_logs_request '
+                 'ON status_logs (request_id, timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_status_logs_batch ON status_logs (batch_id)')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS archive.archive_batches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cutoff TIMESTAMP NOT NULL,
+        copied_at TIMESTAMP NOT NULL,
+        settled_at TIMESTAMP,
+        request_count INTEGER,
+        log_count INTEGER
+    )
+    ''')
+    # Report aggregates of the settled batches, in the shape of report_store's tables
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS archive.report_tag_stats (
+        auto_tag TEXT PRIMARY KEY,
+        request_count INTEGER NOT NULL DEFAULT 0,
+        fulfilled_count INTEGER NOT NULL DEFAULT 0,
+        fulfillment_hours REAL NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS archive.report_sla_breaches (
+        request_id INTEGER PRIMARY KEY,
+        days REAL NOT NULL
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_report_sla_breaches_days '
+                 'ON report_sla_breaches (days)')
+    conn.commit()
+
+
+def _copy_batch(conn, cutoff, batch_size):
+    """Step 1: copy the oldest archivable requests, returning the new batch id (or None)"""
+    # A deferred transaction: only the archive is written, the live database is just read
+    conn.execute('BEGIN')
+    try:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM main.requests WHERE status = 'Fulfilled' AND fulfilled_time < ? "
+            "ORDER BY fulfilled_time LIMIT ?", (cutoff, batch_size))]
+        if not ids:
+            conn.rollback()
+            return None
+
+        batch_id = conn.execute('INSERT INTO archive.archive_batches (cutoff, copied_at) VALUES (?, ?)',
+                                (cutoff, datetime.datetime.now())).lastrowid
+        placeholders = ', '.join('?' * len(ids))
+        for table, key in (('requests', 'id'), ('status_logs', 'request_id')):
+            columns = ', '.join(name for name, _ in _columns(conn, table))
+            conn.execute(f'''
+                INSERT OR REPLACE INTO archive.{table} ({columns}, batch_id)
+                SELECT {columns}, ? FROM main.{table} WHERE {key} IN ({placeholders})
+            ''', [batch_id] + ids)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return batch_id
+
+
+def _purge_batch(conn, batch_id):
+    """Step 2: delete the batch's live rows that still match their archived copy"""
+    same = ' AND '.join(f'm.{name} IS a.{name}' for name, _ in _columns(conn, 'requests'))
+    begin_immediate(conn)
+    try:
+        ids = [row[0] for row in conn.execute(f'''
+            SELECT m.id FROM archive.requests a JOIN main.requests m ON m.id = a.id
+            WHERE a.batch_id = ? AND {same}
+              AND (SELECT COUNT(*) FROM main.status_logs WHERE request_id = m.id)
+                = (SELECT COUNT(*) FROM archive.status_logs WHERE request_id = m.id)
+        ''', (batch_id,))]
+        if ids:
+            placeholders = ', '.join('?' * len(ids))
+            report_store.record_removals(conn, ids)
+            conn.execute(f'DELETE FROM main.status_logs WHERE request_id IN ({placeholders})', ids)
+            conn.execute(f'DELETE FROM main.requests WHERE id IN ({placeholders})', ids)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _settle_batch(conn, batch_id):
+    """Step 3: drop copies of rows that stayed live and fold the batch into the archive's aggregates"""
+    conn.execute('BEGIN')
+    try:
+        # Rows changed between copy and purge stayed live; a later batch archives them again
+        conn.execute('DELETE FROM archive.status_logs WHERE batch_id = ? '
+                     'AND request_id IN (SELECT id FROM main.requests)', (batch_id,))
+        conn.execute('DELETE FROM archive.requests WHERE batch_id = ? '
+                     'AND id IN (SELECT id FROM main.requests)', (batch_id,))
+
+        conn.execute('''
+            INSERT INTO archive.report_tag_stats (auto_tag, request_count, fulfilled_count, fulfillment_hours)
+            SELECT auto_tag, COUNT(*), COUNT(fulfilled_time),
+                   TOTAL((JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time)) * 24)
+            FROM archive.requests WHERE batch_id = ? GROUP BY auto_tag
+            ON CONFLICT (auto_tag) DO UPDATE SET
+                request_count = request_count + excluded.request_count,
+                fulfilled_count = fulfilled_count + excluded.fulfilled_count,
+                fulfillment_hours = fulfillment_hours + excluded.fulfillment_hours
+        ''', (batch_id,))
+        conn.execute(f'''
+            INSERT OR REPLACE INTO archive.report_sla_breaches (request_id, days)
+            SELECT id, JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time) AS days
+            FROM archive.requests
+            WHERE batch_id = ? AND fulfilled_time IS NOT NULL AND days > {report_store.SLA_DAYS}
+        ''', (batch_id,))
+
+        conn.execute('''
+            UPDATE archive.archive_batches
+            SET settled_at = ?,
+                request_count = (SELECT COUNT(*) FROM archive.requests WHERE batch_id = ?),
+                log_count = (SELECT COUNT(*) FROM archive.status_logs WHERE batch_id = ?)
+            WHERE id = ?
+        ''', (datetime.datetime.now(), batch_id, batch_id, batch_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def resume(conn):
+    """Finish batches interrupted by a crash, returning how many there were"""
+    unsettled = [row[0] for row in conn.execute(_UNSETTLED + ' ORDER BY id')]
+    for batch_id in unsettled:
+        _purge_batch(conn, batch_id)
+        _settle_batch(conn, batch_id)
+    return len(unsettled)
+
+
+def archive_requests(conn, older_than_days=DEFAULT_RETENTION_DAYS, batch_size=ARCHIVE_BATCH_SIZE,
+                     max_batches=None, pause=ARCHIVE_BATCH_PAUSE):
+    """Move fulfilled requests older than the retention period, returning (requests moved, batches)"""
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=older_than_days)
+    resume(conn)
+
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        batch_id = _copy_batch(conn, cutoff, batch_size)
+        if batch_id is None:
+            break
+        _purge_batch(conn, batch_id)
+        _settle_batch(conn, batch_id)
+        moved += conn.execute('SELECT request_count FROM archive.archive_batches WHERE id = ?',
+                              (batch_id,)).fetchone()[0]
+        batches += 1
+        time.sleep(pause)
+    return moved, batches
+
+
+def get_request_types(conn):
+    """report_store.get_request_types over live and archived requests"""
+    return conn.execute(f'''
+        SELECT auto_tag, SUM(request_count) AS count
+        FROM (
+            SELECT auto_tag, request_count FROM main.report_tag_stats
+            UNION ALL
+            SELECT auto_tag, request_count FROM archive.report_tag_stats
+            UNION ALL
+            SELECT auto_tag, COUNT(*) FROM archive.requests a WHERE {pending_rows()} GROUP BY auto_tag
+        )
+        GROUP BY auto_tag
+        HAVING count > 0
+        ORDER BY count DESC
+    ''').fetchall()
+
+
+def get_avg_fulfillment(conn):
+    """report_store.get_avg_fulfillment over live and archived requests"""
+    return conn.execute(f'''
+        SELECT auto_tag, SUM(fulfillment_hours) / SUM(fulfilled_count) AS avg_hours
+        FROM (
+            SELECT auto_tag, fulfilled_count, fulfillment_hours FROM main.report_tag_stats
+            UNION ALL
+            SELECT auto_tag, fulfilled_count, fulfillment_hours FROM archive.report_tag_stats
+            UNION ALL
+            SELECT auto_tag, COUNT(fulfilled_time),
+                   TOTAL((JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time)) * 24)
+            FROM archive.requests a WHERE {pending_rows()} GROUP BY auto_tag
+        )
+        GROUP BY auto_tag
+        HAVING SUM(fulfilled_count) > 0
+        ORDER BY auto_tag
+    ''').fetchall()
+
+
+def get_sla_breaches(conn):
+    """report_store.get_sla_breaches over live and archived requests"""
+    return conn.execute(f'''
+        SELECT r.id, r.role, r.auto_tag, r.message, b.days
+        FROM main.report_sla_breaches b
+        JOIN main.requests r ON r.id = b.request_id
+        UNION ALL
+        SELECT a.id, a.role, a.auto_tag, a.message, b.days
+        FROM archive.report_sla_breaches b
+        JOIN archive.requests a ON a.id = b.request_id
+        UNION ALL
+        SELECT a.id, a.role, a.auto_tag, a.message,
+               JULIANDAY(a.fulfilled_time) - JULIANDAY(a.submitted_time) AS days
+        FROM archive.requests a
+        WHERE {pending_rows()} AND a.fulfilled_time IS NOT NULL
+          AND JULIANDAY(a.fulfilled_time) - JULIANDAY(a.submitted_time) > {report_store.SLA_DAYS}
+        ORDER BY days DESC
+    ''').fetchall()
+
+
+def status(conn):
+    """Archived row counts and batches still to be settled"""
+    row = conn.execute('''
+        SELECT COUNT(*), COUNT(settled_at), TOTAL(request_count), TOTAL(log_count), MAX(cutoff)
+        FROM archive.archive_batches
+    ''').fetchone()
+    return {'batches': row[0], 'unsettled_batches': row[0] - row[1], 'requests': int(row[2]),
+            'status_logs': int(row[3]), 'latest_cutoff': row[4]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move old fulfilled requests to the archive database')
+    parser.add_argument('--older-than-days', type=float, default=DEFAULT_RETENTION_DAYS,
+                        help='archive requests fulfilled longer ago than this')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='requests per batch')
+    parser.add_argument('--max-batches', type=int, help='stop after this many batches')
+    parser.add_argument('--pause', type=float, default=ARCHIVE_BATCH_PAUSE, help='seconds between batches')
+    parser.add_argument('--archive', default=ARCHIVE_PATH, help='archive database file')
+    parser.add_argument('--status', action='store_true', help='only show the archive status')
+    args = parser.parse_args(argv)
+
+    conn = create_pool().connect()
+    migrate(conn)
+    attach(conn, args.archive, create=True)
+    create_tables(conn)
+    if not args.status:
+        started = time.perf_counter()
+        moved, batches = archive_requests(conn, args.older_than_days, args.batch_size, args.max_batches,
+                                          args.pause)
+        print(f"Archived {moved} requests in {batches} batches ({time.perf_counter() - started:.1f} s).")
+    for key, value in status(conn).items():
+        print(f"{key}: {value}")
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Route-level load test and latency benchmark.
+
+Seeds a throwaway database, logs in as the four default users and replays a
+weighted mix of the things they do all day (dashboards, submissions, status
+transitions, inventory edits, reports, exports), then reports p50/p95/p99
+latency and throughput per route.
+
+By default requests go through Flask's test client in this process, which
+measures the application and SQLite without any network or server overhead.
+With --gunicorn the same mix is sent over real sockets to `gunicorn wsgi:app`
+started on the seeded database (--url targets a server that is already
+running; note that the mix writes to its database).
+
+    python benchmark.py --requests 50000 --ops 5000
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json        # exit 1 on regressions
+    python benchmark.py --gunicorn --workers 2 --concurrency 4
+"""
+
+import argparse
+import datetime
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# The app's modules read FOURS_DATABASE_PATH when first imported, so they are
+# only imported once main() has pointed it at the benchmark database
+
+# Seeded database size
+DEFAULT_REQUESTS = 10000
+DEFAULT_INVENTORY = 200
+
+# Operations per run, and untimed operations before measuring
+DEFAULT_OPS = 2000
+DEFAULT_WARMUP = 100
+
+# A route regresses when its p95 grows by more than this (percent)
+DEFAULT_THRESHOLD = 20.0
+
+PERCENTILES = (50, 95, 99)
+
+
+def seed_database(path, requests=DEFAULT_REQUESTS, inventory=DEFAULT_INVENTORY, seed=0):
+    """Create a migrated database at path filled by generate_data"""
+    from db import create_pool
+    import generate_data
+    from migrations import migrate
+
+    conn = create_pool(path=path).connect()
+    migrate(conn)
+    generate_data.generate(conn, requests=requests, inventory=inventory, seed=seed)
+    conn.close()
+
+
+class ClientSession:
+    """One logged-in user talking to the app through Flask's test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        try:
+            body = response.get_data()
+        finally:
+            response.close()
+        return response.status_code, response.headers.get('Location'), body
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """One logged-in user talking to a running server over HTTP"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        # Role names in paths contain spaces, which the test client quotes itself
+        url = self.base_url + urllib.parse.quote(path, safe='/?=&%')
+        req = urllib.request.Request(url, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return response.status, response.headers.get('Location'), response.read()
+        except urllib.error.HTTPError as e:
+            # Redirects and error statuses both arrive here
+            return e.code, e.headers.get('Location'), e.read()
+
+
+def _path(route, **params):
+    return route + '?' + urllib.parse.urlencode(params) if params else route
+
+
+class Workload:
+    """The weighted route mix, aimed at ids discovered from the target's own export"""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.items = []
+        self.max_request_id = 1
+
+    def discover(self, session):
+        _, _, body = session.request('GET', _path('/export_data', format='ndjson', dataset='inventory'))
+        self.items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        _, _, body = session.request('GET', _path('/export_data', format='ndjson', limit=1))
+        lines = body.splitlines()
+        self.max_request_id = json.loads(lines[0])['id'] if lines else 1
+
+    def operations(self):
+        """(name, weight, role, function(rng, user) -> (method, path, data))"""
+        def dashboard(rng, user):
+            return 'GET', f"/dashboard/{user['role']}/{user['id']}", None
+
+        def submit_form(rng, user):
+            return 'GET', f"/submit_request/{user['role']}/{user['id']}", None
+
+        def submit(rng, user):
+            item = rng.choice(self.items)
+            return 'POST', f"/submit_request/{user['role']}/{user['id']}", {
+                'message': f"Need {item['item_name']} for a customer order",
+                'tag': rng.choice(('Stock Check', 'Urgent Delivery', 'Sales Request')),
+                'product': item['item_name'],
+                'quantity': str(rng.randint(1, 20)),
+            }
+
+        def transition(statuses):
+            def op(rng, user):
+                request_id = rng.randint(1, self.max_request_id)
+                return 'POST', _path(f'/update_request/{request_id}', role=user['role'], user_id=user['id']), {
+                    'status': rng.choice(statuses)}
+            return op
+
+        def update_inventory(rng, user):
+            item = rng.choice(self.items)
+            return 'POST', _path(f"/update_inventory/{item['id']}", role=user['role'], user_id=user['id']), {
+                'quantity': str(rng.randint(0, 200))}
+
+        def manage_inventory(rng, user):
+            return 'GET', f"/add_inventory/{user['role']}/{user['id']}", None
+
+        def search(rng, user):
+            # Search as you type: a product name with its last word cut short
+            words = rng.choice(self.items)['item_name'].split()
+            query = ' '.join(words[:-1] + [words[-1][:3]])
+            return 'GET', _path(f"/search/{user['role']}/{user['id']}", q=query), None
+
+        def vendor_queue(rng, user):
+            return 'GET', '/vendor_batch', None
+
+        def reports(rng, user):
+            return 'GET', '/reports', None
+
+        def export_requests(rng, user):
+            return 'GET', _path('/export_data', format='ndjson', limit=1000), None
+
+        def export_inventory(rng, user):
+            return 'GET', _path('/export_data', format='csv', dataset='inventory'), None
+
+        return [
+            ('dashboard', 30, None, dashboard),
+            ('search', 6, None, search),
+            ('submit_request GET', 5, 'Sales Executive', submit_form),
+            ('submit_request POST', 15, 'Sales Executive', submit),
+            ('update_request (warehouse)', 12, 'Warehouse Officer',
+             transition(('In Review', 'In Transit', 'Fulfilled', 'Forwarded to Production'))),
+            ('update_request (production)', 5, 'Production Planner',
+             transition(('In Production', 'Production Complete'))),
+            ('update_inventory', 8, 'Warehouse Officer', update_inventory),
+            ('add_inventory GET', 4, 'Production Planner', manage_inventory),
+            ('vendor_batch GET', 3, None, vendor_queue),
+            ('reports', 10, 'Support Agent', reports),
+            ('export_data requests', 7, 'Support Agent', export_requests),
+            ('export_data inventory', 4, 'Warehouse Officer', export_inventory),
+        ]
+
+    def plan(self, count):
+        """Pick count operations up front so every run replays the same sequence"""
+        operations = self.operations()
+        return self.rng.choices(operations, weights=[op[1] for op in operations], k=count)
+
+
+def login(session):
+    """Log in as each default user, returning [(session, {'id', 'role'})]"""
+    from migrations import DEFAULT_USERS
+
+    users = []
+    for username, password, role in DEFAULT_USERS:
+        user_session = session()
+        status, location, _ = user_session.request('POST', '/login',
+                                                   {'username': username, 'password': password})
+        if status != 302 or '/dashboard/' not in (location or ''):
+            raise RuntimeError(f'Could not log in as {username} (HTTP {status})')
+        user_id = int(location.rstrip('/').rsplit('/', 1)[1])
+        users.append((user_session, {'id': user_id, 'role': role}))
+    return users
+
+
+def run_worker(new_session, plan, rng, samples):
+    """Replay a share of the plan as one client with its own four logins"""
+    users = login(new_session)
+    by_role = {user['role']: (user_session, user) for user_session, user in users}
+    for name, _, role, build in plan:
+        user_session, user = by_role[role] if role else rng.choice(users)
+        method, path, data = build(rng, user)
+        started = time.perf_counter()
+        status, _, _ = user_session.request(method, path, data)
+        samples.append((name, (time.perf_counter() - started) * 1000, status))
+
+
+def run(new_session, workload, ops, warmup, concurrency, seed):
+    """Run the mix, returning ([(route, ms, status)], wall seconds)"""
+    plan = workload.plan(warmup + ops)
+    run_worker(new_session, plan[:warmup], random.Random(seed), [])
+
+    plan = plan[warmup:]
+    samples = [[] for _ in range(concurrency)]
+    threads = [threading.Thread(target=run_worker,
+                                args=(new_session, plan[i::concurrency], random.Random(seed + i + 1), samples[i]))
+               for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [sample for worker in samples for sample in worker], time.perf_counter() - started
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples, wall):
+    """Latency percentiles (ms), throughput and error counts per route and overall"""
+    def stats(rows):
+        latencies = sorted(ms for _, ms, _ in rows)
+        result = {'count': len(rows), 'errors': sum(1 for _, _, status in rows if status >= 400),
+                  'throughput_rps': round(len(rows) / wall, 2) if wall else None,
+                  'mean_ms': round(sum(latencies) / len(latencies), 3),
+                  'max_ms': round(latencies[-1], 3)}
+        for pct in PERCENTILES:
+            result[f'p{pct}_ms'] = round(percentile(latencies, pct), 3)
+        return result
+
+    routes = {}
+    for sample in samples:
+        routes.setdefault(sample[0], []).append(sample)
+    return {'routes': {name: stats(rows) for name, rows in sorted(routes.items())},
+            'total': stats(samples)}
+
+
+def print_summary(summary):
+    header = f"{'route':<30} {'count':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}"
+    print(header)
+    print('-' * len(header))
+    rows = list(summary['routes'].items()) + [('TOTAL', summary['total'])]
+    for name, s in rows:
+        print(f"{name:<30} {s['count']:>6} {s['errors']:>4} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} "
+              f"{s['p99_ms']:>9.2f} {s['throughput_rps']:>8.1f}")
+
+
+def compare(baseline, summary, threshold):
+    """Print p50/p95 changes against a baseline, returning the regressed routes"""
+    regressions = []
+    print(f"\n{'route':<30} {'p50 base':>9} {'p50 now':>9} {'p95 base':>9} {'p95 now':>9} {'change':>8}")
+    for name, s in summary['routes'].items():
+        base = baseline['routes'].get(name)
+        if not base:
+            print(f"{name:<30} {'(new route)':>9}")
+            continue
+        change = (s['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100 if base['p95_ms'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<30} {base['p50_ms']:>9.2f} {s['p50_ms']:>9.2f} {base['p95_ms']:>9.2f} "
+              f"{s['p95_ms']:>9.2f} {change:>+7.1f}%{flag}")
+    return regressions
+
+
+def start_gunicorn(database, port, workers, threads):
+    """Start gunicorn wsgi:app on the benchmark database and wait until it answers"""
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--log-level', 'warning']
+    if threads > 1:
+        command += ['--threads', str(threads)]
+    env = dict(os.environ, FOURS_DATABASE_PATH=database)
+    server = subprocess.Popen(command + ['wsgi:app'], env=env,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {server.returncode}')
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start within 30 seconds')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the 4S routes under a realistic request mix')
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help='requests to seed')
+    parser.add_argument('--inventory', type=int, default=DEFAULT_INVENTORY, help='inventory items to seed')
+    parser.add_argument('--database', help='benchmark a copy of this database instead of seeding one')
+    parser.add_argument('--ops', type=int, default=DEFAULT_OPS, help='timed operations')
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help='untimed operations first')
+    parser.add_argument('--concurrency', type=int, default=1, help='concurrent clients')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for data and the mix')
+    parser.add_argument('--gunicorn', action='store_true', help='serve with gunicorn and use real sockets')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker')
+    parser.add_argument('--port', type=int, default=8765, help='gunicorn port')
+    parser.add_argument('--url', help='benchmark an already running server (writes to its database)')
+    parser.add_argument('--save', metavar='JSON', help='write the results as a baseline')
+    parser.add_argument('--compare', metavar='JSON', help='compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='p95 increase (percent) counted as a regression')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='4s-bench-')
+    database = os.path.join(workdir, 'bench.db')
+    os.environ['FOURS_DATABASE_PATH'] = database
+    server = None
+    try:
+        mode = 'url' if args.url else 'gunicorn' if args.gunicorn else 'test_client'
+        if not args.url:
+            started = time.perf_counter()
+            if args.database:
+                source = sqlite3.connect(args.database)
+                source.execute('VACUUM INTO ?', (database,))
+                source.close()
+            else:
+                seed_database(database, args.requests, args.inventory, args.seed)
+            print(f'Prepared {database} in {time.perf_counter() - started:.1f} s', file=sys.stderr)
+
+        if args.url:
+            base_url = args.url
+        elif args.gunicorn:
+            server = start_gunicorn(database, args.port, args.workers, args.threads)
+            base_url = f'http://127.0.0.1:{args.port}'
+        if mode == 'test_client':
+            # db reads the path at import, so the app must be imported after it is set
+            os.environ['FOURS_DATABASE_PATH'] = database
+            from app import app
+            new_session = lambda: ClientSession(app)
+        else:
+            new_session = lambda: HttpSession(base_url)
+
+        workload = Workload(args.seed)
+        workload.discover(login(new_session)[0][0])
+        samples, wall = run(new_session, workload, args.ops, args.warmup, args.concurrency, args.seed)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = summarize(samples, wall)
+    summary['config'] = {
+        'mode': mode, 'requests': args.requests, 'inventory': args.inventory, 'database': args.database,
+        'ops': args.ops, 'warmup': args.warmup, 'concurrency': args.concurrency, 'seed': args.seed,
+        'workers': args.workers if args.gunicorn else None, 'threads': args.threads if args.gunicorn else None,
+        'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    print_summary(summary)
+    print(f"\n{args.ops} operations in {wall:.2f} s ({args.concurrency} client(s), {mode})")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f'Saved baseline to {args.save}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('config', {}).get('mode') != mode:
+            print(f"Warning: baseline was measured in {baseline.get('config', {}).get('mode')} mode",
+                  file=sys.stderr)
+        regressions = compare(baseline, summary, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} route(s) regressed by more than {args.threshold}%: "
+                  f"{', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Per-table change counters shared by all workers.
+
+Triggers on a tracked table bump its row in change_versions inside the
+writer's own transaction, so a reader that sees the old counter value also
+sees the old table contents. Workers compare one indexed row against the
+version they cached to decide whether anything changed since, whichever
+worker or script made the change.
+
+Counters can be narrowed to the rows a view depends on: a `when` predicate
+only bumps for rows matching it (before or after an update), and a `key`
+expression keeps one counter per value, e.g. one per user.
+"""
+
+import datetime
+import re
+
+# Counter names
+INVENTORY = 'inventory'
+REQUESTS = 'requests'
+REPORTS = 'reports'
+FORECAST = 'forecast'
+
+
+def queue_counter(role):
+    """Counter of the rows in a role's pending queue"""
+    return f'queue:{role}'
+
+
+def user_requests_counter(user_id):
+    """Counter of one user's own requests"""
+    return f'user_requests:{user_id}'
+
+
+def notifications_counter(user_id):
+    """Counter of one user's notifications"""
+    return f'notifications:{user_id}'
+
+
+def create_table(conn):
+    """Create the change counter table"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS change_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    )
+    ''')
+
+
+def add_changed_at(conn):
+    """Record when each counter last moved, for Last-Modified headers"""
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(change_versions)')]
+    if 'changed_at' not in columns:
+        conn.execute('ALTER TABLE change_versions ADD COLUMN changed_at TIMESTAMP')
+
+
+def _bump(name, key, row, only_if=None):
+    """Upsert statement bumping a counter from inside a trigger"""
+    if key is None:
+        name_sql = f"'{name}'"
+    else:
+        name_sql = f"'{name}:' || " + key.format(row=row)
+    where = f' WHERE {only_if}' if only_if else ' WHERE 1'
+    return (
+        f"INSERT INTO change_versions (name, version, changed_at) "
+        f"SELECT {name_sql}, 1, CURRENT_TIMESTAMP{where} "
+        f"ON CONFLICT (name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;"
+    )
+
+
+def track(conn, name, table, key=None, when=None):
+    """Bump the counter called name on every insert, update and delete of table
+
+    key and when are SQL snippets over the changed row, written with a
+    {row} placeholder ('{row}.user_id'). With a key the counter is split into
+    'name:<key value>' counters; with when only matching rows bump it.
+    Existing triggers for the same counter are replaced.
+    """
+    if key is None:
+        conn.execute('INSERT OR IGNORE INTO change_versions (name, version) VALUES (?, 0)', (name,))
+
+    suffix = re.sub(r'\W+', '_', name).strip('_').lower()
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        trigger = f'{table}_{event.lower()}_bumps_{suffix}'
+        rows = {'INSERT': ['NEW'], 'UPDATE': ['OLD', 'NEW'], 'DELETE': ['OLD']}[event]
+
+        condition = ''
+        if when:
+            condition = 'WHEN ' + ' OR '.join(f'({when.format(row=row)})' for row in rows)
+
+        body = [_bump(name, key, rows[-1])]
+        if event == 'UPDATE' and key is not None:
+            # A row moving to another key changes both counters
+            body.append(_bump(name, key, 'OLD',
+                              f"{key.format(row='OLD')} IS NOT {key.format(row='NEW')}"))
+
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        conn.execute(f'''
+        CREATE TRIGGER {trigger}
+        AFTER {event} ON {table}
+        {condition}
+        BEGIN
+            {' '.join(body)}
+        END
+        ''')
+
+
+def get_version(conn, name):
+    """Get the current value of a change counter (0 if it does not exist)"""
+    row = conn.execute('SELECT version FROM change_versions WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def get_versions(conn, names):
+    """Get {name: (version, changed_at)} for several counters in one query"""
+    names = list(names)
+    placeholders = ', '.join('?' * len(names))
+    found = {row[0]: (row[1], row[2]) for row in conn.execute(
+        f'SELECT name, version, changed_at FROM change_versions WHERE name IN ({placeholders})',
+        names
+    )}
+    return {name: found.get(name, (0, None)) for name in names}
+
+
+def last_changed(versions):
+    """Latest changed_at (UTC) among get_versions() results, or None"""
+    times = [changed_at for _, changed_at in versions.values() if changed_at]
+    if not times:
+        return None
+    return datetime.datetime.strptime(max(times), '%Y-%m-%d %H:%M:%S').replace(
+        tzinfo=datetime.timezone.utc)
@@ -0,0 +1,101 @@
+"""
+Conditional GET support.
+
+Views build their ETag from the change counters they depend on (see
+change_versions), so a client that already has the current version gets a
+304 before any of the view's queries run. Rendered HTML fragments are cached
+per worker under the same versions, so a page whose counters moved only
+re-renders the sections that actually changed.
+"""
+
+import collections
+import hashlib
+import os
+import threading
+
+from flask import request, session
+
+# Rendered fragments kept per worker
+FRAGMENT_CACHE_SIZE = 512
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _code_version():
+    """Fingerprint of the templates and modules, so a deploy changes every ETag"""
+    digest = hashlib.sha1()
+    for folder in (_ROOT, os.path.join(_ROOT, 'templates')):
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(('.py', '.html')):
+                stat = os.stat(os.path.join(folder, name))
+                digest.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return digest.hexdigest()
+
+
+CODE_VERSION = _code_version()
+
+
+def make_etag(*parts):
+    """Strong ETag value for the given view inputs and counter versions"""
+    digest = hashlib.sha1(CODE_VERSION.encode())
+    digest.update(repr(parts).encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+def cacheable():
+    """Whether the response may be validated by ETag (no one-off flash messages pending)"""
+    return not session.get('_flashes')
+
+
+def is_fresh(etag):
+    """Check If-None-Match against the current ETag"""
+    return request.if_none_match.contains(etag)
+
+
+def add_validators(response, etag, last_modified=None):
+    """Attach ETag / Last-Modified and ask clients to revalidate every time"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+class FragmentCache:
+    """Bounded LRU of rendered fragments keyed by (name, versions, view arguments)"""
+
+    def __init__(self, size=FRAGMENT_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Hit/miss counts for this worker"""
+        with self._lock:
+            hits, misses, entries = self.hits, self.misses, len(self._entries)
+        total = hits + misses
+        return {
+            'entries': entries,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
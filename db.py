@@ -0,0 +1,167 @@
+"""
+SQLite connection management for the 4S application.
+
+Connections are kept in a small bounded pool per worker process and handed
+out once per Flask app context, so a request reuses one open connection
+instead of reconnecting on every query. Every connection is switched to WAL
+so dashboard reads are not blocked by request/inventory writers.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+
+from flask import current_app, g
+
+# Database setup
+DATABASE_PATH = os.environ.get('FOURS_DATABASE_PATH', 'database/4s_database.db')
+
+# Default pool and pragma settings, overridable through app.config / env
+DEFAULT_CONFIG = {
+    'SQLITE_POOL_SIZE': 8,
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_CACHE_SIZE': -16000,        # negative = KiB, so ~16 MB per connection
+    'SQLITE_MMAP_SIZE': 128 * 1024 * 1024,
+    'SQLITE_BUSY_TIMEOUT': 5000,        # milliseconds
+}
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+class ConnectionPool:
+    """A bounded pool of SQLite connections owned by one worker process"""
+
+    def __init__(self, path, size=8, synchronous='NORMAL', cache_size=-16000,
+                 mmap_size=128 * 1024 * 1024, busy_timeout=5000, factory=None):
+        synchronous = str(synchronous).upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Invalid synchronous mode: {synchronous}")
+
+        self.path = path
+        self.size = int(size)
+        self.synchronous = synchronous
+        self.cache_size = int(cache_size)
+        self.mmap_size = int(mmap_size)
+        self.busy_timeout = int(busy_timeout)
+        self.factory = factory or sqlite3.Connection
+
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """Drop all pooled connections (used after a fork)"""
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def connect(self):
+        """Open a new connection with the configured pragmas applied"""
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000.0,
+                               check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA cache_size = {self.cache_size}')
+        conn.execute(f'PRAGMA mmap_size = {self.mmap_size}')
+        conn.execute(f'PRAGMA busy_timeout = {self.busy_timeout}')
+        conn.execute('PRAGMA foreign_keys = ON')
+        return conn
+
+    def acquire(self, timeout=None):
+        """Check a connection out of the pool, opening one if none are idle"""
+        with self._lock:
+            # Connections must never be shared across a fork (e.g. gunicorn --preload)
+            if self._pid != os.getpid():
+                self._reset()
+
+        if not self._slots.acquire(timeout=timeout):
+            raise sqlite3.OperationalError('Timed out waiting for a database connection')
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        try:
+            return self.connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left open"""
+        if conn is None:
+            return
+
+        if self._pid != os.getpid():
+            conn.close()
+            return
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (sqlite3.Error, queue.Full):
+            conn.close()
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def create_pool(config=None, path=None, factory=None):
+    """Create a pool from a Flask-style config mapping
+
+    factory is an optional sqlite3.Connection subclass (e.g. an instrumented one).
+    """
+    settings = dict(DEFAULT_CONFIG)
+    for key in DEFAULT_CONFIG:
+        if key in os.environ:
+            settings[key] = os.environ[key]
+    if config:
+        settings.update({k: v for k, v in config.items() if k in DEFAULT_CONFIG})
+
+    return ConnectionPool(
+        path or DATABASE_PATH,
+        size=settings['SQLITE_POOL_SIZE'],
+        synchronous=settings['SQLITE_SYNCHRONOUS'],
+        cache_size=settings['SQLITE_CACHE_SIZE'],
+        mmap_size=settings['SQLITE_MMAP_SIZE'],
+        busy_timeout=settings['SQLITE_BUSY_TIMEOUT'],
+        factory=factory,
+    )
+
+
+def init_app(app, path=None, factory=None):
+    """Attach a connection pool to the app and release connections on teardown"""
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, os.environ.get(key, value))
+
+    app.extensions['sqlite_pool'] = create_pool(app.config, path, factory)
+    app.teardown_appcontext(close_db)
+
+
+def get_pool(app=None):
+    """Get the connection pool of the given (or current) app"""
+    return (app or current_app).extensions['sqlite_pool']
+
+
+def get_db():
+    """Get the database connection for the current app context"""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+def close_db(exc=None):
+    """Return the app context's connection to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
@@ -0,0 +1,244 @@
+"""
+Streaming data export.
+
+Rows are read from the cursor in fixed-size chunks and serialized as they
+arrive, so a worker's memory use does not depend on how much history is
+exported. The same rows can be written as the original JSON document, as
+NDJSON (one object per line) or as CSV.
+
+JSON and NDJSON end a page with its next_cursor. CSV has no place for it
+after the rows, so a paged CSV export looks up the page's last row first
+(page_end_cursor), sends it as a header and streams the rows up to it.
+"""
+
+import csv
+import io
+import json
+
+from archive import archived_rows, attached
+from pagination import encode_cursor, seek_clause, through_clause
+
+# Rows fetched from SQLite per chunk
+EXPORT_CHUNK_SIZE = 500
+
+EXPORT_FORMATS = ('json', 'ndjson', 'csv')
+EXPORT_DATASETS = ('requests', 'inventory')
+
+MIMETYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+REQUEST_COLUMNS = [
+    'id', 'username', 'role', 'message', 'auto_tag', 'status',
+    'submitted_time', 'fulfilled_time', 'estimated_delivery',
+    'vendor_name', 'solution', 'forwarded_to_production', 'hours_to_fulfill',
+]
+
+INVENTORY_COLUMNS = ['id', 'item_name', 'quantity', 'status']
+
+
+def _dumps(obj):
+    """Serialize like Flask's jsonify (sorted keys, compact separators)"""
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'))
+
+
+def iter_requests(conn, since=None, until=None, cursor=None, descending=True, limit=None,
+                  include_archive=False, through=None, offset=None):
+    """Yield request export rows as dicts, newest first unless descending is False
+
+    With include_archive the archive database must be attached (see
+    archive.attached) and archived requests are merged in. through stops
+    after the row of that cursor.
+    """
+    conditions = []
+    params = []
+    if since:
+        conditions.append('r.submitted_time >= ?')
+        params.append(since)
+    if until:
+        conditions.append('r.submitted_time < ?')
+        params.append(until)
+    for clause, clause_params in (seek_clause(cursor, descending, alias='r.'),
+                                  through_clause(through, descending, alias='r.')):
+        if clause:
+            conditions.append(clause)
+            params.extend(clause_params)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    direction = 'DESC' if descending else 'ASC'
+    select = '''
+        SELECT r.id AS id, u.username, r.role, r.message, r.auto_tag, r.status,
+               r.submitted_time, r.fulfilled_time, r.estimated_delivery,
+               r.vendor_name, r.solution, r.forwarded_to_production,
+               CASE
+                   WHEN r.fulfilled_time IS NOT NULL THEN
+                       ROUND((JULIANDAY(r.fulfilled_time) - JULIANDAY(r.submitted_time)) * 24, 2)
+                   ELSE NULL
+               END as hours_to_fulfill
+        FROM {table} r
+        JOIN users u ON r.user_id = u.id
+    '''
+    if include_archive:
+        # Both sides are read in (submitted_time, id) order and merged
+        archive_where = 'WHERE ' + ' AND '.join(conditions + [archived_rows('r')])
+        sql = (select.format(table='main.requests') + where + ' UNION ALL ' +
+               select.format(table='archive.requests') + archive_where +
+               f' ORDER BY submitted_time {direction}, id {direction}')
+        params = params + params
+    else:
+        sql = select.format(table='requests') + where + f' ORDER BY r.submitted_time {direction}, r.id {direction}'
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+        if offset:
+            sql += ' OFFSET ?'
+            params.append(offset)
+
+    yield from _iter_dicts(conn.execute(sql, params), REQUEST_COLUMNS)
+
+
+def page_end_cursor(conn, since=None, until=None, cursor=None, descending=True, limit=None,
+                    include_archive=False):
+    """Cursor of the last row of a page of limit requests, or None when fewer are left"""
+    with attached(conn, include_archive) as include_archive:
+        rows = list(iter_requests(conn, since, until, cursor, descending, 1, include_archive, offset=limit - 1))
+    if not rows:
+        return None
+    return encode_cursor(rows[0]['submitted_time'], rows[0]['id'])
+
+
+def iter_inventory(conn, inventory_cache=None):
+    """Yield inventory export rows as dicts, by item name"""
+    if inventory_cache is not None:
+        for row in inventory_cache.by_name(conn):
+            yield {column: row[column] for column in INVENTORY_COLUMNS}
+        return
+    rows = conn.execute('SELECT id, item_name, quantity, status FROM inventory ORDER BY item_name')
+    yield from _iter_dicts(rows, INVENTORY_COLUMNS)
+
+
+def _iter_dicts(cursor, columns):
+    """Fetch a cursor chunk by chunk, yielding each row as a dict"""
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            yield dict(zip(columns, row))
+
+
+class _LastRow:
+    """Remember the last request row passing through, to build the next cursor"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.row = None
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.row = row
+            self.count += 1
+            yield row
+
+    def next_cursor(self, limit):
+        """Cursor for the following page, or None when this page was the last"""
+        if not limit or self.count < limit or self.row is None:
+            return None
+        return encode_cursor(self.row['submitted_time'], self.row['id'])
+
+
+def coalesce(pieces, size=64 * 1024):
+    """Join small string pieces into larger chunks before they hit the socket"""
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_json(requests, inventory, limit=None):
+    """Stream the original {"inventory": [...], "requests": [...]} document"""
+    tracked = _LastRow(requests)
+
+    yield '{"inventory":['
+    for i, item in enumerate(inventory):
+        yield (',' if i else '') + _dumps(item)
+    yield '],"requests":['
+    for i, row in enumerate(tracked):
+        yield (',' if i else '') + _dumps(row)
+    yield ']'
+
+    next_cursor = tracked.next_cursor(limit)
+    if limit:
+        yield ',"next_cursor":' + _dumps(next_cursor)
+    yield '}\n'
+
+
+def stream_ndjson(rows, limit=None):
+    """Stream one JSON object per line, ending with the next cursor when paginated"""
+    tracked = _LastRow(rows)
+    for row in tracked:
+        yield _dumps(row) + '\n'
+
+    if limit:
+        yield _dumps({'next_cursor': tracked.next_cursor(limit)}) + '\n'
+
+
+def stream_csv(rows, columns):
+    """Stream rows as CSV with a header line"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def generate_export(pool, export_format='json', dataset='requests', since=None, until=None,
+                    cursor=None, descending=True, limit=None, inventory_cache=None, include_archive=False,
+                    through=None):
+    """Generate an export body on a pooled connection held only while streaming
+
+    A paged CSV export of requests is given the page_end_cursor() of its
+    page as through, and streams every row up to it rather than limit rows.
+    """
+    conn = pool.acquire()
+    try:
+        # Archived requests are merged in only on request (and once anything was archived)
+        wanted = include_archive and (export_format == 'json' or dataset == 'requests')
+        with attached(conn, wanted) as include_archive:
+            # Read every chunk from one snapshot so pages and tables stay consistent
+            conn.execute('BEGIN')
+
+            if export_format == 'json':
+                requests = iter_requests(conn, since, until, cursor, descending, limit, include_archive)
+                pieces = stream_json(requests, iter_inventory(conn, inventory_cache), limit)
+            elif dataset == 'inventory':
+                rows = iter_inventory(conn, inventory_cache)
+                if export_format == 'ndjson':
+                    pieces = stream_ndjson(rows)
+                else:
+                    pieces = stream_csv(rows, INVENTORY_COLUMNS)
+            elif export_format == 'ndjson':
+                rows = iter_requests(conn, since, until, cursor, descending, limit, include_archive)
+                pieces = stream_ndjson(rows, limit)
+            else:
+                # Rows committed since the header was computed stay in this page, not in a gap
+                rows = iter_requests(conn, since, until, cursor, descending, None, include_archive, through)
+                pieces = stream_csv(rows, REQUEST_COLUMNS)
+
+            yield from coalesce(pieces)
+    finally:
+        pool.release(conn)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Stock-out forecasting and the reorder list.
+
+Demand is the quantity of every Sales Executive order naming a product,
+summed per day into demand_daily. A refresh folds in only the orders added
+since the last one (requests.id is assigned in commit order, so a watermark
+is enough), then forecasts every SKU at once from the last FORECAST_DAYS
+full days: the window is loaded into a products x days NumPy array (days
+without orders are zero) and the rates, spreads and reorder figures below
+are computed as whole-array operations, with no per-product Python loop:
+
+    reorder point   = rate * LEAD_TIME_DAYS + SAFETY_FACTOR * stddev * sqrt(LEAD_TIME_DAYS)
+    days left       = quantity on hand / rate
+    reorder qty     = reorder point + rate * COVER_DAYS - quantity on hand
+
+Items at or under their reorder point make up the reorder list, stored in
+stock_forecast with the quantities it was computed from. Pages only read
+that table; the refresh runs as a background job when the stored forecast
+is older than REFRESH_SECONDS, when a Production Planner asks for one, or
+from cron:
+
+    python forecast.py              # fold in new orders and refresh
+    python forecast.py --rebuild    # recompute the daily demand from scratch
+"""
+
+import argparse
+import datetime
+import math
+import sys
+
+import numpy as np
+
+from db import create_pool
+from inventory import begin_immediate
+
+# Days of demand history behind a forecast (full days, today excluded)
+FORECAST_DAYS = 28
+
+# Days from a reorder until the stock arrives, and days of demand an order should cover after that
+LEAD_TIME_DAYS = 7
+COVER_DAYS = 14
+
+# Standard deviations of lead-time demand held as safety stock (about a 95% service level)
+SAFETY_FACTOR = 1.65
+
+# Age at which a page view schedules a refresh
+REFRESH_SECONDS = 15 * 60
+
+# Items shown on the Production dashboard and /reports
+REORDER_LIST_SIZE = 25
+
+# Demand: customer orders that name a product
+_DEMAND_WHERE = "role = 'Sales Executive' AND product_id IS NOT NULL"
+
+
+def create_tables(conn):
+    """Create the daily demand series, the forecasts and the refresh marker"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS demand_daily (
+        day TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        PRIMARY KEY (day, product_id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS stock_forecast (
+        product_id INTEGER PRIMARY KEY,
+        quantity INTEGER NOT NULL,
+        daily_rate REAL NOT NULL,
+        demand_stddev REAL NOT NULL,
+        reorder_point REAL NOT NULL,
+        days_until_stockout REAL,
+        reorder_quantity INTEGER NOT NULL,
+        FOREIGN KEY (product_id) REFERENCES inventory (id)
+    )
+    ''')
+    # The reorder list, soonest stock-out first and fastest sellers first among those
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_stock_forecast_reorder '
+                 'ON stock_forecast (days_until_stockout, daily_rate DESC) WHERE reorder_quantity > 0')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS forecast_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_request_id INTEGER NOT NULL,
+        refreshed_at TIMESTAMP
+    )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO forecast_state (id, last_request_id) VALUES (1, 0)')
+
+
+def _fold_demand(conn):
+    """Add the orders placed since the last refresh to demand_daily, returning how many"""
+    last_id = conn.execute('SELECT last_request_id FROM forecast_state WHERE id = 1').fetchone()[0]
+    newest = conn.execute('SELECT MAX(id) FROM requests').fetchone()[0] or 0
+    if newest <= last_id:
+        return 0
+
+    rows = conn.execute(f'''
+        SELECT date(submitted_time), product_id, SUM(COALESCE(quantity, 1)), COUNT(*)
+        FROM requests
+        WHERE id > ? AND id <= ? AND {_DEMAND_WHERE}
+        GROUP BY 1, 2
+    ''', (last_id, newest)).fetchall()
+    conn.executemany('''
+        INSERT INTO demand_daily (day, product_id, quantity) VALUES (?, ?, ?)
+        ON CONFLICT (day, product_id) DO UPDATE SET quantity = quantity + excluded.quantity
+    ''', [(row[0], row[1], row[2]) for row in rows])
+    conn.execute('UPDATE forecast_state SET last_request_id = ? WHERE id = 1', (newest,))
+    return sum(row[3] for row in rows)
+
+
+def forecast_items(quantity, daily_rate, demand_stddev):
+    """Reorder points, days until stock-out (NaN without demand) and reorder quantities
+
+    Takes and returns arrays with one entry per SKU.
+    """
+    reorder_point = daily_rate * LEAD_TIME_DAYS + SAFETY_FACTOR * demand_stddev * math.sqrt(LEAD_TIME_DAYS)
+    selling = daily_rate > 0
+    days_left = np.divide(quantity, daily_rate, out=np.full(len(quantity), np.nan), where=selling)
+    reorder = selling & (quantity <= reorder_point)
+    reorder_quantity = np.where(reorder, np.ceil(reorder_point + daily_rate * COVER_DAYS - quantity), 0)
+    return reorder_point, days_left, reorder_quantity.astype(np.int64)
+
+
+def _demand_window(conn, first_day, today):
+    """Daily demand of every product sold in the window, as (product ids, products x days array)"""
+    rows = np.array(conn.execute('''
+        SELECT product_id, CAST(JULIANDAY(day) - JULIANDAY(:first) AS INTEGER), quantity
+        FROM demand_daily
+        WHERE day >= :first AND day < :today
+    ''', {'first': str(first_day), 'today': str(today)}).fetchall(), dtype=np.int64).reshape(-1, 3)
+    product_ids, product_index = np.unique(rows[:, 0], return_inverse=True)
+    series = np.zeros((len(product_ids), FORECAST_DAYS))
+    np.add.at(series, (product_index, rows[:, 1]), rows[:, 2])
+    return product_ids, series
+
+
+def _forecast(conn, today):
+    """Recompute stock_forecast for every SKU with demand in the window"""
+    product_ids, series = _demand_window(conn, today - datetime.timedelta(days=FORECAST_DAYS), today)
+
+    # Stock on hand, aligned with the series; products no longer in inventory are dropped
+    on_hand = dict(conn.execute('SELECT id, quantity FROM inventory'))
+    known = np.array([product_id in on_hand for product_id in product_ids.tolist()], dtype=bool)
+    product_ids, series = product_ids[known], series[known]
+    quantity = np.array([on_hand[product_id] for product_id in product_ids.tolist()], dtype=float)
+
+    daily_rate = series.mean(axis=1)
+    demand_stddev = series.std(axis=1)
+    reorder_point, days_left, reorder_quantity = forecast_items(quantity, daily_rate, demand_stddev)
+
+    conn.execute('DELETE FROM stock_forecast')
+    conn.executemany('''
+        INSERT INTO stock_forecast (product_id, quantity, daily_rate, demand_stddev,
+                                    reorder_point, days_until_stockout, reorder_quantity)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', zip(product_ids.tolist(), quantity.astype(np.int64).tolist(), daily_rate.tolist(),
+             demand_stddev.tolist(), reorder_point.tolist(),
+             [None if math.isnan(days) else days for days in days_left.tolist()],
+             reorder_quantity.tolist()))
+    return len(product_ids)
+
+
+def refresh(conn, now=None):
+    """Fold in new orders and recompute every forecast (caller commits)
+
+    Returns (orders folded in, SKUs forecast).
+    """
+    now = now or datetime.datetime.now()
+    orders = _fold_demand(conn)
+    forecast = _forecast(conn, now.date())
+    conn.execute('UPDATE forecast_state SET refreshed_at = ? WHERE id = 1', (now,))
+    return orders, forecast
+
+
+def rebuild(conn, now=None):
+    """Recompute the daily demand from the whole requests table, then refresh (caller commits)"""
+    conn.execute('DELETE FROM demand_daily')
+    conn.execute('UPDATE forecast_state SET last_request_id = 0 WHERE id = 1')
+    return refresh(conn, now)
+
+
+def refreshed_at(conn):
+    """When the stored forecast was computed, or None before the first refresh"""
+    row = conn.execute('SELECT refreshed_at FROM forecast_state WHERE id = 1').fetchone()
+    return row[0] if row else None
+
+
+def is_stale(conn, now=None):
+    """Whether the stored forecast is older than REFRESH_SECONDS"""
+    refreshed = refreshed_at(conn)
+    if refreshed is None:
+        return True
+    now = now or datetime.datetime.now()
+    return (now - datetime.datetime.fromisoformat(str(refreshed))).total_seconds() > REFRESH_SECONDS
+
+
+def get_reorder_list(conn, limit=REORDER_LIST_SIZE):
+    """Items at or under their reorder point, soonest stock-out first"""
+    return conn.execute('''
+        SELECT f.*, i.item_name
+        FROM stock_forecast f
+        CROSS JOIN inventory i ON i.id = f.product_id   -- walk the reorder index, not inventory
+        WHERE f.reorder_quantity > 0
+        ORDER BY f.days_until_stockout, f.daily_rate DESC
+        LIMIT ?
+    ''', (limit,)).fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Refresh the stock-out forecasts and the reorder list')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='recompute the daily demand from all requests first')
+    args = parser.parse_args(argv)
+
+    # migrations imports this module, so import it only when run as a script
+    from migrations import migrate
+
+    conn = create_pool().connect()
+    migrate(conn)
+    begin_immediate(conn)
+    orders, forecast = (rebuild if args.rebuild else refresh)(conn)
+    reorder = conn.execute('SELECT COUNT(*) FROM stock_forecast WHERE reorder_quantity > 0').fetchone()[0]
+    conn.commit()
+    conn.close()
+    print(f"Folded in {orders} orders; forecast {forecast} products, {reorder} to reorder.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
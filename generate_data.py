@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Generate a large synthetic 4S database for scale testing.
+
+Recreates the database like reset_db.py, then bulk-loads users, inventory
+SKUs, requests and their status history with realistic mixes: request
+volume by role, tags whose messages contain the keywords the tagging rules
+look for, Zipf-distributed product popularity, and log-normal fulfillment
+times per tag, with each request's lifecycle cut off at the end of the
+generated period (so recent requests are still open). The same seed and
+--end date always produce the same data.
+
+Rows are written with executemany in large transactions, with journaling
+and synchronous writes off and the bulk-loaded tables' indexes and triggers
+dropped; everything is restored, the report store rebuilt and the database
+analyzed afterwards.
+
+    python generate_data.py --requests 1000000 --inventory 5000 --users-per-role 50
+"""
+
+import argparse
+import bisect
+import contextlib
+import datetime
+import itertools
+import math
+import os
+import random
+import sys
+import time
+
+from werkzeug.security import generate_password_hash
+
+from db import DATABASE_PATH, create_pool
+from inventory import stock_status
+from migrations import DEFAULT_USERS, migrate
+import forecast
+import report_store
+import report_timeseries
+import search
+
+# Defaults
+DEFAULT_REQUESTS = 1000000
+DEFAULT_INVENTORY = 5000
+DEFAULT_USERS_PER_ROLE = 25
+DEFAULT_DAYS = 365
+
+# Rows per executemany / transaction
+BATCH_SIZE = 50000
+
+# Tables loaded here; their indexes and triggers are rebuilt after the load
+LOADED_TABLES = ('users', 'inventory', 'requests', 'status_logs')
+
+# Share of requests submitted by each role
+ROLE_MIX = [('Sales Executive', 55), ('Support Agent', 20), ('Warehouse Officer', 15),
+            ('Production Planner', 10)]
+
+# Per role: (tag, weight, median hours to fulfill, message templates). Each
+# template contains a keyword of its tag's rule and none of a better-ranked one.
+TAG_MIX = {
+    'Sales Executive': [
+        ('Urgent Delivery', 15, 8, ('Urgent: customer needs {item} this week',
+                                    'Need immediate dispatch of {item}')),
+        ('Stock Check', 50, 20, ('Is {item} in stock?', 'Please check inventory for {item}',
+                                 'Is {item} available for a repeat order?')),
+        ('Sales Request', 35, 36, ('New order for {item}', 'Customer order: {item}',
+                                   'Quote accepted for {item}')),
+    ],
+    'Warehouse Officer': [
+        ('Stock Confirmation', 30, 12, ('Please confirm receipt of {n} pallets',
+                                        'Check availability of bay {n}')),
+        ('Shipment', 45, 30, ('Ready to ship order #{n}', 'Deliver order #{n} to the north dock')),
+        ('Warehouse Request', 25, 24, ('Forklift maintenance needed in aisle {n}',
+                                       'Replace the scanner at gate {n}')),
+    ],
+    'Production Planner': [
+        ('Delay Report', 20, 48, ('Line {n} delay: waiting on raw material',
+                                  'Expected delay of {n} days on the press line')),
+        ('Production Schedule', 45, 72, ('Update the schedule for line {n}',
+                                         'Please schedule a run on line {n}')),
+        ('Production Request', 35, 60, ('Need raw materials for line {n}',
+                                        'Tooling change required on line {n}')),
+    ],
+    'Support Agent': [
+        ('Customer Complaint', 35, 30, ('Customer complaint about damaged {item}',
+                                        'Complaint: {item} arrived late')),
+        ('Service Request', 30, 48, ('Service visit needed for {item}',
+                                     'Customer asks for a service contract on {item}')),
+        ('Support Request', 35, 20, ('Customer cannot log in to the portal',
+                                     'Invoice #{n} needs a correction')),
+    ],
+}
+
+# Spread of fulfillment times around each tag's median (log-normal sigma)
+FULFILLMENT_SIGMA = 0.8
+
+# Per role: (weight, [(status log entry, request status, share of the fulfillment time)]).
+# A lifecycle ends with 'Fulfilled' or 'Declined'; steps after the end date are not written.
+LIFECYCLES = {
+    'Sales Executive': [
+        (60, [('In Transit', 'In Transit', 0.0), ('Fulfilled', 'Fulfilled', 1.0)]),
+        (20, [('Forwarded to Production', 'Forwarded to Production', 0.0),
+              ('In Production', 'In Production', 0.4),
+              ('Production Complete', 'Ready for Shipment', 1.5),
+              ('Fulfilled', 'Fulfilled', 3.0)]),
+        (15, [('Submitted', 'Submitted', 0.0), ('In Review', 'In Review', 0.2),
+              ('In Transit', 'In Transit', 0.5), ('Fulfilled', 'Fulfilled', 1.0)]),
+        (5, [('Submitted', 'Submitted', 0.0), ('Declined', 'Declined', 0.3)]),
+    ],
+    'Warehouse Officer': [
+        (80, [('Submitted', 'Submitted', 0.0), ('Fulfilled', 'Fulfilled', 1.0)]),
+        (15, [('Submitted', 'Submitted', 0.0), ('Acknowledged', 'Acknowledged', 0.1),
+              ('Fulfilled', 'Fulfilled', 1.0)]),
+        (5, [('Submitted', 'Submitted', 0.0), ('Declined', 'Declined', 0.2)]),
+    ],
+    'Production Planner': [
+        (85, [('Submitted', 'Submitted', 0.0), ('Acknowledged', 'Acknowledged', 0.2),
+              ('Fulfilled', 'Fulfilled', 1.0)]),
+        (15, [('Submitted', 'Submitted', 0.0), ('Declined', 'Declined', 0.5)]),
+    ],
+    'Support Agent': [
+        (70, [('Submitted', 'Submitted', 0.0), ('Fulfilled by Vendor', 'Fulfilled', 1.0)]),
+        (20, [('Submitted', 'Submitted', 0.0), ('Fulfilled', 'Fulfilled', 1.0)]),
+        (10, [('Submitted', 'Submitted', 0.0), ('Declined', 'Declined', 0.4)]),
+    ],
+}
+
+VENDORS = ('Acme Field Services', 'Northwind Repairs', 'Globex Support', 'Initech Logistics',
+           'Umbrella Maintenance', 'Stark Industrial')
+SOLUTIONS = ('Replaced the damaged unit', 'Issued a credit note', 'Sent a technician on site',
+             'Shipped a replacement part', 'Resolved over the phone')
+
+# SKU names: material x part x size, numbered once the combinations run out
+MATERIALS = ('Steel', 'Aluminium', 'Brass', 'Copper', 'Nylon', 'Rubber', 'Carbon', 'Titanium',
+             'Plastic', 'Oak', 'Glass', 'Ceramic')
+PARTS = ('Bolt', 'Bracket', 'Hinge', 'Gasket', 'Bearing', 'Valve', 'Spring', 'Washer', 'Flange',
+         'Coupling', 'Pulley', 'Gear', 'Rivet', 'Clamp', 'Pipe', 'Panel', 'Rod', 'Sheet', 'Fitting',
+         'Nozzle', 'Sprocket', 'Bushing', 'Anchor', 'Hook', 'Latch', 'Lever', 'Knob', 'Caster',
+         'Filter', 'Seal')
+SIZES = ('M4', 'M5', 'M6', 'M8', 'M10', 'M12', '10mm', '20mm', '25mm', '40mm', '50mm', '75mm',
+         '100mm', 'Small', 'Medium', 'Large', 'XL', 'Mini', 'Pro', 'Heavy')
+
+# Product popularity: the k-th most popular SKU is requested ~ 1 / k^s as often
+ZIPF_EXPONENT = 1.1
+
+
+def _cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def _picker(rng, choices):
+    """Function drawing a value from (value, weight) pairs (a cheaper rng.choices for one pick)"""
+    values = [value for value, _ in choices]
+    cum_weights = _cumulative(weight for _, weight in choices)
+    total = cum_weights[-1]
+    return lambda: values[bisect.bisect(cum_weights, rng.random() * total)]
+
+
+@contextlib.contextmanager
+def bulk_load(conn, tables=LOADED_TABLES):
+    """Relax durability and drop the tables' indexes and triggers while loading
+
+    Indexes and triggers are recreated from their saved SQL afterwards, so
+    whatever later migrations add to these tables is kept. Triggers do not
+    fire for the loaded rows; callers rebuild what they maintain.
+    """
+    conn.commit()
+    placeholders = ', '.join('?' * len(tables))
+    saved = conn.execute(f'''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+        ORDER BY type, name
+    ''', tables).fetchall()
+    for kind, name, _ in saved:
+        conn.execute(f'DROP {kind.upper()} {name}')
+    conn.commit()
+
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA foreign_keys = OFF')
+    conn.execute('PRAGMA cache_size = -262144')
+    try:
+        yield
+        conn.commit()
+    finally:
+        for _, _, sql in saved:
+            conn.execute(sql)
+        conn.commit()
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA foreign_keys = ON')
+
+
+def generate_users(conn, per_role):
+    """Add per_role - 1 users next to each default user (same password), returning {role: [ids]}"""
+    rows = []
+    for username, password, role in DEFAULT_USERS:
+        # Hashing is slow, so every generated user of a role shares one hash
+        password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        rows.extend((f'{username}{i:03d}', password_hash, role) for i in range(1, per_role))
+    conn.executemany('INSERT OR IGNORE INTO users (username, password, role) VALUES (?, ?, ?)', rows)
+
+    users = {}
+    for user_id, role in conn.execute('SELECT id, role FROM users ORDER BY id'):
+        users.setdefault(role, []).append(user_id)
+    return users
+
+
+def generate_inventory(conn, rng, count):
+    """Add count SKUs with a mix of out-of-stock, low and well stocked items, returning [(id, name)]"""
+    names = [f'{material} {part} {size}' for material in MATERIALS for part in PARTS for size in SIZES]
+    rng.shuffle(names)
+    rows = []
+    for i in range(count):
+        name = names[i % len(names)]
+        if i >= len(names):
+            name += f' #{i // len(names)}'
+        roll = rng.random()
+        if roll < 0.08:
+            quantity = 0
+        elif roll < 0.20:
+            quantity = rng.randint(1, 9)
+        else:
+            quantity = int(rng.lognormvariate(math.log(80), 0.9)) + 10
+        rows.append((name, quantity, stock_status(quantity)))
+    conn.executemany('INSERT OR IGNORE INTO inventory (item_name, quantity, status) VALUES (?, ?, ?)', rows)
+    return conn.execute('SELECT id, item_name FROM inventory ORDER BY id').fetchall()
+
+
+def generate_requests(conn, rng, count, users, items, start, end, batch_size=BATCH_SIZE):
+    """Add count requests submitted between start and end, with their status logs
+
+    Submissions arrive as a Poisson process, so ids follow submitted_time.
+    Returns the number of status_logs rows written.
+    """
+    pick_role = _picker(rng, ROLE_MIX)
+    pick_tag = {role: _picker(rng, [(tag, weight) for tag, weight, _, _ in tags])
+                for role, tags in TAG_MIX.items()}
+    tag_info = {tag: (median, templates) for tags in TAG_MIX.values() for tag, _, median, templates in tags}
+    pick_lifecycle = {role: _picker(rng, [(steps, weight) for weight, steps in cycles])
+                      for role, cycles in LIFECYCLES.items()}
+
+    # Popular products first: shuffle, then weight by rank
+    products = list(items)
+    rng.shuffle(products)
+    product_weights = _cumulative(1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(len(products)))
+
+    request_id = (conn.execute('SELECT MAX(id) FROM requests').fetchone()[0] or 0) + 1
+    mean_gap = (end - start).total_seconds() / max(count, 1)
+    submitted = start
+    logs_written = 0
+
+    for batch_start in range(0, count, batch_size):
+        request_rows, log_rows = [], []
+        batch = min(batch_size, count - batch_start)
+        batch_products = rng.choices(products, cum_weights=product_weights, k=batch)
+        for product_id, item_name in batch_products:
+            submitted = min(submitted + datetime.timedelta(seconds=rng.expovariate(1 / mean_gap)), end)
+            role = pick_role()
+            user_id = rng.choice(users[role])
+            tag = pick_tag[role]()
+            median, templates = tag_info[tag]
+            message = rng.choice(templates).format(item=item_name, n=rng.randint(1, 999))
+
+            quantity = None
+            if role == 'Sales Executive':
+                quantity = min(int(rng.paretovariate(1.5)), 500)
+                message += f'\n\nRequested product: {item_name}, Quantity: {quantity}'
+            else:
+                product_id = None
+
+            hours = rng.lognormvariate(math.log(median), FULFILLMENT_SIGMA)
+            status = fulfilled_time = vendor_name = solution = estimated_delivery = None
+            forwarded = 0
+            for log_status, request_status, share in pick_lifecycle[role]():
+                when = submitted + datetime.timedelta(hours=hours * share)
+                if when > end:
+                    break
+                status = request_status
+                if log_status == 'Fulfilled by Vendor':
+                    vendor_name = rng.choice(VENDORS)
+                    solution = rng.choice(SOLUTIONS)
+                    log_status = f'Fulfilled by Vendor: {vendor_name}'
+                if request_status == 'Fulfilled':
+                    fulfilled_time = when
+                elif request_status == 'In Transit':
+                    estimated_delivery = f"Will arrive by {(when + datetime.timedelta(days=4)).strftime('%Y-%m-%d')}"
+                elif request_status == 'Forwarded to Production':
+                    forwarded = 1
+                    estimated_delivery = 'Awaiting production schedule'
+                elif request_status == 'Ready for Shipment':
+                    estimated_delivery = f"Ready for shipment on {(when + datetime.timedelta(days=1)).strftime('%Y-%m-%d')}"
+                log_rows.append((request_id, log_status, when))
+
+            request_rows.append((request_id, user_id, role, message, tag, status, submitted, fulfilled_time,
+                                 vendor_name, solution, estimated_delivery, forwarded, product_id, quantity))
+            request_id += 1
+
+        conn.executemany('''
+            INSERT INTO requests (id, user_id, role, message, auto_tag, status, submitted_time, fulfilled_time,
+                                  vendor_name, solution, estimated_delivery, forwarded_to_production,
+                                  product_id, quantity)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', request_rows)
+        conn.executemany('INSERT INTO status_logs (request_id, status, timestamp) VALUES (?, ?, ?)', log_rows)
+        conn.commit()
+        logs_written += len(log_rows)
+    return logs_written
+
+
+def generate(conn, requests=DEFAULT_REQUESTS, inventory=DEFAULT_INVENTORY, users_per_role=DEFAULT_USERS_PER_ROLE,
+             days=DEFAULT_DAYS, end=None, seed=0, batch_size=BATCH_SIZE):
+    """Load a synthetic dataset into a migrated database, returning row counts"""
+    rng = random.Random(seed)
+    if end is None:
+        end = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    start = end - datetime.timedelta(days=days)
+
+    with bulk_load(conn):
+        users = generate_users(conn, users_per_role)
+        items = generate_inventory(conn, rng, inventory)
+        logs = generate_requests(conn, rng, requests, users, items, start, end, batch_size)
+
+    # Triggers were off during the load: rebuild the aggregates and index they maintain,
+    # and forecast from the new order history
+    report_store.rebuild(conn)
+    report_timeseries.rebuild(conn)
+    search.rebuild(conn)
+    forecast.rebuild(conn)
+    conn.execute('UPDATE change_versions SET version = version + 1, changed_at = CURRENT_TIMESTAMP')
+    conn.commit()
+    conn.execute('ANALYZE')
+    return {'users': sum(len(ids) for ids in users.values()), 'inventory': len(items),
+            'requests': requests, 'status_logs': logs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recreate the database filled with synthetic data')
+    parser.add_argument('--database', default=DATABASE_PATH, help='database file to (re)create')
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help='requests to generate')
+    parser.add_argument('--inventory', type=int, default=DEFAULT_INVENTORY, help='inventory SKUs')
+    parser.add_argument('--users-per-role', type=int, default=DEFAULT_USERS_PER_ROLE, help='users per role')
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help='days of history')
+    parser.add_argument('--end', type=datetime.date.fromisoformat,
+                        help='last day of history, YYYY-MM-DD (default: today)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='rows per transaction')
+    args = parser.parse_args(argv)
+
+    # Start from an empty database, like reset_db.py
+    for suffix in ('', '-wal', '-shm', '.init.lock'):
+        if os.path.exists(args.database + suffix):
+            os.remove(args.database + suffix)
+    if os.path.dirname(args.database):
+        os.makedirs(os.path.dirname(args.database), exist_ok=True)
+
+    started = time.perf_counter()
+    conn = create_pool(path=args.database).connect()
+    migrate(conn)
+    end = datetime.datetime.combine(args.end, datetime.time()) if args.end else None
+    counts = generate(conn, args.requests, args.inventory, args.users_per_role, args.days, end, args.seed,
+                      args.batch_size)
+    conn.close()
+
+    print(f"Generated {args.database} in {time.perf_counter() - started:.1f} s:")
+    for table, count in counts.items():
+        print(f"  {table}: {count}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
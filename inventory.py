@@ -0,0 +1,183 @@
+"""
+Inventory stock rules, race-free stock reservation and bulk updates.
+
+Sales orders reserve stock with one guarded UPDATE that checks availability,
+decrements the quantity and re-derives the status atomically, inside a
+transaction that took the write lock up front with BEGIN IMMEDIATE. Several
+gunicorn workers can therefore never oversell the same item.
+"""
+
+import collections
+import csv
+import json
+import random
+import sqlite3
+import time
+
+# Quantity thresholds for inventory status
+LOW_STOCK_THRESHOLD = 10
+
+# Units restocked by Production Complete when the order had no quantity
+DEFAULT_PRODUCTION_QUANTITY = 10
+
+# Retry policy for acquiring the write lock when the database stays busy
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05     # seconds, doubled after every attempt
+
+Reservation = collections.namedtuple(
+    'Reservation', ['reserved', 'item_id', 'quantity', 'remaining', 'status']
+)
+
+
+def stock_status(quantity):
+    """Derive the inventory status for a quantity"""
+    if quantity > LOW_STOCK_THRESHOLD:
+        return 'In Stock'
+    elif quantity > 0:
+        return 'Low Stock'
+    return 'Out of Stock'
+
+
+def is_busy_error(error):
+    """Check whether an sqlite3 error means the database is locked or busy"""
+    text = str(error).lower()
+    return 'locked' in text or 'busy' in text
+
+
+def begin_immediate(conn, retries=BUSY_RETRIES, backoff=BUSY_BACKOFF):
+    """Start a write transaction, retrying with jittered backoff on SQLITE_BUSY"""
+    attempt = 0
+    while True:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt >= retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+            attempt += 1
+
+
+def reserve_stock(conn, item_name, quantity):
+    """Reserve stock for an order inside the caller's write transaction
+
+    Only items that are 'In Stock' with at least the requested quantity are
+    decremented; the new status is derived in the same statement.
+    """
+    cursor = conn.execute(f'''
+        UPDATE inventory
+        SET quantity = MAX(quantity - ?, 0),
+            status = CASE
+                WHEN quantity - ? > {LOW_STOCK_THRESHOLD} THEN 'In Stock'
+                WHEN quantity - ? > 0 THEN 'Low Stock'
+                ELSE 'Out of Stock'
+            END
+        WHERE item_name = ? AND status = 'In Stock' AND quantity >= ?
+    ''', (quantity, quantity, quantity, item_name, quantity))
+    reserved = cursor.rowcount == 1
+
+    item = conn.execute('SELECT id, quantity, status FROM inventory WHERE item_name = ?',
+                        (item_name,)).fetchone()
+    if not item:
+        return Reservation(False, None, quantity, None, None)
+
+    return Reservation(reserved, item[0], quantity, item[1], item[2])
+
+
+# Rows per executemany batch in bulk inventory updates
+BULK_BATCH_SIZE = 500
+
+
+def parse_inventory_csv(stream):
+    """Yield inventory rows from a CSV text stream with an item_name,quantity header"""
+    for row in csv.DictReader(stream):
+        yield row
+
+
+def parse_inventory_ndjson(stream):
+    """Yield inventory rows from newline-delimited JSON, one object per line"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield {'error': f'Invalid JSON line: {e}'}
+
+
+def _validate_bulk_row(row):
+    """Normalize one bulk row to (item_name, quantity), raising ValueError if invalid"""
+    if not isinstance(row, dict):
+        raise ValueError('Each item must be an object')
+    if row.get('error'):
+        raise ValueError(row['error'])
+
+    item_name = str(row.get('item_name') or '').strip()
+    if not item_name:
+        raise ValueError('item_name is required')
+
+    try:
+        quantity = int(row.get('quantity'))
+    except (TypeError, ValueError):
+        raise ValueError('quantity must be an integer')
+    if quantity < 0:
+        raise ValueError('quantity cannot be negative')
+    return item_name, quantity
+
+
+def bulk_upsert(conn, rows, batch_size=BULK_BATCH_SIZE):
+    """Set quantities for many items, inserting unknown ones, inside the caller's transaction
+
+    Rows are consumed lazily, so a streaming parser can feed very large
+    files straight into the transaction. Returns one result dict per row.
+    """
+    results = []
+    seen = set()
+    batch = []
+
+    def flush():
+        names = [item_name for item_name, _, _ in batch]
+        existing = set()
+        # Stay well under SQLite's bound-parameter limit
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            existing.update(row[0] for row in conn.execute(
+                f'SELECT item_name FROM inventory WHERE item_name IN ({placeholders})', chunk
+            ))
+
+        conn.executemany('''
+            INSERT INTO inventory (item_name, quantity, status) VALUES (?, ?, ?)
+            ON CONFLICT (item_name) DO UPDATE SET quantity = excluded.quantity, status = excluded.status
+        ''', batch)
+
+        for item_name, quantity, status in batch:
+            created = item_name not in existing and item_name not in seen
+            seen.add(item_name)
+            results.append({
+                'item_name': item_name,
+                'quantity': quantity,
+                'status': status,
+                'result': 'created' if created else 'updated',
+            })
+        batch.clear()
+
+    for row in rows:
+        try:
+            item_name, quantity = _validate_bulk_row(row)
+        except ValueError as e:
+            # Keep results in input order
+            if batch:
+                flush()
+            results.append({'item_name': row.get('item_name') if isinstance(row, dict) else None,
+                            'result': 'error', 'error': str(e)})
+            continue
+
+        batch.append((item_name, quantity, stock_status(quantity)))
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    return results
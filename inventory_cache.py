@@ -0,0 +1,62 @@
+"""
+Read-through cache of the inventory table for one worker.
+
+Every read first checks the 'inventory' change counter, which triggers bump
+in the same transaction as any inventory write. The cached rows are only
+returned while the counter still has the value they were loaded at, so a
+worker never serves inventory older than what its own connection can see,
+whichever worker wrote last.
+"""
+
+import threading
+
+from change_versions import get_version
+
+INVENTORY_VERSION = 'inventory'
+
+
+class InventoryCache:
+    """Inventory rows cached per change version, with hit/miss counts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (version, rows by item name, rows by id)
+        self._snapshot = (None, [], [])
+        self.hits = 0
+        self.misses = 0
+
+    def _rows(self, conn):
+        version = get_version(conn, INVENTORY_VERSION)
+        snapshot = self._snapshot
+        if snapshot[0] == version:
+            with self._lock:
+                self.hits += 1
+            return snapshot
+
+        rows = conn.execute('SELECT * FROM inventory ORDER BY item_name').fetchall()
+        snapshot = (version, rows, sorted(rows, key=lambda row: row['id']))
+        with self._lock:
+            self.misses += 1
+            self._snapshot = snapshot
+        return snapshot
+
+    def by_name(self, conn):
+        """All inventory rows ordered by item name"""
+        return self._rows(conn)[1]
+
+    def by_id(self, conn):
+        """All inventory rows ordered by id"""
+        return self._rows(conn)[2]
+
+    def stats(self):
+        """Hit/miss counts for this worker"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'version': self._snapshot[0],
+            'items': len(self._snapshot[1]),
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Persistent background jobs.
+
+Side effects that the user does not need to wait for are written to the
+jobs table in the same transaction as the state change that causes them,
+and a worker thread in each app process drains the table. A job's effects
+and its 'done' mark are committed together, so a job interrupted by a crash
+or an error is simply rolled back and delivered again (at least once)
+without its effects ever being applied twice. Failed jobs are retried with
+exponential backoff and parked as 'failed' after MAX_ATTEMPTS.
+
+Run this file to drain the queue without the app, or to inspect it:
+
+    python jobs.py            # run every due job, then exit
+    python jobs.py --status   # count jobs by status
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import threading
+import traceback
+
+import forecast
+import notifications
+from db import create_pool
+from inventory import begin_immediate
+
+# Attempts before a job is parked as failed, and the first retry delay
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 5       # seconds, doubled after every failed attempt
+
+# How long an idle worker waits before looking for due jobs again
+POLL_SECONDS = 1.0
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register a function(conn, payload) that runs jobs of the given kind"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def create_table(conn):
+    """Create the jobs table"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        run_after TIMESTAMP NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP,
+        last_error TEXT
+    )
+    ''')
+    # Due jobs are found by a seek on pending rows only
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_pending "
+                 "ON jobs (run_after) WHERE status = 'pending'")
+
+
+def enqueue(conn, kind, payload):
+    """Add a job inside the caller's transaction; it runs once that commits"""
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    now = datetime.datetime.now()
+    conn.execute(
+        'INSERT INTO jobs (kind, payload, run_after, created_at) VALUES (?, ?, ?, ?)',
+        (kind, json.dumps(payload), now, now)
+    )
+
+
+def run_next(conn):
+    """Run the oldest due job, returning its id, or None when nothing is due"""
+    # Look without the write lock, so an idle poll never blocks request handlers
+    job = conn.execute(
+        "SELECT id, kind, payload, attempts FROM jobs "
+        "WHERE status = 'pending' AND run_after <= ? ORDER BY run_after, id LIMIT 1",
+        (datetime.datetime.now(),)
+    ).fetchone()
+    if conn.in_transaction:
+        conn.rollback()
+    if not job:
+        return None
+
+    job_id, kind, payload, attempts = job[0], job[1], job[2], job[3]
+    begin_immediate(conn)
+    # Another worker may have run or retried the job since: claim it as it was read
+    claimed = conn.execute(
+        "UPDATE jobs SET attempts = ? WHERE id = ? AND status = 'pending' AND attempts = ?",
+        (attempts + 1, job_id, attempts)
+    ).rowcount
+    if not claimed:
+        conn.rollback()
+        return job_id
+    try:
+        HANDLERS[kind](conn, json.loads(payload))
+        conn.execute("UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ?",
+                     (datetime.datetime.now(), job_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        _record_failure(conn, job_id, attempts + 1, traceback.format_exc())
+    return job_id
+
+
+def _record_failure(conn, job_id, attempts, error):
+    """Schedule a retry, or park the job once it has used up its attempts"""
+    now = datetime.datetime.now()
+    begin_immediate(conn)
+    if attempts >= MAX_ATTEMPTS:
+        conn.execute("UPDATE jobs SET status = 'failed', attempts = ?, finished_at = ?, last_error = ? "
+                     "WHERE id = ?", (attempts, now, error, job_id))
+    else:
+        run_after = now + datetime.timedelta(seconds=RETRY_BACKOFF * 2 ** (attempts - 1))
+        conn.execute('UPDATE jobs SET attempts = ?, run_after = ?, last_error = ? WHERE id = ?',
+                     (attempts, run_after, error, job_id))
+    conn.commit()
+
+
+def run_pending(conn, limit=None):
+    """Run due jobs until none are left (or limit ran), returning how many ran"""
+    count = 0
+    while limit is None or count < limit:
+        if run_next(conn) is None:
+            break
+        count += 1
+    return count
+
+
+def status_counts(conn):
+    """Number of jobs per status"""
+    return {row[0]: row[1] for row in conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')}
+
+
+class JobWorker:
+    """Daemon thread draining the jobs table for one app process"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        """Start the thread in this process (threads do not survive a fork)"""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='job-worker', daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        """Wake the worker after committing new jobs"""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(POLL_SECONDS)
+            self._wakeup.clear()
+            try:
+                conn = self.pool.acquire()
+                try:
+                    run_pending(conn)
+                    # Stale forecasts are queued from here, so page views never take the write lock
+                    if schedule_forecast_refresh(conn):
+                        run_pending(conn)
+                finally:
+                    self.pool.release(conn)
+            except Exception:
+                traceback.print_exc()
+
+
+@handler('restock')
+def restock(conn, payload):
+    """Add produced units to inventory and mark the item in stock"""
+    conn.execute('''
+        UPDATE inventory SET quantity = quantity + ?, status = 'In Stock'
+        WHERE id = ?
+    ''', (payload['quantity'], payload['product_id']))
+
+
+@handler('notify_stock_update')
+def notify_stock_update(conn, payload):
+    """Give every Warehouse Officer a 'Stock Update' notification for a restock"""
+    item = conn.execute('SELECT item_name FROM inventory WHERE id = ?', (payload['product_id'],)).fetchone()
+    if not item:
+        return
+    officers = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'Warehouse Officer'")]
+    if not officers:
+        return
+
+    # Production runs complete many requests at once
+    request_ids = payload.get('request_ids') or [payload['request_id']]
+    if len(request_ids) == 1:
+        completed = f"request #{request_ids[0]}"
+    else:
+        completed = 'requests ' + ', '.join(f'#{request_id}' for request_id in request_ids)
+    message = f"Production complete for {completed}: {payload['quantity']} x {item[0]} added to inventory"
+    notifications.notify(conn, officers, message, payload['product_id'], payload['quantity'])
+
+
+@handler('refresh_forecast')
+def refresh_forecast(conn, payload):
+    """Fold new orders into the demand series and recompute the reorder list"""
+    forecast.refresh(conn)
+
+
+def schedule_forecast_refresh(conn, force=False):
+    """Queue a forecast refresh if the stored one is stale (or force), returning whether one was queued"""
+    if not force and not forecast.is_stale(conn):
+        return False
+    begin_immediate(conn)
+    # Another request may have queued one already: re-check under the write lock
+    if ((not force and not forecast.is_stale(conn)) or
+            conn.execute("SELECT 1 FROM jobs WHERE kind = 'refresh_forecast' AND status = 'pending'").fetchone()):
+        conn.rollback()
+        return False
+    enqueue(conn, 'refresh_forecast', {})
+    conn.commit()
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run or inspect background jobs')
+    parser.add_argument('--status', action='store_true', help='only count jobs by status')
+    args = parser.parse_args(argv)
+
+    # migrations imports this module, so import it only when run as a script
+    from migrations import migrate
+
+    conn = create_pool().connect()
+    migrate(conn)
+    if not args.status:
+        print(f"Ran {run_pending(conn)} jobs.")
+    for status, count in sorted(status_counts(conn).items()):
+        print(f"{status}: {count}")
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Live change feed for the Warehouse and Production queues.
+
+Every state change of a request writes a status_logs row, so the feed tails
+status_logs by id: each poll is a rowid range seek returning the requests
+that changed since the client's cursor, and only those are sent, as an
+'upsert' of the rendered row when the request is in the subscriber's queue
+or a 'remove' when it is not (any more).
+
+Streams are Server-Sent Events. Each one holds a thread for its whole
+lifetime, so a worker serves at most LIVE_MAX_STREAMS of them, sends a
+heartbeat comment every HEARTBEAT_SECONDS (which is also how a dead client
+is noticed) and ends a stream after STREAM_SECONDS; the browser then
+reconnects with Last-Event-ID. Clients that cannot get a stream poll the
+same endpoint for JSON instead.
+"""
+
+import json
+import threading
+import time
+
+from queues import queue_where
+
+# Concurrent event streams per worker
+LIVE_MAX_STREAMS = 4
+
+# Seconds between status_logs polls, heartbeats, and before a stream is recycled
+POLL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 15
+STREAM_SECONDS = 300
+
+# Client reconnect delay (ms) sent with every stream
+RETRY_MS = 3000
+
+# status_logs rows read per poll
+BATCH_SIZE = 200
+
+
+class StreamSlots:
+    """Counting limit on the event streams open in this worker"""
+
+    def __init__(self, size=LIVE_MAX_STREAMS):
+        self.size = size
+        self._lock = threading.Lock()
+        self.open = 0
+        self.rejected = 0
+
+    def acquire(self):
+        with self._lock:
+            if self.open >= self.size:
+                self.rejected += 1
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+    def stats(self):
+        with self._lock:
+            return {'open': self.open, 'max': self.size, 'rejected': self.rejected}
+
+
+def latest_cursor(conn):
+    """Id of the newest status_logs row, where a new subscriber starts"""
+    return conn.execute('SELECT MAX(id) FROM status_logs').fetchone()[0] or 0
+
+
+def pooled_latest_cursor(pool):
+    """latest_cursor() on a connection held only for the query, for streams that outlive it"""
+    conn = pool.acquire()
+    try:
+        return latest_cursor(conn)
+    finally:
+        pool.release(conn)
+
+
+def fetch_changes(conn, role, after, queue_tag=None, limit=BATCH_SIZE):
+    """Requests changed since status_logs id `after`, as (events, new cursor)
+
+    Each event is (log_id, request row, in_queue); a request that changed
+    several times is reported once, with its current state.
+    """
+    rows = conn.execute(f'''
+        SELECT l.id AS log_id, r.*, u.username,
+               CASE WHEN {queue_where(role)} THEN 1 ELSE 0 END AS in_queue
+        FROM status_logs l
+        JOIN requests r ON r.id = l.request_id
+        JOIN users u ON u.id = r.user_id
+        WHERE l.id > ?
+        ORDER BY l.id
+        LIMIT ?
+    ''', (after, limit)).fetchall()
+    if not rows:
+        return [], after
+
+    latest = {}
+    for row in rows:
+        latest.pop(row['id'], None)
+        latest[row['id']] = row
+    events = []
+    for row in latest.values():
+        in_queue = bool(row['in_queue']) and (not queue_tag or row['auto_tag'] == queue_tag)
+        events.append((row['log_id'], row, in_queue))
+    return events, rows[-1]['log_id']
+
+
+def change_payload(row, in_queue, render_row):
+    """JSON-ready description of one changed request"""
+    payload = {'request_id': row['id'], 'action': 'upsert' if in_queue else 'remove'}
+    if in_queue:
+        payload['html'] = render_row(row)
+    return payload
+
+
+def poll(pool, role, after, queue_tag, render_row):
+    """One short poll: the pending changes and the cursor to continue from"""
+    conn = pool.acquire()
+    try:
+        events, cursor = fetch_changes(conn, role, after, queue_tag)
+    finally:
+        pool.release(conn)
+    return {
+        'events': [change_payload(row, in_queue, render_row) for _, row, in_queue in events],
+        'cursor': cursor,
+    }
+
+
+def _sse(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {data}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream(pool, role, after, queue_tag, render_row):
+    """Generate a Server-Sent Events stream
+
+    The caller takes a StreamSlots slot first and releases it when the
+    response is closed.
+    """
+    yield f'retry: {RETRY_MS}\n\n'
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < STREAM_SECONDS:
+        # Hold a pooled connection only for the poll itself, never while sleeping
+        conn = pool.acquire()
+        try:
+            events, after = fetch_changes(conn, role, after, queue_tag)
+        finally:
+            pool.release(conn)
+
+        # Events come in status_logs order, so the last id sent is the new cursor
+        for log_id, row, in_queue in events:
+            yield _sse(json.dumps(change_payload(row, in_queue, render_row)),
+                       event='change', event_id=log_id)
+            last_sent = time.monotonic()
+
+        if time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+            yield ': heartbeat\n\n'
+            last_sent = time.monotonic()
+        time.sleep(POLL_SECONDS)
@@ -0,0 +1,310 @@
+"""
+Request and SQL instrumentation, exposed in the Prometheus text format.
+
+Every pooled connection can be an InstrumentedConnection, whose cursors time
+each statement from execute() until its result set is exhausted (or the
+cursor is discarded) and count the rows it returned or changed. Statements
+are aggregated under their normalized text, with literals replaced by '?',
+so the number of series stays bounded. Statements slower than the configured
+threshold are also logged as warnings by this module's logger.
+
+Request hooks record a latency histogram per endpoint and a counter per
+response status. Figures are kept per worker process, like the caches, so
+with several gunicorn workers each scrape of /metrics describes the worker
+that answered it (see the pid in fours_worker_info).
+"""
+
+import bisect
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+# Histogram bucket upper bounds, in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# Statements slower than this are logged
+DEFAULT_SLOW_QUERY_MS = 100
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_PLACEHOLDER_ROWS = re.compile(r'\(\?, \.\.\.\)(?:\s*,\s*\(\?, \.\.\.\))+')
+_WHITESPACE = re.compile(r'\s+')
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """Statement text with literals and placeholder lists collapsed, for grouping"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = _PLACEHOLDER_LIST.sub('(?, ...)', sql)
+    return _PLACEHOLDER_ROWS.sub('(?, ...), ...', sql)
+
+
+class Histogram:
+    """Cumulative-bucket histogram; callers serialize access"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """[(upper bound label, observations <= bound)] including +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return result
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor reporting each statement's time and rows to its connection's Metrics"""
+
+    # Statement still being fetched (class defaults save an __init__ per cursor)
+    _statement = None
+    _seconds = 0.0
+    _rows = 0
+
+    def _start(self, sql, seconds):
+        if self.description is None:
+            # Not a query: nothing to fetch, rowcount is the number of rows changed
+            self.connection.metrics.observe_query(sql, seconds, max(self.rowcount, 0))
+        else:
+            self._statement, self._seconds, self._rows = sql, seconds, 0
+
+    def _finish(self):
+        sql = self._statement
+        if sql is not None:
+            self._statement = None
+            self.connection.metrics.observe_query(sql, self._seconds, self._rows)
+
+    def execute(self, sql, parameters=()):
+        if self._statement is not None:
+            self._finish()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._start(sql, time.perf_counter() - started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        if self._statement is not None:
+            self._finish()
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._start(sql, time.perf_counter() - started)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._seconds += time.perf_counter() - started
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._seconds += time.perf_counter() - started
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._seconds += time.perf_counter() - started
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._seconds += time.perf_counter() - started
+            self._finish()
+            raise
+        self._seconds += time.perf_counter() - started
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Statements read with a single fetchone() end when the cursor is dropped
+        if self._statement is not None:
+            self._finish()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements and commits are timed; see Metrics.connection_factory"""
+
+    metrics = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The built-in shortcuts run statements in C, bypassing the cursor methods
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        super().commit()
+        self.metrics.observe_query('COMMIT', time.perf_counter() - started, 0)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_label(value)}"' for name, value in labels.items()) + '}'
+
+
+class Metrics:
+    """Per-worker request and query statistics"""
+
+    def __init__(self, slow_query_ms=DEFAULT_SLOW_QUERY_MS):
+        self.slow_query_seconds = slow_query_ms / 1000.0
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = {}          # (endpoint, method) -> Histogram
+        self.responses = {}         # (endpoint, method, status) -> count
+        self.queries = {}           # normalized statement -> [count, seconds, rows]
+        self.query_time = Histogram(QUERY_BUCKETS)
+        self.slow_queries = 0
+
+    def connection_factory(self):
+        """InstrumentedConnection subclass reporting to this instance, for ConnectionPool"""
+        return type('InstrumentedConnection', (InstrumentedConnection,), {'metrics': self})
+
+    def init_app(self, app):
+        """Time every request of the app"""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            # Streamed bodies (exports, live feeds) are timed up to the first byte
+            self.observe_request(request.endpoint or 'unmatched', request.method,
+                                 response.status_code, time.perf_counter() - started)
+        return response
+
+    def observe_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            histogram = self.requests.get((endpoint, method))
+            if histogram is None:
+                histogram = self.requests[(endpoint, method)] = Histogram(REQUEST_BUCKETS)
+            histogram.observe(seconds)
+            key = (endpoint, method, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def observe_query(self, sql, seconds, rows):
+        statement = normalize_sql(sql)
+        with self._lock:
+            stats = self.queries.get(statement)
+            if stats is None:
+                stats = self.queries[statement] = [0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] += rows
+            self.query_time.observe(seconds)
+            slow = seconds >= self.slow_query_seconds
+            if slow:
+                self.slow_queries += 1
+        if slow:
+            self._log_slow_query(statement, seconds, rows)
+
+    def _log_slow_query(self, statement, seconds, rows):
+        where = f' in {request.endpoint}' if has_request_context() else ''
+        logger.warning('[4S pid %d] slow query (%.1f ms, %d rows%s): %s',
+                       os.getpid(), seconds * 1000, rows, where, statement)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            requests = {key: (h.cumulative(), h.sum, h.count) for key, h in self.requests.items()}
+            responses = dict(self.responses)
+            queries = {key: list(stats) for key, stats in self.queries.items()}
+            query_time = (self.query_time.cumulative(), self.query_time.sum, self.query_time.count)
+            slow_queries = self.slow_queries
+
+        lines = [
+            '# HELP fours_worker_info Worker process answering this scrape',
+            '# TYPE fours_worker_info gauge',
+            f'fours_worker_info{_labels(pid=os.getpid())} 1',
+            '# HELP fours_worker_start_time_seconds When this worker started collecting',
+            '# TYPE fours_worker_start_time_seconds gauge',
+            f'fours_worker_start_time_seconds {self.started}',
+            '# HELP fours_http_request_duration_seconds Time spent in the app per request',
+            '# TYPE fours_http_request_duration_seconds histogram',
+        ]
+        for (endpoint, method), (buckets, total, count) in sorted(requests.items()):
+            for bound, value in buckets:
+                lines.append(f'fours_http_request_duration_seconds_bucket'
+                             f'{_labels(endpoint=endpoint, method=method, le=bound)} {value}')
+            lines.append(f'fours_http_request_duration_seconds_sum{_labels(endpoint=endpoint, method=method)} {total}')
+            lines.append(f'fours_http_request_duration_seconds_count{_labels(endpoint=endpoint, method=method)} {count}')
+
+        lines += ['# HELP fours_http_responses_total Responses by endpoint and status code',
+                  '# TYPE fours_http_responses_total counter']
+        for (endpoint, method, status), count in sorted(responses.items()):
+            lines.append(f'fours_http_responses_total{_labels(endpoint=endpoint, method=method, status=status)} '
+                         f'{count}')
+
+        lines += ['# HELP fours_db_query_duration_seconds Time per SQL statement, including fetching',
+                  '# TYPE fours_db_query_duration_seconds histogram']
+        buckets, total, count = query_time
+        for bound, value in buckets:
+            lines.append(f'fours_db_query_duration_seconds_bucket{_labels(le=bound)} {value}')
+        lines += [f'fours_db_query_duration_seconds_sum {total}',
+                  f'fours_db_query_duration_seconds_count {count}']
+
+        for name, index, kind, help_text in (
+                ('fours_db_statements_total', 0, 'counter', 'Executions per normalized statement'),
+                ('fours_db_statement_seconds_total', 1, 'counter', 'Total time per normalized statement'),
+                ('fours_db_statement_rows_total', 2, 'counter', 'Rows returned or changed per statement')):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            for statement, stats in sorted(queries.items()):
+                lines.append(f'{name}{_labels(statement=statement)} {stats[index]}')
+
+        lines += ['# HELP fours_db_slow_queries_total Statements slower than the slow-query threshold',
+                  '# TYPE fours_db_slow_queries_total counter',
+                  f'fours_db_slow_queries_total {slow_queries}',
+                  '# HELP fours_db_slow_query_threshold_seconds Slow-query threshold',
+                  '# TYPE fours_db_slow_query_threshold_seconds gauge',
+                  f'fours_db_slow_query_threshold_seconds {self.slow_query_seconds}']
+        return '\n'.join(lines) + '\n'
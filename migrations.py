@@ -0,0 +1,433 @@
+"""
+Versioned schema migrations for the 4S database.
+
+Each migration is a (version, description, steps) entry in MIGRATIONS, where
+a step is either an SQL statement or a callable taking the connection.
+Applied versions are recorded in the schema_version table, and migrate()
+runs the pending ones in order, each inside its own transaction. Both
+app.py and reset_db.py build the schema through migrate(), and seeding the
+default inventory and users is itself a migration, so it runs exactly once.
+"""
+
+import contextlib
+import datetime
+import sqlite3
+
+from werkzeug.security import generate_password_hash
+
+import change_versions
+import forecast
+import jobs
+import notifications
+import report_store
+import report_timeseries
+import request_batch
+import search
+import tagging
+from product_matcher import ProductMatcher
+from queues import QUEUE_ROLES, queue_where
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+# Sample inventory items and default users created in a new database
+SAMPLE_INVENTORY = [
+    ('Product A', 50, 'In Stock'),
+    ('Product B', 25, 'In Stock'),
+    ('Product C', 0, 'Out of Stock'),
+    ('Product D', 10, 'Low Stock')
+]
+
+DEFAULT_USERS = [
+    ('sales', 'sales123', 'Sales Executive'),
+    ('warehouse', 'warehouse123', 'Warehouse Officer'),
+    ('production', 'production123', 'Production Planner'),
+    ('support', 'support123', 'Support Agent')
+]
+
+
+def _create_base_tables(conn):
+    """Create the original users, requests, status_logs and inventory tables"""
+    # Create Users table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL
+    )
+    ''')
+
+    # Create Requests table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        message TEXT NOT NULL,
+        auto_tag TEXT NOT NULL,
+        status TEXT NOT NULL,
+        submitted_time TIMESTAMP NOT NULL,
+        fulfilled_time TIMESTAMP,
+        vendor_name TEXT,
+        solution TEXT,
+        estimated_delivery TEXT,
+        forwarded_to_production INTEGER DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+
+    # Create Status_Logs table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS status_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        request_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        timestamp TIMESTAMP NOT NULL,
+        FOREIGN KEY (request_id) REFERENCES requests (id)
+    )
+    ''')
+
+    # Create Inventory table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS inventory (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_name TEXT UNIQUE NOT NULL,
+        quantity INTEGER NOT NULL,
+        status TEXT NOT NULL
+    )
+    ''')
+
+
+def _seed_defaults(conn):
+    """Insert whichever sample inventory items and default users are missing"""
+    conn.executemany('INSERT OR IGNORE INTO inventory (item_name, quantity, status) VALUES (?, ?, ?)',
+                     SAMPLE_INVENTORY)
+
+    for username, password, role in DEFAULT_USERS:
+        # PBKDF2 is slow, so only hash passwords for users that are actually inserted
+        if conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone():
+            continue
+        conn.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
+                     (username, generate_password_hash(password, method='pbkdf2:sha256'), role))
+
+
+# Rows read per chunk when backfilling existing requests
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def parse_order_line(message):
+    """Parse (product name, quantity) from a legacy "Requested product: X, Quantity: N" line"""
+    for line in message.split('\n'):
+        for marker in ("Requested product:", "Requested NEW product:"):
+            if marker in line:
+                parts = line.split(',')
+                product_name = parts[0].strip().replace(marker, "").strip()
+
+                # Try to extract quantity
+                quantity = None
+                if len(parts) > 1 and "Quantity:" in parts[1]:
+                    try:
+                        quantity = int(parts[1].replace("Quantity:", "").strip())
+                    except ValueError:
+                        quantity = None
+                return product_name, quantity
+    return None, None
+
+
+def _add_order_line_columns(conn):
+    """Add structured product_id and quantity columns to requests"""
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(requests)')]
+    if 'product_id' not in columns:
+        conn.execute('ALTER TABLE requests ADD COLUMN product_id INTEGER REFERENCES inventory (id)')
+    if 'quantity' not in columns:
+        conn.execute('ALTER TABLE requests ADD COLUMN quantity INTEGER')
+
+
+def _add_auto_tag_version_column(conn):
+    """Record which rules version auto-tagged a request (NULL for chosen and system tags)"""
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(requests)')]
+    if 'auto_tag_version' not in columns:
+        conn.execute('ALTER TABLE requests ADD COLUMN auto_tag_version INTEGER')
+
+
+def _backfill_order_lines(conn):
+    """Parse product and quantity out of existing request messages, once"""
+    items = conn.execute('SELECT id, item_name FROM inventory').fetchall()
+    item_ids = {row[1]: row[0] for row in items}
+    matcher = ProductMatcher()
+    matcher.load(items)
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            'SELECT id, message, forwarded_to_production FROM requests '
+            'WHERE id > ? AND product_id IS NULL ORDER BY id LIMIT ?',
+            (last_id, BACKFILL_CHUNK_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for request_id, message, forwarded in rows:
+            product_name, quantity = parse_order_line(message)
+            product_id = item_ids.get(product_name)
+
+            # Production Complete used to fall back to word matching for forwarded orders
+            if product_id is None and forwarded:
+                product = matcher.match(message)
+                if product:
+                    product_id = product[0]
+
+            if product_id is not None or quantity is not None:
+                updates.append((product_id, quantity, request_id))
+
+        conn.executemany('UPDATE requests SET product_id = ?, quantity = ? WHERE id = ?', updates)
+        last_id = rows[-1][0]
+
+
+def _track_inventory_changes(conn):
+    """Count inventory writes for the per-worker inventory caches"""
+    change_versions.track(conn, change_versions.INVENTORY, 'inventory')
+
+
+def _track_view_changes(conn):
+    """Count the writes each dashboard, report and export view depends on"""
+    change_versions.add_changed_at(conn)
+    change_versions.track(conn, change_versions.INVENTORY, 'inventory')
+    change_versions.track(conn, change_versions.REQUESTS, 'requests')
+    change_versions.track(conn, 'user_requests', 'requests', key='{row}.user_id')
+    for role in QUEUE_ROLES:
+        change_versions.track(conn, change_versions.queue_counter(role), 'requests',
+                              when=queue_where(role, '{row}.'))
+    for table in ('report_tag_stats', 'report_sla_breaches'):
+        change_versions.track(conn, change_versions.REPORTS, table)
+
+
+def _track_notification_changes(conn):
+    """Count each user's notification writes, for the Warehouse dashboard"""
+    change_versions.track(conn, 'notifications', 'notifications', key='{row}.user_id')
+
+
+def _track_forecast_changes(conn):
+    """Count forecast refreshes, for the reorder list on the dashboard and /reports"""
+    change_versions.track(conn, change_versions.FORECAST, 'forecast_state')
+
+
+MIGRATIONS = [
+    (1, 'Base tables', [
+        _create_base_tables,
+    ]),
+    (2, 'Dashboard queue indexes', [
+        # My Requests: WHERE user_id = ? ORDER BY submitted_time DESC
+        'CREATE INDEX IF NOT EXISTS idx_requests_user_submitted '
+        'ON requests (user_id, submitted_time)',
+        # Warehouse queue: auto_tag IN (...) AND status IN (...) ORDER BY submitted_time
+        'CREATE INDEX IF NOT EXISTS idx_requests_tag_status_submitted '
+        'ON requests (auto_tag, status, submitted_time)',
+        # Production queue: forwarded_to_production = 1 AND status = ? ORDER BY submitted_time
+        'CREATE INDEX IF NOT EXISTS idx_requests_forwarded_status_submitted '
+        'ON requests (forwarded_to_production, status, submitted_time)',
+        # Warehouse notification badge: user_id = ? AND auto_tag = ? AND status = ?
+        'CREATE INDEX IF NOT EXISTS idx_requests_user_tag_status '
+        'ON requests (user_id, auto_tag, status)',
+        # Status history per request
+        'CREATE INDEX IF NOT EXISTS idx_status_logs_request '
+        'ON status_logs (request_id, timestamp)',
+    ]),
+    (3, 'Report and export indexes', [
+        # Per-tag counts and fulfillment times, covered without touching the table
+        'CREATE INDEX IF NOT EXISTS idx_requests_tag_fulfilled '
+        'ON requests (auto_tag, fulfilled_time, submitted_time)',
+        # Export ordering
+        'CREATE INDEX IF NOT EXISTS idx_requests_submitted '
+        'ON requests (submitted_time)',
+        'ANALYZE',
+    ]),
+    (4, 'Structured order lines on requests', [
+        _add_order_line_columns,
+        _backfill_order_lines,
+        'CREATE INDEX IF NOT EXISTS idx_requests_product '
+        'ON requests (product_id)',
+    ]),
+    (5, 'Report aggregate store', [
+        report_store.create_tables,
+        report_store.rebuild,
+    ]),
+    (6, 'Dashboard pagination and tab filter indexes', [
+        # My Requests tabs: user_id = ? AND status = ? ORDER BY submitted_time DESC, id DESC
+        'CREATE INDEX IF NOT EXISTS idx_requests_user_status_submitted '
+        'ON requests (user_id, status, submitted_time)',
+        # My Requests by tag, and the notification badge (replaces idx_requests_user_tag_status)
+        'CREATE INDEX IF NOT EXISTS idx_requests_user_tag_status_submitted '
+        'ON requests (user_id, auto_tag, status, submitted_time)',
+        'DROP INDEX IF EXISTS idx_requests_user_tag_status',
+        # Warehouse queue pages in submitted order without sorting the whole queue
+        'CREATE INDEX IF NOT EXISTS idx_requests_warehouse_queue '
+        "ON requests (submitted_time) "
+        "WHERE auto_tag IN ('Stock Check', 'Urgent Delivery', 'Stock Update') "
+        "AND status IN ('Submitted', 'In Transit', 'Notification')",
+    ]),
+    (7, 'Default inventory and users', [
+        _seed_defaults,
+    ]),
+    (8, 'Idempotency keys for batch submissions', [
+        request_batch.create_idempotency_table,
+    ]),
+    (9, 'Auto-tagging rules', [
+        tagging.create_tables,
+        tagging.seed_rules,
+    ]),
+    (10, 'Inventory change counter', [
+        change_versions.create_table,
+        _track_inventory_changes,
+    ]),
+    (11, 'Change counters for conditional GET', [
+        _track_view_changes,
+    ]),
+    (12, 'Background jobs', [
+        jobs.create_table,
+    ]),
+    (13, 'Archival index', [
+        # Oldest fulfilled requests first, for archive.py
+        'CREATE INDEX IF NOT EXISTS idx_requests_archivable '
+        "ON requests (fulfilled_time) WHERE status = 'Fulfilled'",
+    ]),
+    (14, 'Request search index', [
+        search.create_tables,
+    ]),
+    (15, 'Daily fulfillment histograms', [
+        # Fulfillment transitions by time, for the daily report buckets
+        'CREATE INDEX IF NOT EXISTS idx_status_logs_fulfilled '
+        "ON status_logs (timestamp) WHERE status LIKE 'Fulfilled%'",
+        report_timeseries.create_tables,
+        report_timeseries.rebuild,
+    ]),
+    (16, 'Vendor support queue index', [
+        # Open support requests in submitted order, for the batch vendor portal
+        'CREATE INDEX IF NOT EXISTS idx_requests_support_queue '
+        "ON requests (submitted_time) "
+        "WHERE auto_tag IN ('Customer Complaint', 'Service Request', 'Support Request') "
+        "AND status NOT IN ('Fulfilled', 'Declined')",
+    ]),
+    (17, 'Stock-out forecasts', [
+        forecast.create_tables,
+        _track_forecast_changes,
+        forecast.rebuild,
+    ]),
+    # Existing tags were chosen from the dropdown or set by the system, so they stay NULL
+    (18, 'Auto-tag provenance', [
+        _add_auto_tag_version_column,
+    ]),
+    # Stock Update notifications were counted, exported and indexed like requests
+    (19, 'Leave system notifications out of reports and search', [
+        report_store.rebuild,
+        search.create_tables,
+    ]),
+    (20, 'Notifications table', [
+        notifications.create_table,
+        _track_notification_changes,
+        notifications.move_request_rows,
+        # The Warehouse queue no longer holds notifications
+        'DROP INDEX IF EXISTS idx_requests_warehouse_queue',
+        'CREATE INDEX IF NOT EXISTS idx_requests_warehouse_queue '
+        "ON requests (submitted_time) "
+        "WHERE auto_tag IN ('Stock Check', 'Urgent Delivery') "
+        "AND status IN ('Submitted', 'In Transit')",
+        # Without statistics the planner prefers the tag/status index and sorts
+        'ANALYZE idx_requests_warehouse_queue',
+        _track_view_changes,
+        search.create_triggers,
+        report_store.rebuild,
+    ]),
+]
+
+
+def _ensure_version_table(conn):
+    """Create the schema_version bookkeeping table"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL
+    )
+    ''')
+
+
+def current_version(conn):
+    """Get the highest applied migration version (0 for a new database)"""
+    _ensure_version_table(conn)
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def latest_version():
+    """Get the version the code expects the database to be at"""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def is_current(conn):
+    """Cheap startup check: is the database already at the latest version?"""
+    try:
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        return False
+    return (row[0] or 0) >= latest_version()
+
+
+@contextlib.contextmanager
+def migration_lock(database_path):
+    """Hold an exclusive file lock so only one worker initializes the database at a time"""
+    if fcntl is None:
+        yield
+        return
+
+    with open(database_path + '.init.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def migrate(conn, target=None):
+    """Apply all pending migrations up to target, returning the versions applied"""
+    if target is None:
+        target = latest_version()
+
+    applied = []
+    if current_version(conn) >= target:
+        return applied
+
+    for version, description, steps in MIGRATIONS:
+        if version > target:
+            break
+
+        # Take the write lock first so concurrent workers apply each step once
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM schema_version WHERE version = ?',
+                            (version,)).fetchone():
+                conn.rollback()
+                continue
+
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+
+            conn.execute(
+                'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                (version, description, datetime.datetime.now())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        applied.append(version)
+
+    return applied
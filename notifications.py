@@ -0,0 +1,87 @@
+"""
+Warehouse notifications.
+
+A notification is a message for one user, such as the Stock Update every
+Warehouse Officer gets when produced units are restocked. They live in their
+own table rather than as rows in requests, so reports, exports, search and
+the request queues only ever see requests somebody made. Unread
+notifications are shown above the Warehouse queue until acknowledged.
+"""
+
+import datetime
+
+# Unread notifications shown on the dashboard
+NOTIFICATIONS_SHOWN = 25
+
+# Tag and status the notifications had while they were stored in requests
+_LEGACY_TAG = 'Stock Update'
+_LEGACY_STATUS = 'Notification'
+
+
+def create_table(conn):
+    """Create the notifications table"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        message TEXT NOT NULL,
+        product_id INTEGER,
+        quantity INTEGER,
+        created_at TIMESTAMP NOT NULL,
+        acknowledged_at TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (product_id) REFERENCES inventory (id)
+    )
+    ''')
+    # A user's unread notifications, newest first, and the badge count
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notifications_unread '
+                 'ON notifications (user_id, id) WHERE acknowledged_at IS NULL')
+
+
+def move_request_rows(conn):
+    """Move the notifications written as requests rows into the notifications table, once"""
+    conn.execute('''
+        INSERT INTO notifications (user_id, message, product_id, quantity, created_at, acknowledged_at)
+        SELECT r.user_id, r.message, r.product_id, r.quantity, r.submitted_time,
+               CASE WHEN r.status = ? THEN NULL
+                    ELSE COALESCE((SELECT MAX(l.timestamp) FROM status_logs l WHERE l.request_id = r.id),
+                                  r.submitted_time)
+               END
+        FROM requests r
+        WHERE r.auto_tag = ?
+        ORDER BY r.id
+    ''', (_LEGACY_STATUS, _LEGACY_TAG))
+    conn.execute('DELETE FROM status_logs WHERE request_id IN (SELECT id FROM requests WHERE auto_tag = ?)',
+                 (_LEGACY_TAG,))
+    conn.execute('DELETE FROM requests WHERE auto_tag = ?', (_LEGACY_TAG,))
+
+
+def notify(conn, user_ids, message, product_id=None, quantity=None, now=None):
+    """Give each user a notification inside the caller's transaction"""
+    now = now or datetime.datetime.now()
+    conn.executemany('''
+        INSERT INTO notifications (user_id, message, product_id, quantity, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(user_id, message, product_id, quantity, now) for user_id in user_ids])
+
+
+def unread(conn, user_id, limit=NOTIFICATIONS_SHOWN):
+    """A user's newest unread notifications, and how many are unread in all"""
+    rows = conn.execute('''
+        SELECT * FROM notifications
+        WHERE user_id = ? AND acknowledged_at IS NULL
+        ORDER BY id DESC LIMIT ?
+    ''', (user_id, limit)).fetchall()
+    count = len(rows)
+    if count == limit:
+        count = conn.execute('SELECT COUNT(*) FROM notifications WHERE user_id = ? AND acknowledged_at IS NULL',
+                             (user_id,)).fetchone()[0]
+    return rows, count
+
+
+def acknowledge(conn, notification_id, user_id, now=None):
+    """Mark one of a user's notifications read, returning whether it was unread"""
+    return conn.execute(
+        'UPDATE notifications SET acknowledged_at = ? WHERE id = ? AND user_id = ? AND acknowledged_at IS NULL',
+        (now or datetime.datetime.now(), notification_id, user_id)
+    ).rowcount > 0
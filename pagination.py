@@ -0,0 +1,78 @@
+"""
+Keyset (seek) pagination helpers.
+
+Lists of requests are paged on (submitted_time, id) rather than OFFSET, so
+every page is an index seek no matter how deep the client has scrolled.
+Cursors are opaque url-safe strings encoding the last row's sort key.
+"""
+
+import base64
+import binascii
+import datetime
+import json
+
+
+class PaginationError(ValueError):
+    """Raised when a cursor or time filter from the client cannot be decoded"""
+
+
+def encode_cursor(submitted_time, row_id):
+    """Encode a row's (submitted_time, id) sort key as an opaque cursor"""
+    raw = json.dumps([str(submitted_time), int(row_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor back into its (submitted_time, id) sort key"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        submitted_time, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return str(submitted_time), int(row_id)
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise PaginationError(f"Invalid cursor: {cursor}")
+
+
+def seek_clause(cursor, descending=True, alias=''):
+    """Build the WHERE fragment and parameters that resume after a cursor"""
+    if not cursor:
+        return '', ()
+    submitted_time, row_id = decode_cursor(cursor)
+    op = '<' if descending else '>'
+    return f'({alias}submitted_time, {alias}id) {op} (?, ?)', (submitted_time, row_id)
+
+
+def through_clause(cursor, descending=True, alias=''):
+    """Build the WHERE fragment and parameters that stop at (and include) a cursor's row"""
+    if not cursor:
+        return '', ()
+    submitted_time, row_id = decode_cursor(cursor)
+    op = '>=' if descending else '<='
+    return f'({alias}submitted_time, {alias}id) {op} (?, ?)', (submitted_time, row_id)
+
+
+def page(rows, limit):
+    """Split limit + 1 fetched rows into the page and the cursor for the next one"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, encode_cursor(last['submitted_time'], last['id'])
+    return rows, None
+
+
+def parse_time(value):
+    """Normalize an ISO date/time query parameter to the stored timestamp format"""
+    if not value:
+        return None
+    try:
+        return str(datetime.datetime.fromisoformat(value))
+    except ValueError:
+        raise PaginationError(f"Invalid time: {value}")
+
+
+def parse_limit(value, default, maximum):
+    """Clamp a page-size query parameter to 1..maximum"""
+    try:
+        limit = int(value) if value else default
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum))
@@ -0,0 +1,146 @@
+"""
+In-memory product-name matcher.
+
+Resolves a free-text request message to an inventory item without querying
+the database once per word. It reproduces the original lookup exactly:
+
+    for word in message.split():
+        SELECT * FROM inventory WHERE item_name LIKE '%word%'   -- first row wins
+
+i.e. the first word (in message order) that is an ASCII case-insensitive
+substring of any item name selects the item with the lowest id containing
+it, with '%' and '_' inside a word still acting as LIKE wildcards.
+
+All item names are kept, in id order, in one lower-cased string separated by
+NUL characters, so each word is a single str.find() over that string and the
+leftmost hit is always the lowest-id item.
+"""
+
+import bisect
+import re
+import threading
+
+SEPARATOR = '\x00'
+
+# Upper bound on memoized word lookups per snapshot
+CACHE_SIZE = 10000
+
+# SQLite's LIKE only folds ASCII letters, so do the same here
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def fold(text):
+    """Lower-case ASCII letters only, matching SQLite LIKE"""
+    return text.translate(_ASCII_LOWER)
+
+
+def _like_regex(word):
+    """Compile a word containing LIKE wildcards into a regex confined to one name"""
+    parts = []
+    for char in word:
+        if char == '%':
+            parts.append(f'[^{SEPARATOR}]*')
+        elif char == '_':
+            parts.append(f'[^{SEPARATOR}]')
+        else:
+            parts.append(re.escape(char))
+    return re.compile(''.join(parts))
+
+
+class ProductMatcher:
+    """Index of inventory item names for first-match product lookup"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (cache, haystack, name offsets, (id, item_name) items in id order)
+        self._snapshot = ({}, '', [], [])
+        self._max_id = 0
+        # Highest id read from the database; add() must not move it, or rows
+        # other workers committed below a locally added id would be skipped
+        self._loaded_through = 0
+        self.loaded = False
+
+    def load(self, rows):
+        """Rebuild the index from (id, item_name) rows"""
+        items = sorted((row[0], row[1]) for row in rows)
+        with self._lock:
+            self._set_items(items)
+            self._loaded_through = items[-1][0] if items else 0
+            self.loaded = True
+
+    def add(self, item_id, item_name):
+        """Add one newly inserted inventory item"""
+        with self._lock:
+            current = self._snapshot[3]
+            if any(existing_id == item_id for existing_id, _ in current):
+                return
+            items = current + [(item_id, item_name)]
+            if item_id < self._max_id:
+                items.sort()
+            self._set_items(items)
+
+    def refresh(self, conn):
+        """Load the index, or pick up items inserted by other workers since the last load"""
+        if not self.loaded:
+            self.load(conn.execute('SELECT id, item_name FROM inventory').fetchall())
+            return
+
+        # Inventory rows are only ever inserted, so new rows always have higher ids
+        new_rows = conn.execute(
+            'SELECT id, item_name FROM inventory WHERE id > ? ORDER BY id',
+            (self._loaded_through,)
+        ).fetchall()
+        for row in new_rows:
+            self.add(row[0], row[1])
+        if new_rows:
+            with self._lock:
+                self._loaded_through = max(self._loaded_through, new_rows[-1][0])
+
+    def match(self, message):
+        """Get (id, item_name) of the product the message refers to, or None"""
+        for word in message.split():
+            item = self.match_word(word)
+            if item:
+                return item
+        return None
+
+    def match_word(self, word):
+        """Get (id, item_name) of the first item whose name contains the word"""
+        # Writers swap in a whole new snapshot, so readers never need the lock
+        cache, haystack, starts, items = self._snapshot
+        # A bare % would match the empty haystack and point before the first item
+        if not items:
+            return None
+
+        key = fold(word)
+        if key in cache:
+            return cache[key]
+
+        if SEPARATOR in key:
+            pos = -1
+        elif '%' in key or '_' in key:
+            found = _like_regex(key).search(haystack)
+            pos = found.start() if found else -1
+        else:
+            pos = haystack.find(key)
+
+        item = None
+        if pos != -1:
+            item = items[bisect.bisect_right(starts, pos) - 1]
+
+        if len(cache) >= CACHE_SIZE:
+            cache.clear()
+        cache[key] = item
+        return item
+
+    def _set_items(self, items):
+        """Swap in a new snapshot of the index (caller holds the lock)"""
+        starts = []
+        offset = 0
+        for _, name in items:
+            starts.append(offset)
+            offset += len(name) + 1
+
+        haystack = SEPARATOR.join(fold(name) for _, name in items)
+        self._snapshot = ({}, haystack, starts, items)
+        self._max_id = items[-1][0] if items else 0
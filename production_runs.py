@@ -0,0 +1,94 @@
+"""
+Production runs for the Production Planner queue.
+
+Forwarded requests are grouped by product into one run per product, sized
+to the total quantity its requests asked for (DEFAULT_PRODUCTION_QUANTITY
+for a request without one, as Production Complete does for a single
+request). Runs come off a priority heap keyed on the submitted time of
+their oldest request, moved URGENT_BOOST_HOURS earlier when any request in
+the run carries an urgency tag. The boost is a fixed shift, so the order of
+two runs never changes with the clock and a rendered list stays valid until
+the queue changes.
+
+Completing a run moves every request in it to Ready for Shipment and logs
+each transition, and in the same transaction queues one restock of the
+whole quantity and one Stock Update notification for the warehouse, as
+Production Complete does for a single request.
+"""
+
+import datetime
+import heapq
+
+import jobs
+from inventory import DEFAULT_PRODUCTION_QUANTITY
+from queues import production_queue_where
+
+# Tags that move a run ahead of older ones, and by how much
+URGENT_TAGS = ('Urgent Delivery',)
+URGENT_BOOST_HOURS = 48
+
+# Runs shown on the Production dashboard
+RUNS_SHOWN = 10
+
+
+def _priority(run):
+    """Heap key: the effective age of a run, earliest first"""
+    oldest = datetime.datetime.fromisoformat(run['oldest'])
+    if run['urgent']:
+        oldest -= datetime.timedelta(hours=URGENT_BOOST_HOURS)
+    return oldest, run['product_id']
+
+
+def pending_runs(conn, limit=RUNS_SHOWN):
+    """The limit highest-priority runs in the production queue, and how many runs there are"""
+    urgent = ', '.join('?' * len(URGENT_TAGS))
+    # GROUP BY +product_id: seek the queue index rather than walk every order line by product
+    runs = [dict(row) for row in conn.execute(f'''
+        SELECT r.product_id, i.item_name, i.quantity AS on_hand,
+               COUNT(*) AS requests,
+               SUM(COALESCE(r.quantity, ?)) AS quantity,
+               MIN(r.submitted_time) AS oldest,
+               SUM(r.auto_tag IN ({urgent})) AS urgent,
+               MAX(r.id) AS through_id
+        FROM requests r
+        JOIN inventory i ON i.id = r.product_id
+        WHERE {production_queue_where('r.')}
+        GROUP BY +r.product_id
+    ''', (DEFAULT_PRODUCTION_QUANTITY,) + URGENT_TAGS)]
+    return heapq.nsmallest(limit, runs, key=_priority), len(runs)
+
+
+def complete_run(conn, product_id, through_id, now=None):
+    """Complete a product's run inside the caller's write transaction
+
+    Only queued requests up to through_id (the newest one the planner was
+    shown) are included. Returns {'item_name', 'request_ids', 'quantity'},
+    or None when nothing for the product is queued any more.
+    """
+    now = now or datetime.datetime.now()
+    # The unary + keep SQLite on the (small) queue index instead of the product's whole history
+    members = sorted(tuple(row) for row in conn.execute(f'''
+        SELECT r.id, COALESCE(r.quantity, ?)
+        FROM requests r
+        WHERE +r.product_id = ? AND +r.id <= ? AND {production_queue_where('r.')}
+    ''', (DEFAULT_PRODUCTION_QUANTITY, product_id, through_id)))
+    item = conn.execute('SELECT item_name FROM inventory WHERE id = ?', (product_id,)).fetchone()
+    if not members or not item:
+        return None
+
+    request_ids = [row[0] for row in members]
+    quantity = sum(row[1] for row in members)
+    estimated_delivery = f"Ready for shipment on {(now + datetime.timedelta(days=1)).strftime('%Y-%m-%d')}"
+
+    conn.executemany("UPDATE requests SET status = 'Ready for Shipment', estimated_delivery = ? WHERE id = ?",
+                     [(estimated_delivery, request_id) for request_id in request_ids])
+    conn.executemany('INSERT INTO status_logs (request_id, status, timestamp) VALUES (?, ?, ?)',
+                     [(request_id, 'Production Complete', now) for request_id in request_ids])
+
+    # Restock the produced quantity and notify the warehouse in the background
+    payload = {'product_id': product_id, 'quantity': quantity,
+               'request_id': request_ids[0], 'request_ids': request_ids}
+    jobs.enqueue(conn, 'restock', payload)
+    jobs.enqueue(conn, 'notify_stock_update', payload)
+
+    return {'item_name': item[0], 'request_ids': request_ids, 'quantity': quantity}
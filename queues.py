@@ -0,0 +1,111 @@
+"""
+Dashboard request queues with keyset pagination.
+
+My Requests is paged newest first and the Warehouse / Production queues
+oldest first, all on (submitted_time, id), so every page is an index seek
+of at most one page of rows. Tab filters are applied in SQL on indexed
+columns instead of hiding rows in the browser.
+"""
+
+from pagination import page, seek_clause
+
+# Rows per dashboard page
+PAGE_SIZE = 25
+PAGE_SIZE_MAX = 100
+
+# My Requests tab filters (data-filter value -> status)
+MY_REQUEST_STATUS_FILTERS = {
+    'submitted': 'Submitted',
+    'in-transit': 'In Transit',
+    'fulfilled': 'Fulfilled',
+}
+
+# What each role's pending queue contains
+WAREHOUSE_QUEUE_TAGS = ('Stock Check', 'Urgent Delivery')
+WAREHOUSE_QUEUE_STATUSES = ('Submitted', 'In Transit')
+PRODUCTION_QUEUE_STATUS = 'Forwarded to Production'
+
+QUEUE_ROLES = ('Warehouse Officer', 'Production Planner')
+
+
+def quoted(values):
+    """SQL literal list of fixed values, for predicates that must match an index"""
+    return ', '.join(f"'{value}'" for value in values)
+
+
+def warehouse_queue_where(alias='r.'):
+    """Warehouse queue predicate on the given row alias ('r.', 'NEW.', ...)"""
+    return (
+        f"{alias}auto_tag IN ({quoted(WAREHOUSE_QUEUE_TAGS)}) "
+        f"AND {alias}status IN ({quoted(WAREHOUSE_QUEUE_STATUSES)})"
+    )
+
+
+def production_queue_where(alias='r.'):
+    """Production queue predicate on the given row alias"""
+    return f"{alias}forwarded_to_production = 1 AND {alias}status = '{PRODUCTION_QUEUE_STATUS}'"
+
+
+# The queue predicates are spelled out literally so they line up with the indexes
+WAREHOUSE_QUEUE_WHERE = warehouse_queue_where()
+PRODUCTION_QUEUE_WHERE = production_queue_where()
+
+
+def queue_where(role, alias='r.'):
+    """SQL predicate (on alias r by default) selecting a role's pending queue, or None"""
+    if role == 'Warehouse Officer':
+        return warehouse_queue_where(alias)
+    elif role == 'Production Planner':
+        return production_queue_where(alias)
+    return None
+
+
+def fetch_my_requests(conn, user_id, status=None, tag=None, cursor=None, limit=PAGE_SIZE):
+    """One page of a user's own requests, newest first, and the next cursor"""
+    conditions = ['user_id = ?']
+    params = [user_id]
+    if status:
+        conditions.append('status = ?')
+        params.append(status)
+    if tag:
+        conditions.append('auto_tag = ?')
+        params.append(tag)
+    seek, seek_params = seek_clause(cursor, descending=True)
+    if seek:
+        conditions.append(seek)
+        params.extend(seek_params)
+
+    rows = conn.execute(
+        f"SELECT * FROM requests WHERE {' AND '.join(conditions)} "
+        'ORDER BY submitted_time DESC, id DESC LIMIT ?',
+        params + [limit + 1]
+    ).fetchall()
+    return page(rows, limit)
+
+
+def fetch_pending_requests(conn, role, tag=None, status=None, cursor=None, limit=PAGE_SIZE):
+    """One page of a role's pending queue, oldest first, and the next cursor"""
+    where = queue_where(role)
+    if where is None:
+        return [], None
+
+    conditions = [f'({where})']
+    params = []
+    if tag:
+        conditions.append('r.auto_tag = ?')
+        params.append(tag)
+    if status:
+        conditions.append('r.status = ?')
+        params.append(status)
+    seek, seek_params = seek_clause(cursor, descending=False, alias='r.')
+    if seek:
+        conditions.append(seek)
+        params.extend(seek_params)
+
+    rows = conn.execute(
+        'SELECT r.*, u.username FROM requests r JOIN users u ON r.user_id = u.id '
+        f"WHERE {' AND '.join(conditions)} "
+        'ORDER BY r.submitted_time ASC, r.id ASC LIMIT ?',
+        params + [limit + 1]
+    ).fetchall()
+    return page(rows, limit)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Incrementally maintained aggregates for the /reports page.
+
+report_tag_stats keeps per-auto_tag request counts, fulfilled counts and the
+sum of fulfillment hours; report_sla_breaches indexes every fulfilled request
+that took longer than the SLA. The write paths update both inside their own
+transactions, so /reports reads a handful of rows per tag instead of
+scanning the whole requests table.
+
+Run this file to recompute the store from scratch and report any drift:
+
+    python report_store.py            # check for drift, then rebuild
+    python report_store.py --check    # only check
+"""
+
+import argparse
+import sys
+
+from db import create_pool
+from inventory import begin_immediate
+
+# Requests taking longer than this many days to fulfil breach the SLA
+SLA_DAYS = 2
+
+# Tolerance when comparing stored and recomputed average hours
+DRIFT_TOLERANCE = 1e-6
+
+# IN (...) lists are chunked to stay under SQLite's bound-parameter limit
+LOOKUP_CHUNK_SIZE = 500
+
+
+def create_tables(conn):
+    """Create the aggregate tables"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS report_tag_stats (
+        auto_tag TEXT PRIMARY KEY,
+        request_count INTEGER NOT NULL DEFAULT 0,
+        fulfilled_count INTEGER NOT NULL DEFAULT 0,
+        fulfillment_hours REAL NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS report_sla_breaches (
+        request_id INTEGER PRIMARY KEY,
+        days REAL NOT NULL,
+        FOREIGN KEY (request_id) REFERENCES requests (id)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_report_sla_breaches_days '
+                 'ON report_sla_breaches (days)')
+
+
+def _ensure_tag(conn, auto_tag):
+    """Make sure a stats row exists for the tag"""
+    conn.execute('INSERT OR IGNORE INTO report_tag_stats (auto_tag) VALUES (?)', (auto_tag,))
+
+
+def record_submission(conn, auto_tag, count=1):
+    """Count newly inserted requests for a tag (call inside the insert's transaction)"""
+    _ensure_tag(conn, auto_tag)
+    conn.execute('UPDATE report_tag_stats SET request_count = request_count + ? WHERE auto_tag = ?',
+                  (count, auto_tag))
+
+
+def record_fulfillment(conn, request_id, fulfilled_time):
+    """Account for a request about to get fulfilled_time set
+
+    Call this inside the same transaction, before the UPDATE of the request,
+    so a request that was already fulfilled has its old time replaced.
+    """
+    row = conn.execute('''
+        SELECT auto_tag,
+               JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time) AS old_days,
+               JULIANDAY(?) - JULIANDAY(submitted_time) AS new_days
+        FROM requests WHERE id = ?
+    ''', (fulfilled_time, request_id)).fetchone()
+    if not row:
+        return
+
+    auto_tag, old_days, new_days = row[0], row[1], row[2]
+    _ensure_tag(conn, auto_tag)
+
+    if old_days is not None:
+        conn.execute('''
+            UPDATE report_tag_stats
+            SET fulfilled_count = fulfilled_count - 1, fulfillment_hours = fulfillment_hours - ?
+            WHERE auto_tag = ?
+        ''', (old_days * 24, auto_tag))
+        conn.execute('DELETE FROM report_sla_breaches WHERE request_id = ?', (request_id,))
+
+    if new_days is not None:
+        conn.execute('''
+            UPDATE report_tag_stats
+            SET fulfilled_count = fulfilled_count + 1, fulfillment_hours = fulfillment_hours + ?
+            WHERE auto_tag = ?
+        ''', (new_days * 24, auto_tag))
+        if new_days > SLA_DAYS:
+            conn.execute('INSERT OR REPLACE INTO report_sla_breaches (request_id, days) VALUES (?, ?)',
+                         (request_id, new_days))
+
+
+def record_fulfillments(conn, request_ids, fulfilled_time):
+    """record_fulfillment() for many requests fulfilled at the same time, one update per tag"""
+    deltas = {}
+    breaches = []
+    removed = []
+    for i in range(0, len(request_ids), LOOKUP_CHUNK_SIZE):
+        chunk = request_ids[i:i + LOOKUP_CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        for request_id, auto_tag, old_days, new_days in conn.execute(f'''
+            SELECT id, auto_tag,
+                   JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time),
+                   JULIANDAY(?) - JULIANDAY(submitted_time)
+            FROM requests WHERE id IN ({placeholders})
+        ''', [fulfilled_time] + list(chunk)):
+            count, hours = deltas.get(auto_tag, (0, 0.0))
+            if old_days is not None:
+                count, hours = count - 1, hours - old_days * 24
+                removed.append((request_id,))
+            if new_days is not None:
+                count, hours = count + 1, hours + new_days * 24
+                if new_days > SLA_DAYS:
+                    breaches.append((request_id, new_days))
+            deltas[auto_tag] = (count, hours)
+
+    for tag in deltas:
+        _ensure_tag(conn, tag)
+    conn.executemany('''
+        UPDATE report_tag_stats
+        SET fulfilled_count = fulfilled_count + ?, fulfillment_hours = fulfillment_hours + ?
+        WHERE auto_tag = ?
+    ''', [delta + (tag,) for tag, delta in deltas.items()])
+    conn.executemany('DELETE FROM report_sla_breaches WHERE request_id = ?', removed)
+    conn.executemany('INSERT OR REPLACE INTO report_sla_breaches (request_id, days) VALUES (?, ?)',
+                     breaches)
+
+
+def record_retag(conn, request_id, new_tag):
+    """Move a request's contribution to another tag (call before updating auto_tag)"""
+    row = conn.execute('''
+        SELECT auto_tag, (JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time)) * 24
+        FROM requests WHERE id = ?
+    ''', (request_id,)).fetchone()
+    if row:
+        record_retags(conn, [(row[0], new_tag, row[1])])
+
+
+def record_retags(conn, moves):
+    """Move many requests between tags, given (old_tag, new_tag, fulfillment hours or None)"""
+    deltas = {}
+    for old_tag, new_tag, hours in moves:
+        if old_tag == new_tag:
+            continue
+        fulfilled = 0 if hours is None else 1
+        for tag, sign in ((old_tag, -1), (new_tag, 1)):
+            count, fulfilled_count, total_hours = deltas.get(tag, (0, 0, 0.0))
+            deltas[tag] = (count + sign, fulfilled_count + sign * fulfilled,
+                           total_hours + sign * (hours or 0))
+
+    for tag in deltas:
+        _ensure_tag(conn, tag)
+    conn.executemany('''
+        UPDATE report_tag_stats
+        SET request_count = request_count + ?,
+            fulfilled_count = fulfilled_count + ?,
+            fulfillment_hours = fulfillment_hours + ?
+        WHERE auto_tag = ?
+    ''', [delta + (tag,) for tag, delta in deltas.items()])
+
+
+def record_removals(conn, request_ids):
+    """Take requests about to be deleted (e.g. archived) out of the store (same transaction)"""
+    placeholders = ', '.join('?' * len(request_ids))
+    deltas = conn.execute(f'''
+        SELECT COUNT(*), COUNT(fulfilled_time),
+               TOTAL((JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time)) * 24), auto_tag
+        FROM requests
+        WHERE id IN ({placeholders})
+        GROUP BY auto_tag
+    ''', request_ids).fetchall()
+    conn.executemany('''
+        UPDATE report_tag_stats
+        SET request_count = request_count - ?,
+            fulfilled_count = fulfilled_count - ?,
+            fulfillment_hours = fulfillment_hours - ?
+        WHERE auto_tag = ?
+    ''', [tuple(row) for row in deltas])
+    conn.execute(f'DELETE FROM report_sla_breaches WHERE request_id IN ({placeholders})', request_ids)
+
+
+def get_request_types(conn):
+    """Request counts per tag, largest first"""
+    return conn.execute('''
+        SELECT auto_tag, request_count AS count
+        FROM report_tag_stats
+        WHERE request_count > 0
+        ORDER BY count DESC
+    ''').fetchall()
+
+
+def get_avg_fulfillment(conn):
+    """Average fulfillment hours per tag"""
+    return conn.execute('''
+        SELECT auto_tag, fulfillment_hours / fulfilled_count AS avg_hours
+        FROM report_tag_stats
+        WHERE fulfilled_count > 0
+        ORDER BY auto_tag
+    ''').fetchall()
+
+
+def get_sla_breaches(conn):
+    """Fulfilled requests that took longer than the SLA, slowest first"""
+    return conn.execute('''
+        SELECT r.id, r.role, r.auto_tag, r.message, b.days
+        FROM report_sla_breaches b
+        JOIN requests r ON r.id = b.request_id
+        ORDER BY b.days DESC
+    ''').fetchall()
+
+
+def _recompute(conn):
+    """Compute the aggregates directly from the requests table"""
+    stats = {}
+    for auto_tag, count, fulfilled, hours in conn.execute('''
+        SELECT auto_tag, COUNT(*), COUNT(fulfilled_time),
+               TOTAL((JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time)) * 24)
+        FROM requests
+        GROUP BY auto_tag
+    '''):
+        stats[auto_tag] = (count, fulfilled, hours)
+
+    breaches = {row[0]: row[1] for row in conn.execute(f'''
+        SELECT id, JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time) AS days
+        FROM requests
+        WHERE fulfilled_time IS NOT NULL
+          AND (JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time)) > {SLA_DAYS}
+    ''')}
+    return stats, breaches
+
+
+def check(conn):
+    """Compare the store against a full recomputation, returning a list of drift messages"""
+    expected_stats, expected_breaches = _recompute(conn)
+    stored_stats = {row[0]: (row[1], row[2], row[3]) for row in conn.execute(
+        'SELECT auto_tag, request_count, fulfilled_count, fulfillment_hours FROM report_tag_stats'
+    )}
+    stored_breaches = {row[0]: row[1] for row in conn.execute(
+        'SELECT request_id, days FROM report_sla_breaches'
+    )}
+
+    drift = []
+    for tag in sorted(set(expected_stats) | set(stored_stats)):
+        count, fulfilled, hours = expected_stats.get(tag, (0, 0, 0.0))
+        s_count, s_fulfilled, s_hours = stored_stats.get(tag, (0, 0, 0.0))
+        if count != s_count or fulfilled != s_fulfilled:
+            drift.append(f"{tag}: counts {s_count}/{s_fulfilled}, expected {count}/{fulfilled}")
+        elif fulfilled and abs(hours / fulfilled - s_hours / s_fulfilled) > DRIFT_TOLERANCE:
+            drift.append(f"{tag}: avg hours {s_hours / s_fulfilled:.6f}, expected {hours / fulfilled:.6f}")
+
+    missing = set(expected_breaches) - set(stored_breaches)
+    extra = set(stored_breaches) - set(expected_breaches)
+    if missing:
+        drift.append(f"SLA breaches missing: {sorted(missing)}")
+    if extra:
+        drift.append(f"SLA breaches not expected: {sorted(extra)}")
+    return drift
+
+
+def rebuild(conn):
+    """Recompute the store from scratch (caller commits)"""
+    stats, breaches = _recompute(conn)
+    conn.execute('DELETE FROM report_tag_stats')
+    conn.execute('DELETE FROM report_sla_breaches')
+    conn.executemany(
+        'INSERT INTO report_tag_stats (auto_tag, request_count, fulfilled_count, fulfillment_hours) '
+        'VALUES (?, ?, ?, ?)',
+        [(tag,) + values for tag, values in stats.items()]
+    )
+    conn.executemany('INSERT INTO report_sla_breaches (request_id, days) VALUES (?, ?)',
+                     breaches.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check and rebuild the /reports aggregate store')
+    parser.add_argument('--check', action='store_true', help='only report drift, do not rebuild')
+    args = parser.parse_args(argv)
+
+    # migrations imports this module, so import it only when run as a script
+    from migrations import migrate
+
+    conn = create_pool().connect()
+    migrate(conn)
+    begin_immediate(conn)
+    drift = check(conn)
+    for line in drift:
+        print(f"Drift: {line}")
+    if not drift:
+        print("Report store matches the requests table.")
+
+    if args.check:
+        conn.rollback()
+    else:
+        rebuild(conn)
+        conn.commit()
+        print("Report store rebuilt.")
+    conn.close()
+    return 1 if drift and args.check else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Daily fulfillment-time percentiles for the /reports page.
+
+The first time a request reaches Fulfilled (a status_logs row 'Fulfilled'
+or 'Fulfilled by Vendor: ...') is an event on the day it was logged, worth
+the hours since the request was submitted. Events are counted per auto_tag
+and day in log-spaced histograms: HISTOGRAM_BUCKETS counters in an
+array('I'), BUCKETS_PER_DOUBLING to every doubling of the time, so
+p50/p90/p99 read from one are within about 4.5% of the exact value and
+merging days or tags is adding arrays.
+
+Finished days are written once to report_daily_fulfillment and never
+recomputed, so they also survive archival. Today's histograms are kept per
+worker by DailyFulfillment, which only reads the status_logs rows appended
+since it last looked; a page view costs the stored rows of the days shown
+plus that increment.
+
+Run this file to recompute the finished days from status_logs:
+
+    python report_timeseries.py
+"""
+
+import argparse
+import array
+import datetime
+import math
+import operator
+import sys
+import threading
+
+from db import create_pool
+from inventory import begin_immediate
+from report_store import SLA_DAYS
+
+# Histogram layout: bucket 0 holds everything under a minute, bucket i >= 1
+# holds [BUCKET_MIN_HOURS * 2**((i - 1) / 8), BUCKET_MIN_HOURS * 2**(i / 8))
+BUCKET_MIN_HOURS = 1 / 60
+BUCKETS_PER_DOUBLING = 8
+HISTOGRAM_BUCKETS = 160     # the last one is open-ended, from about 1.5 years
+
+PERCENTILES = (50, 90, 99)
+
+# Days shown on /reports by default, and the most a request may ask for
+REPORT_DAYS = 14
+REPORT_DAYS_MAX = 90
+
+# First transitions into Fulfilled, with the hours they took
+_EVENTS = '''
+    SELECT date(l.timestamp) AS day, r.auto_tag,
+           (JULIANDAY(l.timestamp) - JULIANDAY(r.submitted_time)) * 24 AS hours
+    FROM status_logs l
+    JOIN requests r ON r.id = l.request_id
+    WHERE l.status LIKE 'Fulfilled%' AND {where}
+      AND NOT EXISTS (
+          SELECT 1 FROM status_logs e
+          WHERE e.request_id = l.request_id AND e.status LIKE 'Fulfilled%'
+            AND (e.timestamp, e.id) < (l.timestamp, l.id)
+      )
+'''
+
+
+def bucket_of(hours):
+    """Histogram bucket of a fulfillment time"""
+    if hours < BUCKET_MIN_HOURS:
+        return 0
+    index = 1 + int(math.log2(hours / BUCKET_MIN_HOURS) * BUCKETS_PER_DOUBLING)
+    return min(index, HISTOGRAM_BUCKETS - 1)
+
+
+def bucket_hours(index):
+    """Representative time of a bucket (its geometric middle)"""
+    if index == 0:
+        return BUCKET_MIN_HOURS / 2
+    return BUCKET_MIN_HOURS * 2 ** ((index - 0.5) / BUCKETS_PER_DOUBLING)
+
+
+class FulfillmentHistogram:
+    """Fulfillment times of one tag and day: bucket counts plus exact count, breaches and sum"""
+
+    __slots__ = ('counts', 'count', 'breaches', 'hours')
+
+    def __init__(self):
+        self.counts = array.array('I', bytes(4 * HISTOGRAM_BUCKETS))
+        self.count = 0
+        self.breaches = 0
+        self.hours = 0.0
+
+    def add(self, hours):
+        self.counts[bucket_of(hours)] += 1
+        self.count += 1
+        self.breaches += hours > SLA_DAYS * 24
+        self.hours += hours
+
+    def merge(self, other):
+        self.counts = array.array('I', map(operator.add, self.counts, other.counts))
+        self.count += other.count
+        self.breaches += other.breaches
+        self.hours += other.hours
+        return self
+
+    @classmethod
+    def combine(cls, histograms):
+        """One histogram of many, summing each bucket across all of them at once"""
+        combined = cls()
+        if histograms:
+            combined.counts = array.array('I', map(sum, zip(*(h.counts for h in histograms))))
+            combined.count = sum(h.count for h in histograms)
+            combined.breaches = sum(h.breaches for h in histograms)
+            combined.hours = sum(h.hours for h in histograms)
+        return combined
+
+    def percentile(self, pct):
+        """Approximate fulfillment hours at the given percentile (None when empty)"""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * pct / 100))
+        seen = 0
+        for index, value in enumerate(self.counts):
+            seen += value
+            if seen >= rank:
+                return bucket_hours(index)
+        return bucket_hours(HISTOGRAM_BUCKETS - 1)
+
+    def summary(self):
+        """Count, breaches, mean and PERCENTILES, for templates"""
+        result = {
+            'count': self.count,
+            'breaches': self.breaches,
+            'avg_hours': self.hours / self.count if self.count else None,
+        }
+        for pct in PERCENTILES:
+            result[f'p{pct}'] = self.percentile(pct)
+        return result
+
+    def to_blob(self):
+        """Bucket counts as bytes, without the trailing empty buckets"""
+        last = max((index for index, value in enumerate(self.counts) if value), default=-1)
+        return self.counts[:last + 1].tobytes()
+
+    @classmethod
+    def from_row(cls, row):
+        histogram = cls()
+        stored = array.array('I', row['histogram'])
+        histogram.counts[:len(stored)] = stored
+        histogram.count = row['fulfilled_count']
+        histogram.breaches = row['breach_count']
+        histogram.hours = row['fulfillment_hours']
+        return histogram
+
+
+def create_tables(conn):
+    """Create the persisted days and the marker of how far they go"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS report_daily_fulfillment (
+        day TEXT NOT NULL,
+        auto_tag TEXT NOT NULL,
+        fulfilled_count INTEGER NOT NULL,
+        breach_count INTEGER NOT NULL,
+        fulfillment_hours REAL NOT NULL,
+        histogram BLOB NOT NULL,
+        PRIMARY KEY (day, auto_tag)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS report_daily_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        closed_through TEXT
+    )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO report_daily_state (id, closed_through) VALUES (1, NULL)')
+
+
+def _histograms(conn, where, params):
+    """{(day, auto_tag): histogram} of the events matching where"""
+    histograms = {}
+    for day, auto_tag, hours in conn.execute(_EVENTS.format(where=where), params):
+        histogram = histograms.get((day, auto_tag))
+        if histogram is None:
+            histogram = histograms[(day, auto_tag)] = FulfillmentHistogram()
+        histogram.add(hours)
+    return histograms
+
+
+def _close(conn, today):
+    """Persist every finished day not stored yet (inside the caller's write transaction)"""
+    closed = conn.execute('SELECT closed_through FROM report_daily_state WHERE id = 1').fetchone()[0]
+    yesterday = str(today - datetime.timedelta(days=1))
+    if closed is not None and closed >= yesterday:
+        return 0
+
+    where, params = 'l.timestamp < ?', [str(today)]
+    if closed is not None:
+        where += ' AND l.timestamp >= ?'
+        params.append(str(datetime.date.fromisoformat(closed) + datetime.timedelta(days=1)))
+    histograms = _histograms(conn, where, params)
+
+    conn.executemany('''
+        INSERT OR REPLACE INTO report_daily_fulfillment
+            (day, auto_tag, fulfilled_count, breach_count, fulfillment_hours, histogram)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(day, auto_tag, h.count, h.breaches, h.hours, h.to_blob())
+          for (day, auto_tag), h in histograms.items()])
+    conn.execute('UPDATE report_daily_state SET closed_through = ? WHERE id = 1', (yesterday,))
+    return len(histograms)
+
+
+def close_days(conn, today=None):
+    """Persist the days that ended since the last call, in its own transaction"""
+    today = today or datetime.date.today()
+    closed = conn.execute('SELECT closed_through FROM report_daily_state WHERE id = 1').fetchone()[0]
+    if closed is not None and closed >= str(today - datetime.timedelta(days=1)):
+        return 0
+
+    # Another worker may be closing the same days: re-check under the write lock
+    begin_immediate(conn)
+    try:
+        stored = _close(conn, today)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return stored
+
+
+def rebuild(conn, today=None):
+    """Recompute every finished day from status_logs (caller commits)"""
+    conn.execute('DELETE FROM report_daily_fulfillment')
+    conn.execute('UPDATE report_daily_state SET closed_through = NULL WHERE id = 1')
+    return _close(conn, today or datetime.date.today())
+
+
+def stored_days(conn, first_day, last_day):
+    """{(day, auto_tag): histogram} persisted for the days first_day..last_day"""
+    return {(row['day'], row['auto_tag']): FulfillmentHistogram.from_row(row) for row in conn.execute(
+        'SELECT * FROM report_daily_fulfillment WHERE day BETWEEN ? AND ?',
+        (str(first_day), str(last_day))
+    )}
+
+
+class DailyFulfillment:
+    """Today's histograms for one worker, advanced by the status_logs rows added since"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = None
+        self._last_log_id = 0
+        self._today = {}            # auto_tag -> FulfillmentHistogram
+
+    def today(self, conn):
+        """{auto_tag: histogram} of today's events so far"""
+        day = datetime.date.today()
+        with self._lock:
+            # Log ids are assigned in commit order, so everything up to the newest one is visible
+            last_log_id = conn.execute('SELECT MAX(id) FROM status_logs').fetchone()[0] or 0
+            if self._day != day:
+                # First use, or midnight passed: store the finished days and start today afresh
+                close_days(conn, day)
+                histograms = _histograms(conn, 'l.timestamp >= ? AND l.id <= ?', [str(day), last_log_id])
+                self._today = {tag: h for (_, tag), h in histograms.items()}
+                self._day = day
+            elif last_log_id > self._last_log_id:
+                histograms = _histograms(conn, 'l.id > ? AND l.id <= ?', [self._last_log_id, last_log_id])
+                for (event_day, tag), histogram in histograms.items():
+                    if event_day == str(day):
+                        self._today.setdefault(tag, FulfillmentHistogram()).merge(histogram)
+            self._last_log_id = last_log_id
+            return {tag: FulfillmentHistogram().merge(h) for tag, h in self._today.items()}
+
+    def report(self, conn, days=REPORT_DAYS):
+        """Per-tag summaries over the last `days` days and one summary per day, oldest first"""
+        last_day = datetime.date.today()
+        first_day = last_day - datetime.timedelta(days=days - 1)
+        histograms = stored_days(conn, first_day, last_day - datetime.timedelta(days=1))
+        for tag, histogram in self.today(conn).items():
+            histograms[(str(last_day), tag)] = histogram
+
+        by_tag = {}
+        by_day = {str(first_day + datetime.timedelta(days=offset)): [] for offset in range(days)}
+        for (day, tag), histogram in histograms.items():
+            by_tag.setdefault(tag, []).append(histogram)
+            by_day[day].append(histogram)
+        by_tag = {tag: FulfillmentHistogram.combine(group) for tag, group in by_tag.items()}
+        by_day = {day: FulfillmentHistogram.combine(group) for day, group in by_day.items()}
+
+        return {
+            'tags': [dict(auto_tag=tag, **by_tag[tag].summary()) for tag in sorted(by_tag)],
+            'days': [dict(day=day, **by_day[day].summary()) for day in sorted(by_day)],
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recompute the daily fulfillment histograms')
+    parser.parse_args(argv)
+
+    # migrations imports this module, so import it only when run as a script
+    from migrations import migrate
+
+    conn = create_pool().connect()
+    migrate(conn)
+    begin_immediate(conn)
+    stored = rebuild(conn)
+    closed = conn.execute('SELECT closed_through FROM report_daily_state WHERE id = 1').fetchone()[0]
+    conn.commit()
+    conn.close()
+    print(f"Stored {stored} day/tag histograms through {closed}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
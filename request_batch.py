@@ -0,0 +1,249 @@
+"""
+Batch request submission for integrations.
+
+A batch is stock-checked as a whole: every inventory row the batch refers
+to is read once, reservations are applied to that snapshot in submission
+order using the same rules as submit_request(), and the results are written
+back with executemany: one UPDATE per touched item and one INSERT per status
+log. Requests are inserted one statement each, to read their ids from
+cursor.lastrowid. The caller holds the write lock (BEGIN IMMEDIATE) for
+the whole batch, so the snapshot cannot go stale.
+
+Retries are made safe with idempotency keys: the response of a committed
+batch is stored under the caller's key and returned again on replay.
+"""
+
+import datetime
+import hashlib
+import json
+
+import report_store
+from inventory import stock_status
+
+# Largest batch accepted in one call
+MAX_BATCH_SIZE = 1000
+
+# IN (...) lists are chunked to stay under SQLite's bound-parameter limit
+LOOKUP_CHUNK_SIZE = 500
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused with a different batch"""
+
+
+def create_idempotency_table(conn):
+    """Create the table that remembers responses of committed batches"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        user_id INTEGER NOT NULL,
+        idempotency_key TEXT NOT NULL,
+        request_hash TEXT NOT NULL,
+        response TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (user_id, idempotency_key)
+    )
+    ''')
+
+
+def batch_hash(items):
+    """Stable fingerprint of a batch, to detect a key reused for different content"""
+    return hashlib.sha256(json.dumps(items, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def find_replay(conn, user_id, key, request_hash):
+    """Get the stored response for a replayed batch, or None for a new key"""
+    row = conn.execute(
+        'SELECT request_hash, response FROM idempotency_keys WHERE user_id = ? AND idempotency_key = ?',
+        (user_id, key)
+    ).fetchone()
+    if not row:
+        return None
+    if row[0] != request_hash:
+        raise IdempotencyConflict(f"Idempotency key {key} was already used for a different batch")
+    return json.loads(row[1])
+
+
+def save_response(conn, user_id, key, request_hash, response):
+    """Remember a batch response under its idempotency key (same transaction as the batch)"""
+    conn.execute(
+        'INSERT INTO idempotency_keys (user_id, idempotency_key, request_hash, response, created_at) '
+        'VALUES (?, ?, ?, ?, ?)',
+        (user_id, key, request_hash, json.dumps(response), datetime.datetime.now())
+    )
+
+
+def _parse_quantity(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 1
+
+
+def _load_stock(conn, names):
+    """Read the inventory rows a batch refers to, keyed by item name"""
+    stock = {}
+    names = sorted(names)
+    for i in range(0, len(names), LOOKUP_CHUNK_SIZE):
+        chunk = names[i:i + LOOKUP_CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        for row in conn.execute(
+            f'SELECT id, item_name, quantity, status FROM inventory WHERE item_name IN ({placeholders})',
+            chunk
+        ):
+            stock[row[1]] = {'id': row[0], 'quantity': row[2], 'status': row[3]}
+    return stock
+
+
+def submit_batch(conn, user_id, role, items, matcher, tag_engine, now=None):
+    """Stock-check and insert a batch of requests inside the caller's write transaction
+
+    Returns (results, created_items) where results has one dict per input
+    item and created_items lists (id, item_name) of new inventory rows.
+    """
+    submitted_time = now or datetime.datetime.now()
+    results = [None] * len(items)
+
+    # First pass: validate and work out which products each order refers to
+    orders = []
+    names = set()
+    if role == 'Sales Executive':
+        matcher.refresh(conn)
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('message'), str) or not item['message']:
+            results[index] = {'index': index, 'result': 'error', 'error': 'message is required'}
+            continue
+        invalid = [field for field in ('tag', 'product', 'new_product_name')
+                   if item.get(field) is not None and not isinstance(item[field], str)]
+        if invalid:
+            results[index] = {'index': index, 'result': 'error', 'error': f'{invalid[0]} must be a string'}
+            continue
+
+        order = {
+            'index': index,
+            'message': item['message'],
+            'tag': item.get('tag'),
+            'tag_version': None,
+            'product_name': item.get('product') or '',
+            'new_product_name': '',
+            'quantity': None,
+        }
+        if role == 'Sales Executive':
+            order['quantity'] = _parse_quantity(item.get('quantity', '1'))
+            if order['product_name'] == 'new_product':
+                order['new_product_name'] = item.get('new_product_name') or ''
+                names.add(order['new_product_name'])
+            elif not order['product_name']:
+                # Same first-word match submit_request() uses when no product is selected
+                product = matcher.match(order['message'])
+                if product:
+                    order['product_name'] = product[1]
+            names.add(order['product_name'])
+        orders.append(order)
+
+    # Auto-tag every item that came without a tag in one pass
+    untagged = [order for order in orders if not order['tag']]
+    if untagged:
+        tag_engine.refresh(conn)
+        tags = tag_engine.tag_many([order['message'] for order in untagged], role)
+        for order, tag in zip(untagged, tags):
+            order['tag'] = tag
+            order['tag_version'] = tag_engine.version
+
+    names.discard('')
+    names.discard('new_product')
+    stock = _load_stock(conn, names)
+
+    # Second pass: apply the submit_request() rules in order against the snapshot
+    touched = {}
+    created_items = []
+    rows = []
+    for order in orders:
+        message = order['message']
+        product_name = order['product_name']
+        quantity = order['quantity']
+        status = 'Submitted'
+        estimated_delivery = None
+        forwarded_to_production = 0
+        product_id = None
+        warning = None
+
+        if role == 'Sales Executive':
+            new_product_name = order['new_product_name']
+            if product_name == 'new_product' and new_product_name:
+                product_name = new_product_name
+                if new_product_name in stock:
+                    warning = 'Error adding new product: UNIQUE constraint failed: inventory.item_name'
+                else:
+                    # Add new product to inventory as Out of Stock and forward to production
+                    cursor = conn.execute(
+                        'INSERT INTO inventory (item_name, quantity, status) VALUES (?, ?, ?)',
+                        (new_product_name, 0, 'Out of Stock')
+                    )
+                    stock[new_product_name] = {'id': cursor.lastrowid, 'quantity': 0, 'status': 'Out of Stock'}
+                    created_items.append((cursor.lastrowid, new_product_name))
+                    status = 'Forwarded to Production'
+                    forwarded_to_production = 1
+                    estimated_delivery = "New product awaiting production"
+                    message += f"\n\nRequested NEW product: {new_product_name}, Quantity: {quantity}"
+
+            if product_name and product_name not in message and product_name != 'new_product':
+                message += f"\n\nRequested product: {product_name}, Quantity: {quantity}"
+
+            item = stock.get(product_name)
+            if item and product_name != 'new_product':
+                product_id = item['id']
+                if item['status'] == 'In Stock' and item['quantity'] >= quantity:
+                    # Reserve the stock and re-derive the item's status
+                    item['quantity'] = max(item['quantity'] - quantity, 0)
+                    item['status'] = stock_status(item['quantity'])
+                    touched[item['id']] = item
+                    status = 'In Transit'
+                    delivery_date = datetime.datetime.now() + datetime.timedelta(days=4)
+                    estimated_delivery = f"Will arrive by {delivery_date.strftime('%Y-%m-%d')}"
+                else:
+                    # Product exists but not enough in stock, forward to production
+                    status = 'Forwarded to Production'
+                    forwarded_to_production = 1
+                    estimated_delivery = "Awaiting production schedule"
+
+        rows.append((user_id, role, message, order['tag'], order['tag_version'], status, submitted_time,
+                     estimated_delivery, forwarded_to_production, product_id, quantity))
+        result = {
+            'index': order['index'],
+            'result': 'created',
+            'auto_tag': order['tag'],
+            'status': status,
+            'estimated_delivery': estimated_delivery,
+            'forwarded_to_production': forwarded_to_production,
+            'product_id': product_id,
+            'quantity': quantity,
+        }
+        if warning:
+            result['warning'] = warning
+        results[order['index']] = result
+
+    if not rows:
+        return results, created_items
+
+    conn.executemany('UPDATE inventory SET quantity = ?, status = ? WHERE id = ?',
+                     [(item['quantity'], item['status'], item_id) for item_id, item in touched.items()])
+
+    created = [result for result in results if result['result'] == 'created']
+    for row, result in zip(rows, created):
+        result['id'] = conn.execute('''
+            INSERT INTO requests (user_id, role, message, auto_tag, auto_tag_version, status, submitted_time,
+                                  estimated_delivery, forwarded_to_production, product_id, quantity)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', row).lastrowid
+
+    conn.executemany('INSERT INTO status_logs (request_id, status, timestamp) VALUES (?, ?, ?)',
+                     [(result['id'], result['status'], submitted_time) for result in created])
+
+    # Keep the report aggregates in step with the new requests
+    tag_counts = {}
+    for result in created:
+        tag_counts[result['auto_tag']] = tag_counts.get(result['auto_tag'], 0) + 1
+    for tag, count in tag_counts.items():
+        report_store.record_submission(conn, tag, count)
+
+    return results, created_items
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Server-side full-text search over requests.
+
+requests_fts is a contentless FTS5 index of each request's message,
+solution and vendor_name, kept in sync by triggers on requests, so every
+write path (the app, batch submission, retagging, jobs, archival) updates
+it inside its own transaction. Next to the text it indexes a scope column
+of tokens saying who may see the row: 'u<user id>' for its owner and the
+name of the role queue it currently sits in. A search ANDs the caller's
+scope into the MATCH expression, so visibility is resolved inside the
+index instead of by joining every match back to requests.
+
+Ranking is bm25 over the newest SEARCH_CANDIDATES visible matches, so the
+scoring work per search is bounded however many requests match. Typical
+queries take a few milliseconds over a million requests; a word found in a
+large share of all requests ("product") costs tens, since bm25 reads its
+whole doclist to weigh it. Pages are keyset cursors over (score, id)
+within the fixed rowid window of the first page.
+
+Run this file to rebuild the index from the requests table:
+
+    python search.py
+"""
+
+import argparse
+import base64
+import binascii
+import json
+import re
+import sys
+
+from db import create_pool
+from inventory import begin_immediate
+from pagination import PaginationError
+from queues import PAGE_SIZE, QUEUE_ROLES, queue_where
+
+# Matches ranked per search, newest first
+SEARCH_CANDIDATES = 500
+
+# bm25 weights of message, solution, vendor_name and scope
+COLUMN_WEIGHTS = (1.0, 1.0, 1.0, 0.0)
+
+# Scope token of each role's pending queue
+QUEUE_TOKENS = {
+    'Warehouse Officer': 'warehouse',
+    'Production Planner': 'production',
+}
+
+TEXT_COLUMNS = ('message', 'solution', 'vendor_name')
+
+# Shortest word searched as a prefix (matches the index's prefix='2 3')
+MIN_PREFIX = 2
+
+_TERM = re.compile(r'\w+')
+
+
+def _scope(row):
+    """SQL expression for a request row's scope tokens ('NEW', 'OLD', ...)"""
+    expr = f"'u' || {row}.user_id"
+    for role in QUEUE_ROLES:
+        expr += f" || CASE WHEN {queue_where(role, row + '.')} THEN ' {QUEUE_TOKENS[role]}' ELSE '' END"
+    return expr
+
+
+def _values(row):
+    return ', '.join([f'{row}.id'] + [f'{row}.{column}' for column in TEXT_COLUMNS] + [_scope(row)])
+
+
+def create_tables(conn):
+    """Create the search index and its triggers, and index the existing requests"""
+    columns = ', '.join(TEXT_COLUMNS)
+    conn.execute(f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS requests_fts USING fts5(
+        {columns}, scope, content='', tokenize='porter unicode61', prefix='2 3'
+    )
+    ''')
+    create_triggers(conn)
+    rebuild(conn)
+
+
+def create_triggers(conn):
+    """(Re)create the triggers keeping the index in sync, e.g. after the queue predicates change"""
+    columns = ', '.join(TEXT_COLUMNS)
+    insert = f"INSERT INTO requests_fts (rowid, {columns}, scope) VALUES ({_values('NEW')});"
+    # A contentless index forgets a row given the exact values it was indexed with
+    delete = (f"INSERT INTO requests_fts (requests_fts, rowid, {columns}, scope) "
+              f"VALUES ('delete', {_values('OLD')});")
+    changed = ' OR '.join([f'OLD.{column} IS NOT NEW.{column}' for column in ('id',) + TEXT_COLUMNS] +
+                          [f"({_scope('OLD')}) IS NOT ({_scope('NEW')})"])
+
+    for trigger, event, condition, body in (
+            ('requests_fts_insert', 'INSERT', '', insert),
+            ('requests_fts_update', 'UPDATE', f'WHEN {changed}', delete + ' ' + insert),
+            ('requests_fts_delete', 'DELETE', '', delete)):
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        conn.execute(f'''
+        CREATE TRIGGER {trigger}
+        AFTER {event} ON requests
+        {condition}
+        BEGIN
+            {body}
+        END
+        ''')
+
+
+def rebuild(conn):
+    """Re-index every request from scratch (caller commits)"""
+    columns = ', '.join(TEXT_COLUMNS)
+    conn.execute("INSERT INTO requests_fts (requests_fts) VALUES ('delete-all')")
+    conn.execute(f"INSERT INTO requests_fts (rowid, {columns}, scope) SELECT {_values('r')} FROM requests r")
+
+
+def scope_tokens(role, user_id):
+    """Scope tokens of the rows a user may see: their own and their role's queue"""
+    tokens = [f'u{int(user_id)}']
+    if role in QUEUE_TOKENS:
+        tokens.append(QUEUE_TOKENS[role])
+    return tokens
+
+
+def match_expression(text, scope):
+    """FTS5 query for the words in text within the given scope, or None without words
+
+    Every word is quoted, so user input cannot inject query syntax, and the
+    last one is a prefix unless the text ends in a space (search as you
+    type). Single letters are not expanded: prefixes shorter than
+    MIN_PREFIX have no index.
+    """
+    terms = _TERM.findall(text or '')
+    if not terms:
+        return None
+    phrases = [f'"{term}"' for term in terms]
+    if not text[-1].isspace() and len(terms[-1]) >= MIN_PREFIX:
+        phrases[-1] += '*'
+    return (f"{{scope}} : ({' OR '.join(scope)}) AND "
+            f"{{{' '.join(TEXT_COLUMNS)}}} : ({' '.join(phrases)})")
+
+
+def _encode_cursor(low, high, score, row_id):
+    """Opaque cursor: the candidate rowid window and the last row's (score, id)"""
+    raw = json.dumps([low, high, score, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        low, high, score, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return int(low), int(high), float(score), int(row_id)
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise PaginationError(f"Invalid cursor: {cursor}")
+
+
+def search(conn, role, user_id, text, cursor=None, limit=PAGE_SIZE):
+    """One page of the requests matching text that the user may see, best first, and the next cursor"""
+    match = match_expression(text, scope_tokens(role, user_id))
+    if match is None:
+        return [], None
+
+    if cursor:
+        low, high, score, last_id = _decode_cursor(cursor)
+        seek, seek_params = 'WHERE (m.score, m.rowid) > (?, ?)', [score, last_id]
+    else:
+        # Rank the newest matches only, so scoring stays bounded for common words
+        window = conn.execute(
+            'SELECT MIN(rowid), MAX(rowid) FROM ('
+            'SELECT rowid FROM requests_fts WHERE requests_fts MATCH ? ORDER BY rowid DESC LIMIT ?)',
+            (match, SEARCH_CANDIDATES)
+        ).fetchone()
+        if window[0] is None:
+            return [], None
+        low, high = window
+        seek, seek_params = '', []
+
+    weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+    rows = conn.execute(f'''
+        SELECT r.*, u.username, m.score
+        FROM (
+            SELECT rowid, bm25(requests_fts, {weights}) AS score
+            FROM requests_fts
+            WHERE requests_fts MATCH ? AND rowid BETWEEN ? AND ?
+        ) m
+        JOIN requests r ON r.id = m.rowid
+        JOIN users u ON u.id = r.user_id
+        {seek}
+        ORDER BY m.score, m.rowid
+        LIMIT ?
+    ''', [match, low, high] + seek_params + [limit + 1]).fetchall()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, _encode_cursor(low, high, rows[-1]['score'], rows[-1]['id'])
+    return rows, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the request search index')
+    parser.parse_args(argv)
+
+    # migrations imports this module, so import it only when run as a script
+    from migrations import migrate
+
+    conn = create_pool().connect()
+    migrate(conn)
+    begin_immediate(conn)
+    rebuild(conn)
+    count = conn.execute('SELECT COUNT(*) FROM requests').fetchone()[0]
+    conn.commit()
+    conn.close()
+    print(f"Search index rebuilt for {count} requests.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
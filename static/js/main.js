@@ -11,8 +11,11 @@ document.addEventListener('DOMContentLoaded', function() {
     // Handle product selection in submit request form
     setupProductSelection();
     
-    // Setup tab navigation
-    setupTabs();
+    // Setup "Load more" pagination for dashboard tables
+    setupLoadMore();
+    
+    // Keep the pending queue up to date without reloading
+    setupLiveQueue();
     
     // Setup search functionality
     setupSearch();
@@ -59,62 +62,218 @@ function setupProductSelection() {
 }
 
 /**
- * Setup tab navigation
+ * Setup "Load more" pagination
+ *
+ * Tab filters are links handled by the server. "Load more" links fetch the
+ * next page of rows as an HTML fragment and append them to their table; the
+ * X-Next-Page response header carries the link for the page after that.
+ * Without JavaScript the links simply open the next page.
  */
-function setupTabs() {
-    const tabs = document.querySelectorAll('.tab');
-    const requestsTable = document.getElementById('requestsTable');
-    
-    if (tabs.length > 0 && requestsTable) {
-        tabs.forEach(tab => {
-            tab.addEventListener('click', function() {
-                // Remove active class from all tabs
-                tabs.forEach(t => t.classList.remove('active'));
-                // Add active class to clicked tab
-                this.classList.add('active');
-                
-                const filter = this.getAttribute('data-filter');
-                const rows = requestsTable.querySelectorAll('tbody tr');
-                
-                rows.forEach(row => {
-                    if (filter === 'all') {
-                        row.style.display = '';
+function setupLoadMore() {
+    const links = document.querySelectorAll('.load-more-link');
+    
+    links.forEach(link => {
+        link.addEventListener('click', function(event) {
+            const table = document.getElementById(this.getAttribute('data-target'));
+            if (!table || !window.fetch) {
+                return;
+            }
+            event.preventDefault();
+            
+            const url = new URL(this.href, window.location.href);
+            url.searchParams.set('fragment', this.getAttribute('data-fragment'));
+            link.classList.add('loading');
+            
+            fetch(url, { credentials: 'same-origin' })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('Failed to load more rows');
+                    }
+                    const nextPage = response.headers.get('X-Next-Page');
+                    return response.text().then(html => ({ html, nextPage }));
+                })
+                .then(({ html, nextPage }) => {
+                    table.querySelector('tbody').insertAdjacentHTML('beforeend', html);
+                    if (nextPage) {
+                        link.href = nextPage;
+                        link.classList.remove('loading');
                     } else {
-                        const status = row.getAttribute('data-status');
-                        if (status && status.includes(filter)) {
-                            row.style.display = '';
-                        } else {
-                            row.style.display = 'none';
-                        }
+                        link.parentElement.remove();
                     }
+                })
+                .catch(() => {
+                    // Fall back to a full page load
+                    window.location.href = link.href;
                 });
-            });
         });
+    });
+}
+
+/**
+ * Setup the live pending-queue feed
+ *
+ * Changed requests arrive from the /live endpoint: rows still in the queue
+ * are replaced in place (or appended once every page is loaded) and rows
+ * that left the queue are removed. An event stream is used when the server
+ * grants one; otherwise the same URL is polled for JSON.
+ */
+const LIVE_POLL_INTERVAL = 15000;
+
+function setupLiveQueue() {
+    const feed = document.getElementById('liveQueue');
+    if (!feed || !window.fetch) {
+        return;
+    }
+    
+    const targetId = feed.getAttribute('data-target');
+    let cursor = feed.getAttribute('data-cursor');
+    
+    function liveUrl() {
+        const url = new URL(feed.getAttribute('data-live-url'), window.location.href);
+        url.searchParams.set('after', cursor);
+        return url;
     }
+    
+    function applyChange(change) {
+        const table = document.getElementById(targetId);
+        if (!table) {
+            // The queue was empty when the page was rendered, so there is no table to patch
+            if (change.action === 'upsert') {
+                window.location.reload();
+            }
+            return;
+        }
+        
+        const tbody = table.querySelector('tbody');
+        const existing = tbody.querySelector(`tr[data-request-id="${change.request_id}"]`);
+        if (change.action === 'remove') {
+            if (existing) {
+                existing.remove();
+            }
+            return;
+        }
+        
+        const holder = document.createElement('tbody');
+        holder.innerHTML = change.html.trim();
+        const row = holder.querySelector('tr');
+        if (!row) {
+            return;
+        }
+        row.classList.add('live-updated');
+        if (existing) {
+            existing.replaceWith(row);
+        } else if (!document.querySelector(`.load-more-link[data-target="${targetId}"]`)) {
+            // New requests belong at the end of the queue, which is only on screen once fully loaded
+            tbody.appendChild(row);
+        }
+    }
+    
+    function poll() {
+        fetch(liveUrl(), { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Live queue poll failed');
+                }
+                return response.json();
+            })
+            .then(data => {
+                data.events.forEach(applyChange);
+                cursor = data.cursor;
+            })
+            .catch(() => {})
+            .then(() => setTimeout(poll, LIVE_POLL_INTERVAL));
+    }
+    
+    // Without EventSource, or behind a worker that cannot hold a stream open, poll instead
+    if (!window.EventSource || feed.getAttribute('data-streams') !== 'on') {
+        setTimeout(poll, LIVE_POLL_INTERVAL);
+        return;
+    }
+    
+    const source = new EventSource(liveUrl(), { withCredentials: true });
+    source.addEventListener('change', event => {
+        applyChange(JSON.parse(event.data));
+        cursor = event.lastEventId;
+    });
+    source.addEventListener('error', () => {
+        // Ended streams reconnect by themselves; a refused one (no free slot) is closed
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(poll, LIVE_POLL_INTERVAL);
+        }
+    });
 }
 
 /**
- * Setup search functionality
+ * Setup request search
+ *
+ * The dashboard search box queries the server-side index as the user types
+ * and shows ranked matches from all requests they can see, not just the
+ * rows on screen. Results are table rows from the /search endpoint, with
+ * the link to the next page in the X-Next-Page header.
  */
+const SEARCH_DELAY = 250;
+
 function setupSearch() {
     const searchInput = document.getElementById('searchInput');
-    const requestsTable = document.getElementById('requestsTable');
+    const results = document.getElementById('searchResults');
     
-    if (searchInput && requestsTable) {
-        searchInput.addEventListener('keyup', function() {
-            const searchTerm = searchInput.value.toLowerCase();
-            const rows = requestsTable.querySelectorAll('tbody tr');
-            
-            rows.forEach(row => {
-                const text = row.textContent.toLowerCase();
-                if (text.includes(searchTerm)) {
-                    row.style.display = '';
+    if (!searchInput || !results || !window.fetch) {
+        return;
+    }
+    
+    const tbody = results.querySelector('tbody');
+    const loadMore = results.querySelector('.load-more');
+    const loadMoreLink = loadMore.querySelector('a');
+    let timer = null;
+    let generation = 0;
+    
+    function load(url, append) {
+        const current = ++generation;
+        url.searchParams.set('fragment', '1');
+        fetch(url, { credentials: 'same-origin' })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Search failed');
+                }
+                const nextPage = response.headers.get('X-Next-Page');
+                return response.text().then(html => ({ html, nextPage }));
+            })
+            .then(({ html, nextPage }) => {
+                // Answers to superseded queries are dropped
+                if (current !== generation) {
+                    return;
+                }
+                if (append) {
+                    tbody.insertAdjacentHTML('beforeend', html);
                 } else {
-                    row.style.display = 'none';
+                    tbody.innerHTML = html.trim() || '<tr><td colspan="6">No matching requests</td></tr>';
                 }
-            });
-        });
+                loadMore.style.display = nextPage ? '' : 'none';
+                loadMoreLink.href = nextPage || '#';
+                results.style.display = '';
+            })
+            .catch(() => {});
     }
+    
+    searchInput.addEventListener('input', function() {
+        clearTimeout(timer);
+        const query = searchInput.value;
+        if (!query.trim()) {
+            generation++;
+            results.style.display = 'none';
+            return;
+        }
+        timer = setTimeout(() => {
+            const url = new URL(searchInput.getAttribute('data-search-url'), window.location.href);
+            url.searchParams.set('q', query);
+            load(url, false);
+        }, SEARCH_DELAY);
+    });
+    
+    loadMoreLink.addEventListener('click', function(event) {
+        event.preventDefault();
+        load(new URL(this.href, window.location.href), true);
+    });
 }
 
 /**
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Data-driven request auto-tagging.
+
+Tagging rules live in the tag_rules table as (role, priority, keyword, tag)
+rows. A rule with a NULL keyword is the role's fallback tag, and the '*' role
+holds the rules for any role without rules of its own. The first rule (by
+priority) whose keyword occurs in the lower-cased message wins, exactly like
+the original chain of `'keyword' in message` checks.
+
+Each role's keywords are compiled into one regex that reports, at every
+position of the message, the highest-priority keyword starting there, so a
+message is scanned once however many keywords the role has. Writes to
+tag_rules bump tag_rules_version through triggers, which is how every worker
+notices that it has to recompile.
+
+Requests record the rules version that tagged them in
+requests.auto_tag_version; the column stays NULL for tags the submitter
+chose. Run this file to rewrite the engine's own tags after the rules
+change:
+
+    python tagging.py --dry-run       # count the tags that would change
+    python tagging.py                 # retag them, one chunk per transaction
+"""
+
+import argparse
+import re
+import sys
+
+import report_store
+from db import create_pool
+from inventory import begin_immediate
+
+ANY_ROLE = '*'
+DEFAULT_TAG = 'General Request'
+
+# Requests read and rewritten per transaction by the bulk retag
+RETAG_CHUNK_SIZE = 1000
+
+# The rules of the original auto_tag_request(), as (role, priority, keyword, tag)
+DEFAULT_RULES = [
+    ('Sales Executive', 1, 'urgent', 'Urgent Delivery'),
+    ('Sales Executive', 1, 'immediate', 'Urgent Delivery'),
+    ('Sales Executive', 2, 'stock', 'Stock Check'),
+    ('Sales Executive', 2, 'inventory', 'Stock Check'),
+    ('Sales Executive', 2, 'available', 'Stock Check'),
+    ('Sales Executive', 3, None, 'Sales Request'),
+    ('Warehouse Officer', 1, 'confirm', 'Stock Confirmation'),
+    ('Warehouse Officer', 1, 'availability', 'Stock Confirmation'),
+    ('Warehouse Officer', 2, 'ship', 'Shipment'),
+    ('Warehouse Officer', 2, 'deliver', 'Shipment'),
+    ('Warehouse Officer', 3, None, 'Warehouse Request'),
+    ('Production Planner', 1, 'delay', 'Delay Report'),
+    ('Production Planner', 2, 'schedule', 'Production Schedule'),
+    ('Production Planner', 3, None, 'Production Request'),
+    ('Support Agent', 1, 'complaint', 'Customer Complaint'),
+    ('Support Agent', 2, 'service', 'Service Request'),
+    ('Support Agent', 3, None, 'Support Request'),
+    (ANY_ROLE, 1, None, DEFAULT_TAG),
+]
+
+
+def create_tables(conn):
+    """Create the rules table and its change counter"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS tag_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        role TEXT NOT NULL,
+        priority INTEGER NOT NULL,
+        keyword TEXT,
+        tag TEXT NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS tag_rules_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO tag_rules_version (id, version) VALUES (1, 0)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS tag_rules_{event.lower()}_version
+        AFTER {event} ON tag_rules
+        BEGIN
+            UPDATE tag_rules_version SET version = version + 1 WHERE id = 1;
+        END
+        ''')
+
+
+def seed_rules(conn):
+    """Insert the default rules into an empty rules table"""
+    if conn.execute('SELECT 1 FROM tag_rules LIMIT 1').fetchone():
+        return
+    conn.executemany('INSERT INTO tag_rules (role, priority, keyword, tag) VALUES (?, ?, ?, ?)',
+                     DEFAULT_RULES)
+
+
+def rules_version(conn):
+    """Get the change counter of the rules table"""
+    row = conn.execute('SELECT version FROM tag_rules_version WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+class _RoleRules:
+    """One role's keywords compiled into a single pattern"""
+
+    def __init__(self, rules):
+        # rules: (priority, id, keyword, tag) sorted by priority, then id
+        self.fallback = None
+        keywords = []
+        self.tags = {}
+        for rank, (priority, _, keyword, tag) in enumerate(rules):
+            if keyword is None:
+                if self.fallback is None:
+                    self.fallback = (rank, tag)
+                continue
+            keyword = keyword.lower()
+            if keyword not in self.tags:
+                self.tags[keyword] = (rank, tag)
+                keywords.append(keyword)
+
+        # At each position the alternation takes the first (best ranked)
+        # keyword starting there; the lookahead lets matches overlap
+        self.pattern = None
+        if keywords:
+            self.pattern = re.compile('(?=(' + '|'.join(re.escape(k) for k in keywords) + '))')
+
+    def tag(self, message):
+        best = self.fallback
+        if self.pattern is not None:
+            for match in self.pattern.finditer(message):
+                found = self.tags[match.group(1)]
+                if best is None or found[0] < best[0]:
+                    best = found
+                    if best[0] == 0:
+                        break
+        return best[1] if best else None
+
+
+class TagEngine:
+    """Compiled auto-tagging rules, reloaded when tag_rules changes"""
+
+    def __init__(self):
+        # (role -> _RoleRules, rules for any other role), swapped as one tuple
+        self._snapshot = ({}, None)
+        self.version = None
+
+    def load(self, rows, version=None):
+        """Compile (id, role, priority, keyword, tag) rule rows"""
+        by_role = {}
+        for rule_id, role, priority, keyword, tag in rows:
+            by_role.setdefault(role, []).append((priority, rule_id, keyword, tag))
+        roles = {role: _RoleRules(sorted(rules)) for role, rules in by_role.items()}
+        default = roles.pop(ANY_ROLE, None)
+        self._snapshot = (roles, default)
+        self.version = version
+
+    def refresh(self, conn):
+        """Recompile if the rules table changed since the last load"""
+        version = rules_version(conn)
+        if version != self.version:
+            rows = conn.execute('SELECT id, role, priority, keyword, tag FROM tag_rules').fetchall()
+            self.load(rows, version)
+
+    def tag(self, message, role):
+        """Tag one message for a role"""
+        return self.tag_many([message], role)[0]
+
+    def tag_many(self, messages, role):
+        """Tag a batch of messages from one role"""
+        roles, default = self._snapshot
+        chain = [rules for rules in (roles.get(role), default) if rules is not None]
+        tags = []
+        for message in messages:
+            lowered = message.lower()
+            tag = None
+            for rules in chain:
+                tag = rules.tag(lowered)
+                if tag:
+                    break
+            tags.append(tag or DEFAULT_TAG)
+        return tags
+
+
+def retag(conn, engine, role=None, chunk_size=RETAG_CHUNK_SIZE, dry_run=False):
+    """Stream auto-tagged requests in id order and rewrite auto_tag where the rules now disagree
+
+    Only requests tagged by an older rules version are read; each is stamped
+    with the current version, so a second run finds nothing to do. Each
+    chunk is its own write transaction, so the app keeps serving writes
+    while a large history is retagged. Returns (scanned, changed).
+    """
+    conditions = ['id > ?', 'auto_tag_version IS NOT NULL', 'auto_tag_version != ?']
+    if role:
+        conditions.append('role = ?')
+
+    scanned = changed = 0
+    last_id = 0
+    while True:
+        if dry_run:
+            conn.execute('BEGIN')
+        else:
+            begin_immediate(conn)
+        engine.refresh(conn)
+        params = [last_id, engine.version] + ([role] if role else []) + [chunk_size]
+        rows = conn.execute(f'''
+            SELECT id, role, message, auto_tag,
+                   (JULIANDAY(fulfilled_time) - JULIANDAY(submitted_time)) * 24
+            FROM requests
+            WHERE {' AND '.join(conditions)}
+            ORDER BY id LIMIT ?
+        ''', params).fetchall()
+        if not rows:
+            conn.rollback()
+            break
+
+        updates = []
+        moves = []
+        for request_id, request_role, message, old_tag, hours in rows:
+            new_tag = engine.tag(message, request_role)
+            updates.append((new_tag, engine.version, request_id))
+            if new_tag != old_tag:
+                moves.append((old_tag, new_tag, hours))
+
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.executemany('UPDATE requests SET auto_tag = ?, auto_tag_version = ? WHERE id = ?', updates)
+            report_store.record_retags(conn, moves)
+            conn.commit()
+
+        scanned += len(rows)
+        changed += len(moves)
+        last_id = rows[-1][0]
+
+    return scanned, changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rewrite request tags from the tag_rules table')
+    parser.add_argument('--dry-run', action='store_true', help='only count the tags that would change')
+    parser.add_argument('--role', help='only retag requests from this role')
+    parser.add_argument('--chunk-size', type=int, default=RETAG_CHUNK_SIZE,
+                        help='requests per transaction (default %(default)s)')
+    args = parser.parse_args(argv)
+
+    # migrations imports this module, so import it only when run as a script
+    from migrations import migrate
+
+    conn = create_pool().connect()
+    migrate(conn)
+    scanned, changed = retag(conn, TagEngine(), args.role, args.chunk_size, args.dry_run)
+    conn.close()
+    verb = 'would change' if args.dry_run else 'changed'
+    print(f"Scanned {scanned} requests, {verb} {changed} tags.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
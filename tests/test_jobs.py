@@ -0,0 +1,85 @@
+import datetime
+import sqlite3
+
+import jobs
+import production_runs
+from inventory import begin_immediate
+from migrations import migrate
+
+
+@jobs.handler('test_failing')
+def _failing(conn, payload):
+    conn.execute("UPDATE inventory SET quantity = quantity + 1 WHERE item_name = 'Product A'")
+    raise RuntimeError('handler failed')
+
+
+def _database():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    return conn
+
+
+def _stock(conn):
+    return conn.execute("SELECT quantity FROM inventory WHERE item_name = 'Product A'").fetchone()[0]
+
+
+def _job(conn):
+    return conn.execute('SELECT status, attempts, run_after, last_error FROM jobs').fetchone()
+
+
+def test_failed_job_is_rolled_back_and_retried_later():
+    conn = _database()
+    stock = _stock(conn)
+    jobs.enqueue(conn, 'test_failing', {})
+    conn.commit()
+
+    assert jobs.run_next(conn) is not None
+    status, attempts, run_after, last_error = _job(conn)
+    assert _stock(conn) == stock
+    assert (status, attempts) == ('pending', 1)
+    assert datetime.datetime.fromisoformat(run_after) > datetime.datetime.now()
+    assert 'handler failed' in last_error
+    # Backing off, so not due yet
+    assert jobs.run_next(conn) is None
+
+
+def test_job_is_parked_after_max_attempts():
+    conn = _database()
+    jobs.enqueue(conn, 'test_failing', {})
+    conn.execute('UPDATE jobs SET attempts = ?', (jobs.MAX_ATTEMPTS - 1,))
+    conn.commit()
+
+    jobs.run_next(conn)
+    status, attempts, _, _ = _job(conn)
+    assert (status, attempts) == ('failed', jobs.MAX_ATTEMPTS)
+    assert jobs.run_next(conn) is None
+
+
+def test_jobs_are_queued_in_the_callers_transaction():
+    conn = _database()
+    product_id = conn.execute("SELECT id FROM inventory WHERE item_name = 'Product A'").fetchone()[0]
+    request_id = conn.execute('''
+        INSERT INTO requests (user_id, role, message, auto_tag, status, submitted_time,
+                              forwarded_to_production, product_id, quantity)
+        VALUES (1, 'Sales Executive', 'need more', 'Sales Request', 'Forwarded to Production', ?, 1, ?, 4)
+    ''', (datetime.datetime.now(), product_id)).lastrowid
+    conn.commit()
+    stock = _stock(conn)
+
+    # Rolled back: neither the status change nor its jobs remain
+    begin_immediate(conn)
+    production_runs.complete_run(conn, product_id, request_id)
+    conn.rollback()
+    assert conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0] == 0
+    assert conn.execute('SELECT status FROM requests WHERE id = ?', (request_id,)).fetchone()[0] == \
+        'Forwarded to Production'
+
+    # Committed: the restock happens only when the queued job runs
+    begin_immediate(conn)
+    production_runs.complete_run(conn, product_id, request_id)
+    conn.commit()
+    assert [row[0] for row in conn.execute('SELECT kind FROM jobs ORDER BY id')] == \
+        ['restock', 'notify_stock_update']
+    assert _stock(conn) == stock
+    assert jobs.run_pending(conn) == 2
+    assert _stock(conn) == stock + 4
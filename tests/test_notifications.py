@@ -0,0 +1,56 @@
+import sqlite3
+
+import jobs
+import notifications
+from migrations import migrate
+
+
+def _database():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    return conn
+
+
+def test_stock_update_notifications_are_not_requests():
+    conn = _database()
+    product_id = conn.execute("SELECT id FROM inventory WHERE item_name = 'Product A'").fetchone()[0]
+    officer = conn.execute("SELECT id FROM users WHERE role = 'Warehouse Officer'").fetchone()[0]
+
+    jobs.notify_stock_update(conn, {'product_id': product_id, 'quantity': 5, 'request_ids': [7, 8]})
+    conn.commit()
+
+    assert conn.execute('SELECT COUNT(*) FROM requests').fetchone()[0] == 0
+    rows, count = notifications.unread(conn, officer)
+    assert count == 1
+    assert rows[0][2] == 'Production complete for requests #7, #8: 5 x Product A added to inventory'
+
+
+def test_acknowledge_only_marks_the_users_own_unread_notification():
+    conn = _database()
+    officer = conn.execute("SELECT id FROM users WHERE role = 'Warehouse Officer'").fetchone()[0]
+    notifications.notify(conn, [officer], 'restocked')
+    notification_id = notifications.unread(conn, officer)[0][0][0]
+
+    assert not notifications.acknowledge(conn, notification_id, officer + 1)
+    assert notifications.acknowledge(conn, notification_id, officer)
+    assert not notifications.acknowledge(conn, notification_id, officer)
+    assert notifications.unread(conn, officer) == ([], 0)
+
+
+def test_migration_moves_notification_rows_out_of_requests():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn, target=19)
+    officer = conn.execute("SELECT id FROM users WHERE role = 'Warehouse Officer'").fetchone()[0]
+    for status in ('Notification', 'Acknowledged'):
+        conn.execute("INSERT INTO requests (user_id, role, message, auto_tag, status, submitted_time) "
+                     "VALUES (?, 'Warehouse Officer', 'restocked', 'Stock Update', ?, '2024-01-01')",
+                     (officer, status))
+    conn.execute("INSERT INTO requests (user_id, role, message, auto_tag, status, submitted_time) "
+                 "VALUES (?, 'Warehouse Officer', 'check stock', 'Stock Check', 'Submitted', '2024-01-01')",
+                 (officer,))
+    conn.commit()
+
+    migrate(conn)
+    assert [row[0] for row in conn.execute('SELECT auto_tag FROM requests')] == ['Stock Check']
+    assert notifications.unread(conn, officer)[1] == 1
+    assert conn.execute('SELECT COUNT(*) FROM notifications').fetchone()[0] == 2
@@ -0,0 +1,43 @@
+import sqlite3
+
+from product_matcher import ProductMatcher
+
+
+def _inventory(*names):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE inventory (id INTEGER PRIMARY KEY AUTOINCREMENT, item_name TEXT UNIQUE)')
+    conn.executemany('INSERT INTO inventory (item_name) VALUES (?)', [(name,) for name in names])
+    return conn
+
+
+def test_refresh_picks_up_items_inserted_below_a_local_add():
+    conn = _inventory('Steel Bolt')
+    matcher = ProductMatcher()
+    matcher.refresh(conn)
+
+    # Another worker commits id 2, then this worker inserts and adds id 3 before refreshing
+    conn.execute("INSERT INTO inventory (item_name) VALUES ('Copper Pipe')")
+    cursor = conn.execute("INSERT INTO inventory (item_name) VALUES ('Oak Panel')")
+    matcher.add(cursor.lastrowid, 'Oak Panel')
+
+    matcher.refresh(conn)
+    assert matcher.match('need copper please') == (2, 'Copper Pipe')
+    assert matcher.match('oak') == (3, 'Oak Panel')
+
+
+def test_refresh_does_not_duplicate_locally_added_items():
+    conn = _inventory('Steel Bolt')
+    matcher = ProductMatcher()
+    matcher.refresh(conn)
+
+    cursor = conn.execute("INSERT INTO inventory (item_name) VALUES ('Oak Panel')")
+    matcher.add(cursor.lastrowid, 'Oak Panel')
+    matcher.refresh(conn)
+    assert [item_id for item_id, _ in matcher._snapshot[3]] == [1, 2]
+
+
+def test_wildcards_match_nothing_in_an_empty_inventory():
+    matcher = ProductMatcher()
+    matcher.refresh(_inventory())
+    assert matcher.match_word('%') is None
+    assert matcher.match_word('100%') is None
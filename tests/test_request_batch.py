@@ -0,0 +1,40 @@
+import sqlite3
+
+from migrations import migrate
+from product_matcher import ProductMatcher
+from request_batch import submit_batch
+from tagging import TagEngine
+
+
+def _database():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    return conn
+
+
+def _submit(conn, items, role='Support Agent'):
+    results, _ = submit_batch(conn, 1, role, items, ProductMatcher(), TagEngine())
+    conn.commit()
+    return results
+
+
+def test_results_carry_the_ids_of_their_requests():
+    conn = _database()
+    results = _submit(conn, [{'message': 'first'}, {'message': ''}, {'message': 'third'}])
+
+    assert [result['result'] for result in results] == ['created', 'error', 'created']
+    assert conn.execute('SELECT message FROM requests WHERE id = ?', (results[0]['id'],)).fetchone()[0] == 'first'
+    assert conn.execute('SELECT message FROM requests WHERE id = ?', (results[2]['id'],)).fetchone()[0] == 'third'
+    assert conn.execute('SELECT COUNT(*) FROM status_logs').fetchone()[0] == 2
+
+
+def test_non_string_fields_are_rejected_per_item():
+    conn = _database()
+    results = _submit(conn, [{'message': 'tagged', 'tag': ['Urgent']},
+                             {'message': 'ordered', 'product': 42},
+                             {'message': 'fine', 'tag': 'Service Request'}], role='Sales Executive')
+
+    assert results[0] == {'index': 0, 'result': 'error', 'error': 'tag must be a string'}
+    assert results[1] == {'index': 1, 'result': 'error', 'error': 'product must be a string'}
+    assert results[2]['result'] == 'created'
+    assert conn.execute('SELECT COUNT(*) FROM requests').fetchone()[0] == 1
@@ -0,0 +1,45 @@
+import sqlite3
+
+from migrations import migrate
+from product_matcher import ProductMatcher
+from request_batch import submit_batch
+from tagging import TagEngine, retag
+
+
+def _database():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    return conn
+
+
+def _submit(conn, items):
+    engine = TagEngine()
+    submit_batch(conn, 1, 'Support Agent', items, ProductMatcher(), engine)
+    conn.commit()
+
+
+def _tags(conn):
+    return dict(conn.execute('SELECT message, auto_tag FROM requests ORDER BY id'))
+
+
+def test_retag_leaves_chosen_tags_alone():
+    conn = _database()
+    _submit(conn, [{'message': 'complaint about a service visit', 'tag': 'Service Request'},
+                   {'message': 'complaint about a late order'}])
+    conn.execute("UPDATE tag_rules SET tag = 'Escalation' WHERE keyword = 'complaint'")
+    conn.commit()
+
+    assert retag(conn, TagEngine()) == (1, 1)
+    assert _tags(conn) == {'complaint about a service visit': 'Service Request',
+                           'complaint about a late order': 'Escalation'}
+
+
+def test_retag_skips_requests_tagged_by_the_current_rules():
+    conn = _database()
+    _submit(conn, [{'message': 'complaint about a late order'}])
+    assert retag(conn, TagEngine(), dry_run=True) == (0, 0)
+
+    conn.execute("UPDATE tag_rules SET tag = 'Escalation' WHERE keyword = 'complaint'")
+    conn.commit()
+    assert retag(conn, TagEngine()) == (1, 1)
+    assert retag(conn, TagEngine()) == (0, 0)
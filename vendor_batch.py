@@ -0,0 +1,147 @@
+"""
+Batch resolution of support requests for the vendor portal.
+
+Vendors page through the open support queue (oldest first, keyset-paged on
+(submitted_time, id) like the dashboard queues) and send solutions for many
+tickets at once. A submission is checked as a whole against one read of
+the tickets it names and written back with executemany: one UPDATE per
+request and one status log each, under a single write lock and commit.
+Every ticket gets its own result, so one bad id does not sink the batch.
+"""
+
+import datetime
+
+import report_store
+from pagination import page, seek_clause
+from queues import PAGE_SIZE, quoted
+
+# Requests the vendor portal may resolve
+SUPPORT_TAGS = ('Customer Complaint', 'Service Request', 'Support Request')
+
+# Statuses that take a request out of the open support queue
+CLOSED_STATUSES = ('Fulfilled', 'Declined')
+
+# Largest batch accepted in one submission
+MAX_BATCH_SIZE = 500
+
+# IN (...) lists are chunked to stay under SQLite's bound-parameter limit
+LOOKUP_CHUNK_SIZE = 500
+
+
+def support_queue_where(alias='r.'):
+    """Open support queue predicate on the given row alias"""
+    return (
+        f"{alias}auto_tag IN ({quoted(SUPPORT_TAGS)}) "
+        f"AND {alias}status NOT IN ({quoted(CLOSED_STATUSES)})"
+    )
+
+
+# Spelled out literally so it lines up with idx_requests_support_queue
+SUPPORT_QUEUE_WHERE = support_queue_where()
+
+
+def fetch_open_support_requests(conn, cursor=None, limit=PAGE_SIZE):
+    """One page of the open support queue, oldest first, and the next cursor"""
+    conditions = [f'({SUPPORT_QUEUE_WHERE})']
+    params = []
+    seek, seek_params = seek_clause(cursor, descending=False, alias='r.')
+    if seek:
+        conditions.append(seek)
+        params.extend(seek_params)
+
+    rows = conn.execute(
+        'SELECT r.*, u.username FROM requests r JOIN users u ON r.user_id = u.id '
+        f"WHERE {' AND '.join(conditions)} "
+        'ORDER BY r.submitted_time ASC, r.id ASC LIMIT ?',
+        params + [limit + 1]
+    ).fetchall()
+    return page(rows, limit)
+
+
+def _load_tickets(conn, request_ids):
+    """Read the tag and status of the requests a batch names, keyed by id"""
+    tickets = {}
+    request_ids = sorted(request_ids)
+    for i in range(0, len(request_ids), LOOKUP_CHUNK_SIZE):
+        chunk = request_ids[i:i + LOOKUP_CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        for row in conn.execute(
+            f'SELECT id, auto_tag, status FROM requests WHERE id IN ({placeholders})', chunk
+        ):
+            tickets[row[0]] = {'auto_tag': row[1], 'status': row[2]}
+    return tickets
+
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def resolve_batch(conn, vendor_name, resolutions, now=None):
+    """Fulfil many support requests inside the caller's write transaction
+
+    resolutions is a list of {'id': ..., 'solution': ...}. Returns one
+    result dict per input item, 'resolved' or 'error' with the reason, and
+    the ids that were resolved.
+    """
+    timestamp = now or datetime.datetime.now()
+    results = [None] * len(resolutions)
+
+    # First pass: validate the shape of each item
+    pending = []
+    for index, item in enumerate(resolutions):
+        request_id = _parse_id(item.get('id')) if isinstance(item, dict) else None
+        solution = item.get('solution') if isinstance(item, dict) else None
+        if request_id is None:
+            results[index] = {'index': index, 'result': 'error', 'error': 'id is required'}
+        elif not isinstance(solution, str) or not solution.strip():
+            results[index] = {'index': index, 'id': request_id, 'result': 'error',
+                              'error': 'solution is required'}
+        else:
+            pending.append((index, request_id, solution))
+
+    # Second pass: check every ticket against one read of the requests it names
+    tickets = _load_tickets(conn, {request_id for _, request_id, _ in pending})
+    resolved = []
+    rows = []
+    for index, request_id, solution in pending:
+        ticket = tickets.get(request_id)
+        error = None
+        if ticket is None:
+            error = 'request not found'
+        elif ticket['auto_tag'] not in SUPPORT_TAGS:
+            error = 'not a support request'
+        elif ticket['status'] in CLOSED_STATUSES:
+            error = f"request is already {ticket['status']}"
+        if error:
+            results[index] = {'index': index, 'id': request_id, 'result': 'error', 'error': error}
+            continue
+
+        # A ticket named twice is resolved by its first occurrence
+        ticket['status'] = 'Fulfilled'
+        resolved.append(request_id)
+        rows.append((timestamp, vendor_name, solution, request_id))
+        results[index] = {'index': index, 'id': request_id, 'result': 'resolved'}
+
+    if not rows:
+        return results, resolved
+
+    # report_store reads the old fulfilled_time, so account before the UPDATE
+    report_store.record_fulfillments(conn, resolved, timestamp)
+
+    conn.executemany('''
+        UPDATE requests
+        SET status = 'Fulfilled',
+            fulfilled_time = ?,
+            vendor_name = ?,
+            solution = ?
+        WHERE id = ?
+    ''', rows)
+
+    conn.executemany('INSERT INTO status_logs (request_id, status, timestamp) VALUES (?, ?, ?)',
+                     [(request_id, 'Fulfilled by Vendor: ' + vendor_name, timestamp)
+                      for request_id in resolved])
+
+    return results, resolved